@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+'''Compare device card recognition by plain loop over cards with
+utils.load_cards.CardMatcher on corpus of sysDescr strings. Run from
+directory with dev_cards:
+    python3 benchmarks/bench_cards.py [-n NUMBER]
+'''
+import os
+import re
+import sys
+import time
+import random
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from utils.load_cards import retrive, CardMatcher
+
+DESCRIPTIONS = [
+    'Cisco Systems Catalyst 1900,V9.00.06',
+    'Cisco Internetwork Operating System Software IOS (tm) C2900XL Software '
+    '(C2900XL-C3H2S-M), Version 12.0(5)WC17, RELEASE SOFTWARE (fc1)',
+    'Cisco Internetwork Operating System Software IOS (tm) C2950 Software '
+    '(C2950-I6Q4L2-M), Version 12.1(22)EA14, RELEASE SOFTWARE (fc1)',
+    'Cisco IOS Software, C3560 Software (C3560-IPBASEK9-M), Version '
+    '12.2(55)SE12, RELEASE SOFTWARE (fc2)',
+    'SF302-08 8-Port 10/100 Managed Switch',
+    '24-port 10/100 + 4-Port Gigabit Switch with CLI and WebView',
+    'MES-3124F rev.B',
+    'Juniper Networks, Inc. ex3300-48p Ethernet Switch, kernel JUNOS 15.1R7',
+    'Linux nas 4.19.0 #1 SMP x86_64',
+    'HP ProCurve Switch 2510-24, revision Y.11.16',
+]
+
+
+def legacy_choose(cards, ip, sys_descr, bind_dict):
+    '''Card recognition as it was done before CardMatcher'''
+    for card in cards:
+        if ip in bind_dict.keys():
+            if bind_dict[ip] == card['vendor'] + ' ' + card['series']:
+                return card
+        elif re.search(card['info_pattern'], sys_descr):
+            return card
+    return None
+
+
+def measure(name, func, corpus):
+    '''Run func over corpus & print time per host'''
+    start = time.perf_counter()
+    found = [func(descr) for descr in corpus]
+    elapsed = time.perf_counter() - start
+    print('{:<20} {:>8.2f} us/host'.format(
+        name, elapsed / len(corpus) * 1e6))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Card matcher benchmark')
+    parser.add_argument('-n', '--number', type=int, default=100000,
+                        help='sysDescr strings in corpus')
+    args = parser.parse_args()
+    cards = retrive()
+    rand = random.Random(0)
+    corpus = [rand.choice(DESCRIPTIONS) for _ in range(args.number)]
+    bind_dict = {'10.0.0.{}'.format(num): 'Cisco SF' for num in range(256)}
+    combined = CardMatcher(cards, combine=True)
+    one_by_one = CardMatcher(cards)
+    results = [
+        measure('legacy loop', lambda descr: legacy_choose(
+            cards, '10.0.1.1', descr, bind_dict), corpus),
+        measure('compiled loop', lambda descr: one_by_one.choose(
+            '10.0.1.1', descr, bind_dict), corpus),
+        measure('combined regex', lambda descr: combined.choose(
+            '10.0.1.1', descr, bind_dict), corpus)]
+    assert all(result == results[0] for result in results)
+    by_oid = CardMatcher([dict(card, sys_object_id='1.3.6.1.4.1.{}'.format(
+        num)) for num, card in enumerate(cards)])
+    measure('sysObjectID', lambda descr: by_oid.choose(
+        '10.0.1.1', descr, bind_dict, '1.3.6.1.4.1.3'), corpus)
+
+
+if __name__ == '__main__':
+    main()
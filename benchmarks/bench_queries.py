@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+'''Time queries & report generation on synthetic databases of several
+sizes & show how time grows with size, to catch quadratic behavior. Run
+from directory with dev_cards:
+    python3 benchmarks/bench_queries.py [-s 1000,10000,100000] [-r REPEAT]
+        [-q QUERY ...] [--json FILE] [--history FILE]
+Databases are made by benchmarks/make_db.py once & kept in cache
+directory, every benchmark works on fresh copy. Queries of one size run
+in separate process: cold time is first call in that process, warm time is
+best of repeated calls. Allocations are measured by extra call under
+tracemalloc: peak of traced memory & memory left allocated after call.
+Peak RSS of process is taken after every query, so its growth shows which
+query needed memory
+'''
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from make_db import (make_db, sample_params, device_address, DB_TREE,
+                     DEFAULT_ZONE, DOMAIN_PREFIX, UPLINK_PATTERN)
+
+CONF = '''logs_path = {workdir}/logs
+db_name = {workdir}/bench.fs
+db_tree = {db_tree}
+uplink_pattern = {uplink_pattern}
+location_transliteration = iso9_system_B
+default_zone = {default_zone}
+domain_prefix = {domain_prefix}
+'''
+REPORTS = ['rancid', 'plain', 'dns', 'nagios', 'trac']
+# Growth of time with size above that is reported as superlinear
+EXPONENT_LIMIT = 1.5
+
+
+def queries(params, outdir):
+    '''List of benchmarked calls of utils.maintools functions
+    Args:
+        params - dictionary from make_db.sample_params
+        outdir - directory for report files
+    Return:
+        list of tuples (query name, function name, args, kwargs)
+    '''
+    subset = [device_address(num) for num in range(0, 1000, 10)]
+    return [
+        ('search_full', 'search_db', ('full', params['street']), {}),
+        ('search_regex', 'search_db', ('c_location', r'^Lenina 1\d$'),
+         {'regex': True}),
+        ('search_model', 'search_db', ('c_model', params['model']), {}),
+        ('search_vlan', 'search_db', ('c_vlans', params['vlan']), {}),
+        ('single_ip', 'show_single_device', (params['leaf_ip'],), {}),
+        ('single_name', 'show_single_device', (params['leaf_name'],), {}),
+        ('go_high', 'go_high', (params['leaf_ip'],), {}),
+        ('downstream', 'show_downstream', (params['dist_name'],), {}),
+        ('vlan_chain', 'show_vlan_chain', (params['vlan'],), {}),
+        ('vlan_gaps_all', 'show_vlan_gaps', ('all',), {}),
+        ('software_search', 'software_search',
+         (params['model'], params['version']), {}),
+        ('newest_firmware', 'find_newest_firmware', (), {}),
+        ('outdated', 'show_outdated', (), {}),
+        ('show_all', 'show_all_records', (), {}),
+        ('show_inactive', 'show_all_records', (), {'inactive': True}),
+        ('reports_all', 'generate_reports', (REPORTS,),
+         {'directory': os.path.join(outdir, 'reports')}),
+        ('reports_hosts', 'generate_reports', (['plain'],),
+         {'hosts': subset, 'output': os.path.join(outdir, 'plain.txt')}),
+        ('delta_all', 'generate_delta', (REPORTS,),
+         {'directory': os.path.join(outdir, 'delta')})]
+
+
+def call(func, args, kwargs):
+    '''Call query, generators are exhausted'''
+    result = func(*args, **kwargs)
+    if hasattr(result, '__next__'):
+        for _ in result:
+            pass
+
+
+def measure(func, args, kwargs, repeat):
+    '''Time query & measure its allocations
+    Args:
+        func - function to call
+        args, kwargs - arguments of function
+        repeat - number of warm calls
+    Return:
+        dictionary with cold & warm time in seconds, peak & retained traced
+        memory & peak RSS in MB
+    '''
+    start = time.perf_counter()
+    call(func, args, kwargs)
+    cold = time.perf_counter() - start
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call(func, args, kwargs)
+        warm.append(time.perf_counter() - start)
+    tracemalloc.start()
+    call(func, args, kwargs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'cold': cold, 'warm': min(warm) if warm else cold,
+            'peak_alloc_mb': peak / 2 ** 20,
+            'retained_kb': retained / 2 ** 10,
+            'rss_mb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def query_process(workdir, size, names, repeat, connection):
+    '''Run queries in configured directory & send back results. Settings are
+    loaded on utils.maintools import, so it's imported here
+    Args:
+        workdir - directory with wwmode.conf, dev_cards, lexicon & database
+        size - number of devices in database
+        names - names of queries to run or None for all
+        repeat - number of warm calls
+        connection - multiprocessing connection
+    No return value
+    '''
+    os.chdir(workdir)
+    logging.basicConfig(filename=os.path.join(workdir, 'queries.log'),
+                        level=logging.WARNING)
+    from utils import maintools
+    results = []
+    with open(os.devnull, 'w') as devnull:
+        for name, func_name, args, kwargs in queries(sample_params(size),
+                                                     workdir):
+            if names and name not in names:
+                continue
+            with contextlib.redirect_stdout(devnull):
+                result = measure(getattr(maintools, func_name), args, kwargs,
+                                 repeat)
+            result.update(query=name, size=size)
+            results.append(result)
+            connection.send(result)
+    connection.send(None)
+
+
+def prepare(size, seed, cache, workdir):
+    '''Make database of given size if it isn't in cache & copy it into
+    benchmark directory with config
+    Args:
+        size - number of devices
+        seed - seed of random generator
+        cache - directory with generated databases
+        workdir - benchmark directory
+    No return value
+    '''
+    cached = os.path.join(cache, 'synthetic-{}-{}.fs'.format(size, seed))
+    if not os.path.exists(cached):
+        os.makedirs(cache, exist_ok=True)
+        start = time.perf_counter()
+        make_db(cached + '.new', size, seed)
+        for suffix in ('', '.index'):
+            os.replace(cached + '.new' + suffix, cached + suffix)
+        for suffix in ('.lock', '.tmp'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(cached + '.new' + suffix)
+        print('Database of {} devices made in {:.1f} sec.'.format(
+            size, time.perf_counter() - start))
+    os.makedirs(workdir)
+    # cards & transliteration schemas are read from working directory
+    for name in ('dev_cards', 'lexicon'):
+        os.symlink(os.path.join(os.getcwd(), name),
+                   os.path.join(workdir, name))
+    for suffix in ('', '.index'):
+        shutil.copyfile(cached + suffix,
+                        os.path.join(workdir, 'bench.fs' + suffix))
+    with open(os.path.join(workdir, 'wwmode.conf'), 'w') as conf_file:
+        conf_file.write(CONF.format(
+            workdir=workdir, db_tree=DB_TREE, uplink_pattern=UPLINK_PATTERN,
+            default_zone=DEFAULT_ZONE, domain_prefix=DOMAIN_PREFIX))
+
+
+def run_size(workdir, size, names, repeat):
+    '''Run queries on database of one size in separate process & print
+    results as they come
+    Args:
+        workdir - benchmark directory
+        size - number of devices
+        names - names of queries to run or None for all
+        repeat - number of warm calls
+    Return:
+        list of results
+    '''
+    context = multiprocessing.get_context('fork')
+    parent, child = context.Pipe()
+    process = context.Process(target=query_process,
+                              args=(workdir, size, names, repeat, child))
+    process.start()
+    child.close()
+    results = []
+    while True:
+        try:
+            result = parent.recv()
+        except EOFError:
+            sys.exit('Queries failed, see {}'.format(
+                os.path.join(workdir, 'queries.log')))
+        if result is None:
+            break
+        results.append(result)
+        print('{size:>7} {query:<16} {cold:>9.4f} {warm:>9.4f} '
+              '{peak_alloc_mb:>9.2f} {retained_kb:>9.1f} '
+              '{rss_mb:>8.1f}'.format(**result))
+    process.join()
+    return results
+
+
+def scaling(results, sizes):
+    '''Print exponent of warm time growth between consecutive sizes for
+    every query: 1 is linear, 2 is quadratic
+    Args:
+        results - list of results of all sizes
+        sizes - sorted list of sizes
+    Return:
+        dictionary with query name as key & list of exponents as value
+    '''
+    times = {}
+    for result in results:
+        times.setdefault(result['query'], {})[result['size']] = result['warm']
+    exponents = {}
+    print('\nGrowth exponent of warm time, marked if above {}'.format(
+        EXPONENT_LIMIT))
+    for query, by_size in times.items():
+        found = []
+        for small, big in zip(sizes, sizes[1:]):
+            if by_size.get(small) and by_size.get(big):
+                found.append(math.log(by_size[big] / by_size[small]) /
+                             math.log(big / small))
+        exponents[query] = found
+        print('{:<16} {}'.format(query, ' '.join(
+            '{:>6.2f}{}'.format(exp, '!' if exp > EXPONENT_LIMIT else ' ')
+            for exp in found)))
+    return exponents
+
+
+def revision():
+    '''Get git revision of working tree or empty string'''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query & report benchmark on synthetic databases')
+    parser.add_argument('-s', '--sizes', default='1000,10000',
+                        help='comma separated numbers of devices')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='warm calls of every query')
+    parser.add_argument('-q', '--query', action='append',
+                        help='run only that query (can be repeated)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of database generator')
+    parser.add_argument('--cache', default=os.path.join(
+        tempfile.gettempdir(), 'wwmode-bench-db'),
+        help='directory to keep generated databases')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write results into JSON file')
+    parser.add_argument('--history', metavar='FILE',
+                        help='append results with git revision & time to '
+                        'JSON lines file to compare runs over time')
+    parser.add_argument('--keep', action='store_true',
+                        help="don't remove directory with database copies")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    workdir = tempfile.mkdtemp(prefix='wwmode-queries-')
+    results = []
+    try:
+        for size in sizes:
+            size_dir = os.path.join(workdir, str(size))
+            prepare(size, args.seed, args.cache, size_dir)
+            if size == sizes[0]:
+                print('{:>7} {:<16} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+                    'size', 'query', 'cold s', 'warm s', 'peak MB',
+                    'left KB', 'RSS MB'))
+            results.extend(run_size(size_dir, size, args.query,
+                                    args.repeat))
+            if not args.keep:
+                shutil.rmtree(size_dir)
+        exponents = scaling(results, sizes)
+    finally:
+        if args.keep or sys.exc_info()[0]:
+            print('Database copies kept in {}'.format(workdir))
+        else:
+            shutil.rmtree(workdir)
+    record = {'revision': revision(), 'time': time.strftime(
+        '%Y-%m-%d %H:%M:%S'), 'seed': args.seed, 'repeat': args.repeat,
+        'results': results, 'exponents': exponents}
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(record, json_file, indent=2)
+    if args.history:
+        with open(args.history, 'a') as history_file:
+            history_file.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+'''Run update end to end against simulated fleet of SNMP agents & measure
+throughput, per device polling time, peak memory of update & database
+growth. Agents bind UDP port 161 on 127.x addresses, so run it as root on
+Linux from directory with dev_cards:
+    python3 benchmarks/bench_update.py [-n DEVICES] [-e ENGINE] [-r RUNS]
+        [--latency MS] [--jitter MS] [--loss FRACTION] [--walks DIR]
+Every run is made by separate process on same database, so first run
+creates records & next ones update them. Polling time of device is time
+between first request & last answer seen by its agent (with --prescan it
+includes waiting between probe & polling)
+'''
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from utils.load_cards import retrive
+from utils.profiler import percentile
+from utils.zonefile import reverse_name
+from utils.snmp_fleet import (Fleet, card_walk, load_snmprec,
+                              fleet_addresses, SYS_DESCR_OID, SYS_NAME_OID,
+                              SYS_LOCATION_OID, IF_ALIAS_OID)
+from bench_cards import DESCRIPTIONS
+
+UNRECOGNIZED_DESCR = 'Linux nas 4.19.0 #1 SMP x86_64'
+CONF = '''num_threads = {threads}
+max_concurrency = {concurrency}
+num_processes = {processes}
+commit_batch = 500
+prescan = {prescan}
+dns_concurrency = 20
+dns_cache_ttl = 300
+zone_files = {zone_files}
+logs_path = {workdir}/logs
+db_name = {workdir}/fleet.fs
+db_tree = hosts
+unneded_vlans = 1,1002,1003,1004,1005
+uplink_pattern = ^\\S+@(?P<device>\\S+) up( \\D{{3}})?$
+ro_community = public
+max_repetitions = {max_repetitions}
+location_transliteration = straight
+default_zone = local
+[fleet]
+{hosts}
+Wanted:
+    vlans = vlan_list
+'''
+
+
+def fleet_templates(args):
+    '''Get walks for fleet: recorded ones from --walks directory or
+    synthetic ones for every card with known sysDescr. Walk of unrecognized
+    host goes last
+    Args:
+        args - parsed arguments
+    Return:
+        list of walks
+    '''
+    if args.walks:
+        templates = [load_snmprec(path) for path in sorted(glob.glob(
+            os.path.join(args.walks, '*.snmprec')))]
+        if not templates:
+            sys.exit('No .snmprec files in {}'.format(args.walks))
+    else:
+        templates = []
+        for num, card in enumerate(retrive()):
+            samples = [descr for descr in DESCRIPTIONS
+                       if re.search(card['info_pattern'], descr)]
+            if not samples:
+                print('No sysDescr sample for {} {}, skipped'.format(
+                    card['vendor'], card['series']))
+                continue
+            templates.append(card_walk(card, samples[0], num, args.ports,
+                                       args.vlans))
+    templates.append([(SYS_DESCR_OID, '4', UNRECOGNIZED_DESCR),
+                      (SYS_NAME_OID, '4', 'nas'),
+                      (SYS_LOCATION_OID, '4', '')])
+    return templates
+
+
+def device_name(num):
+    '''Get host name of device'''
+    return 'sw-{}'.format(num)
+
+
+def fleet_overlays(templates, args):
+    '''Choose walk for every device & make its own values: name, location &
+    uplink description pointing to parent device, so devices form tree
+    Args:
+        templates - list of walks, last one is unrecognized host
+        args - parsed arguments
+    Return:
+        list of tuples (template index, own values)
+    '''
+    rand = random.Random(args.seed)
+    overlays = []
+    for num in range(args.devices):
+        if rand.random() < args.unrecognized:
+            index = len(templates) - 1
+        else:
+            index = rand.randrange(len(templates) - 1)
+        own = {SYS_NAME_OID: ('4', device_name(num)),
+               SYS_LOCATION_OID: ('4', 'Fleet street {}'.format(num // 10))}
+        if num:
+            own['{}.{}'.format(IF_ALIAS_OID, args.ports - 1)] = (
+                '4', 'Gi0/1@{}.local up'.format(device_name(
+                    (num - 1) // args.fanout)))
+        overlays.append((index, own))
+    return overlays
+
+
+def write_zones(workdir, addresses):
+    '''Write forward & reverse zones of fleet, so DNS checks don't need
+    network
+    Args:
+        workdir - directory of benchmark
+        addresses - list of IPv4 addresses of devices
+    Return:
+        value of zone_files option
+    '''
+    soa = '@ IN SOA ns.local. noc.local. (1 3600 600 86400 300)\n'
+    forward = os.path.join(workdir, 'local.zone')
+    reverse = os.path.join(workdir, '127.in-addr.arpa.zone')
+    with open(forward, 'w') as zone_file:
+        zone_file.write('$ORIGIN local.\n$TTL 3600\n' + soa)
+        for num, address in enumerate(addresses):
+            zone_file.write('{} IN A {}\n'.format(device_name(num), address))
+    with open(reverse, 'w') as zone_file:
+        zone_file.write('$ORIGIN 127.in-addr.arpa.\n$TTL 3600\n' + soa)
+        for num, address in enumerate(addresses):
+            zone_file.write('{}. IN PTR {}.local.\n'.format(
+                reverse_name(address), device_name(num)))
+    return '{}, {}'.format(forward, reverse)
+
+
+def update_process(workdir, engine, profile, connection):
+    '''Run update in configured directory & send back its time & peak RSS.
+    Settings are loaded on utils.maintools import, so it's imported here
+    Args:
+        workdir - directory with wwmode.conf & dev_cards
+        engine - update engine
+        profile - file for profile report or None
+        connection - multiprocessing connection
+    No return value
+    '''
+    os.chdir(workdir)
+    logging.basicConfig(filename=os.path.join(workdir, 'update.log'),
+                        level=logging.WARNING)
+    from utils import maintools
+    start = time.perf_counter()
+    maintools.update_db_run(engine=engine, profile_json=profile)
+    elapsed = time.perf_counter() - start
+    connection.send((elapsed, max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)))
+
+
+def run_update(workdir, engine, profile):
+    '''Start update process & wait for it
+    Args:
+        workdir - directory with wwmode.conf & dev_cards
+        engine - update engine
+        profile - file for profile report or None
+    Return:
+        tuple (seconds, peak RSS in KB)
+    '''
+    context = multiprocessing.get_context('fork')
+    parent, child = context.Pipe()
+    process = context.Process(target=update_process,
+                              args=(workdir, engine, profile, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        sys.exit('Update failed, see {}'.format(
+            os.path.join(workdir, 'update.log')))
+    process.join()
+    return result
+
+
+def summarize_run(num, elapsed, rss, stats, db_size, grown, args):
+    '''Aggregate results of one run
+    Args:
+        num - run number
+        elapsed - update time in seconds
+        rss - peak RSS of update in KB
+        stats - agent counters from Fleet.collect
+        db_size - size of database file after run
+        grown - growth of database file on run
+        args - parsed arguments
+    Return:
+        dictionary with results
+    '''
+    spans = sorted(last - first for first, last, _, _ in stats.values())
+    return {'run': num, 'engine': args.engine, 'devices': args.devices,
+            'polled': len(stats), 'seconds': elapsed,
+            'devices_per_second': args.devices / elapsed,
+            'p50_ms': (percentile(spans, 50) or 0) * 1000,
+            'p99_ms': (percentile(spans, 99) or 0) * 1000,
+            'requests': sum(stat[2] for stat in stats.values()),
+            'dropped': sum(stat[3] for stat in stats.values()),
+            'peak_rss_mb': rss / 1024, 'db_mb': db_size / 2 ** 20,
+            'db_growth_mb': grown / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Update benchmark on simulated SNMP fleet')
+    parser.add_argument('-n', '--devices', type=int, default=200,
+                        help='number of simulated devices')
+    parser.add_argument('-e', '--engine', default='thread',
+                        choices=['thread', 'async', 'sharded'],
+                        help='update engine')
+    parser.add_argument('-r', '--runs', type=int, default=2,
+                        help='update runs on same database')
+    parser.add_argument('-t', '--threads', type=int, default=50,
+                        help='num_threads option of update')
+    parser.add_argument('--concurrency', type=int, default=1000,
+                        help='max_concurrency option of update')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='num_processes option of update')
+    parser.add_argument('--prescan', action='store_true',
+                        help='probe hosts before polling')
+    parser.add_argument('--max-repetitions', type=int, default=25,
+                        help='max_repetitions option of update')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='agent answer delay in ms')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='upper bound of random addition to delay in ms')
+    parser.add_argument('--loss', type=float, default=0,
+                        help='fraction of requests dropped by agents')
+    parser.add_argument('--agents', type=int, default=max(
+        (os.cpu_count() or 2) // 2, 1), help='number of agent processes')
+    parser.add_argument('--first', default='127.1.0.1',
+                        help='address of first device')
+    parser.add_argument('--ports', type=int, default=26,
+                        help='interfaces of synthetic devices')
+    parser.add_argument('--vlans', type=int, default=20,
+                        help='VLANs of synthetic devices')
+    parser.add_argument('--fanout', type=int, default=8,
+                        help='devices connected to one uplink device')
+    parser.add_argument('--unrecognized', type=float, default=0.05,
+                        help='fraction of hosts without device card')
+    parser.add_argument('--walks', metavar='DIR',
+                        help='directory with .snmprec walks to serve')
+    parser.add_argument('--live-dns', action='store_true',
+                        help="resolve names by system resolver, don't "
+                        "write fleet zones")
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of random generator')
+    parser.add_argument('--profile', action='store_true',
+                        help='write profile report of every run')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write results into JSON file')
+    parser.add_argument('--keep', action='store_true',
+                        help="don't remove directory with database & logs")
+    args = parser.parse_args()
+    cards_dir = os.path.join(os.getcwd(), 'dev_cards')
+    templates = fleet_templates(args)
+    addresses = fleet_addresses(args.first, args.devices)
+    workdir = tempfile.mkdtemp(prefix='wwmode-bench-')
+    os.symlink(cards_dir, os.path.join(workdir, 'dev_cards'))
+    zone_files = '' if args.live_dns else write_zones(workdir, addresses)
+    with open(os.path.join(workdir, 'wwmode.conf'), 'w') as conf_file:
+        conf_file.write(CONF.format(
+            threads=args.threads, concurrency=args.concurrency,
+            processes=args.processes,
+            prescan='yes' if args.prescan else 'no',
+            zone_files=zone_files, workdir=workdir,
+            max_repetitions=args.max_repetitions,
+            hosts='\n'.join('host = ' + address for address in addresses)))
+    db_name = os.path.join(workdir, 'fleet.fs')
+    results = []
+    print('{:>3} {:>8} {:>6} {:>8} {:>8} {:>8} {:>8} {:>8} {:>7} {:>8} '
+          '{:>8}'.format('run', 'engine', 'polled', 'seconds', 'dev/s',
+                         'p50 ms', 'p99 ms', 'requests', 'dropped',
+                         'RSS MB', '+DB MB'))
+    try:
+        with Fleet(addresses, templates, fleet_overlays(templates, args),
+                   latency=args.latency / 1000, jitter=args.jitter / 1000,
+                   loss=args.loss, processes=args.agents,
+                   seed=args.seed) as fleet:
+            for num in range(1, args.runs + 1):
+                size = os.path.getsize(db_name) if os.path.exists(
+                    db_name) else 0
+                profile = os.path.join(
+                    workdir, 'profile-{}.json'.format(num)) if (
+                        args.profile) else None
+                elapsed, rss = run_update(workdir, args.engine, profile)
+                stats = fleet.collect()
+                result = summarize_run(
+                    num, elapsed, rss, stats, os.path.getsize(db_name),
+                    os.path.getsize(db_name) - size, args)
+                results.append(result)
+                print('{run:>3} {engine:>8} {polled:>6} {seconds:>8.2f} '
+                      '{devices_per_second:>8.1f} {p50_ms:>8.1f} '
+                      '{p99_ms:>8.1f} {requests:>8} {dropped:>7} '
+                      '{peak_rss_mb:>8.1f} {db_growth_mb:>8.2f}'.format(
+                          **result))
+    finally:
+        if args.keep or args.profile or sys.exc_info()[0]:
+            print('Database, logs & profiles kept in {}'.format(workdir))
+        else:
+            shutil.rmtree(workdir)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'options': vars(args), 'runs': results}, json_file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+'''Build synthetic device database for benchmarks of queries & reports.
+Devices form three level tree: core, distribution & access switches with
+uplink descriptions pointing to upper level, VLANs of access switches are
+mostly taken from their distribution switch & several firmware versions
+run on every model. Liveness, secondary indexes & topology are built by
+same functions as on update run. Run from directory with dev_cards:
+    python3 benchmarks/make_db.py [-n DEVICES] [-s SEED] DB_FILE
+'''
+import os
+import sys
+import random
+import argparse
+import datetime
+import ipaddress
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+from ZODB import FileStorage, DB
+import transaction
+from utils.load_settings import AppSettings
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.liveness import liveness_key, record_sweep
+from utils.indexes import update_indexes
+from utils.topology import update_topology
+
+DB_TREE = 'hosts'
+DEFAULT_ZONE = 'local'
+DOMAIN_PREFIX = 'r1'
+UPLINK_PATTERN = r'^\S+@(?P<device>\S+) up( \D{3})?$'
+JUNOS_PATTERN = r'^(\d+)\.(\d+)([A-Z])(\d+)(?:-S(\d+))?(?:\.(\d+))?'
+# model, rancid type, VLAN tree by OID, version pattern, firmware versions
+CORE_MODELS = [
+    ('EX3300-48P', 'juniper', False, JUNOS_PATTERN,
+     ['12.3R12.4', '15.1R6.7', '15.1R7.9']),
+    ('WS-C3560-48PS-S', 'cisco', True, None,
+     ['12.2(44)SE6', '12.2(55)SE12'])]
+ACCESS_MODELS = [
+    ('WS-C2960-24TT-L', 'cisco', True, None,
+     ['12.2(50)SE5', '12.2(55)SE12', '15.0(2)SE11']),
+    ('WS-C2950-24', 'cisco', True, None, ['12.1(22)EA14', '12.1(22)EA9']),
+    ('MES-3124F', 'cisco-sb', False, None, ['2.5.44', '2.5.48.6', '4.0.7.1']),
+    ('SF302-08', 'cisco-sb', False, None, ['1.3.0.62', '1.4.1.3'])]
+STREETS = ['Lenina', 'Mira', 'Sovetskaya', 'Gagarina', 'Pushkina',
+           'Shkolnaya', 'Lesnaya', 'Ленина', 'Садовая, подъезд']
+VLAN_POOL = [str(vlan) for vlan in range(10, 4000, 7)]
+
+
+def device_address(num):
+    '''Get IPv4 address of device number num'''
+    return str(ipaddress.IPv4Address('10.0.0.1') + num)
+
+
+def device_name(role, num):
+    '''Get main part of domain name of device, e.g. 'a15' '''
+    return '{}{}'.format(role, num)
+
+
+def layout(size):
+    '''Split devices into levels
+    Args:
+        size - number of devices
+    Return:
+        tuple (number of core devices, number of distribution devices)
+    '''
+    cores = max(size // 1000, 2)
+    return cores, max(size // 50, 1)
+
+
+def sample_params(size):
+    '''Get arguments for queries which find something in database of given
+    size: addresses, names, model, VLAN & firmware
+    Args:
+        size - number of devices
+    Return:
+        dictionary
+    '''
+    cores, dists = layout(size)
+    return {'core_ip': device_address(0),
+            'leaf_ip': device_address(size - 1),
+            'dist_name': device_name('d', 0),
+            'leaf_name': device_name('a', size - cores - dists - 1),
+            'street': 'Lenina 1', 'model': 'C2960',
+            'version': '12.2(55)SE12', 'vlan': VLAN_POOL[3]}
+
+
+def fill_device(device, role, num, model, rand, uplink, vlans):
+    '''Set attributes of synthetic device
+    Args:
+        device - Device instance
+        role - first letter of name ('c', 'd' or 'a')
+        num - number of device inside its level
+        model - item of CORE_MODELS or ACCESS_MODELS
+        rand - random.Random instance
+        uplink - name of uplink device or None
+        vlans - list of VLANs
+    No return value
+    '''
+    name, rancid_type, vtree, pattern, firmwares = model
+    device.dname = '{}.{}.{}'.format(DOMAIN_PREFIX, device_name(role, num),
+                                     DEFAULT_ZONE)
+    device.vtree = vtree
+    device.rancid_type = rancid_type
+    if pattern:
+        device.version_pattern = pattern
+    device.c_model = name
+    device.c_firmware = rand.choice(firmwares)
+    device.c_location = '{} {}'.format(rand.choice(STREETS),
+                                       rand.randint(1, 200))
+    device.c_contact = 'noc@company.ru'
+    device.c_vlans = vlans
+    uplinks = []
+    if uplink:
+        uplinks.append(('Gi0/1@{} up'.format(uplink), '1000 Mb/s'))
+        if rand.random() < 0.02:
+            # unresolved second uplink
+            uplinks.append(('Gi0/2@x{} up'.format(num), '1000 Mb/s'))
+    device.c_uplinks = uplinks
+
+
+def make_db(db_name, size, seed=0, batch=1000):
+    '''Create database with synthetic device records, several update runs
+    recorded, indexes & topology
+    Args:
+        db_name - database file name, it must not exist
+        size - number of devices
+        seed - seed of random generator (DEFAULT - 0)
+        batch - records in one transaction (DEFAULT - 1000)
+    No return value
+    '''
+    if os.path.exists(db_name):
+        raise FileExistsError(db_name)
+    rand = random.Random(seed)
+    cores, dists = layout(size)
+    db_check(db_name, DB_TREE)
+    db = DB(FileStorage.FileStorage(db_name))
+    connection = db.open()
+    dbroot = connection.root()
+    devdb = dbroot[DB_TREE]
+    liveness = dbroot[liveness_key(DB_TREE)]
+    dist_vlans = [rand.sample(VLAN_POOL, 60) for _ in range(dists)]
+    hosts = []
+    for num in range(size):
+        ip = device_address(num)
+        device = Device(ip)
+        device.liveness = liveness
+        if num < cores:
+            fill_device(device, 'c', num, rand.choice(CORE_MODELS), rand,
+                        device_name('c', 0) if num else None,
+                        rand.sample(VLAN_POOL, 200))
+        elif num < cores + dists:
+            dist = num - cores
+            fill_device(device, 'd', dist, rand.choice(CORE_MODELS), rand,
+                        device_name('c', dist % cores), dist_vlans[dist])
+        else:
+            access = num - cores - dists
+            dist = access % dists
+            vlans = rand.sample(dist_vlans[dist], rand.randint(3, 25))
+            if rand.random() < 0.05:
+                # VLAN not configured on uplink
+                vlans.append(rand.choice(VLAN_POOL))
+            fill_device(device, 'a', access, rand.choice(ACCESS_MODELS),
+                        rand, device_name('d', dist), vlans)
+        devdb[ip] = device
+        hosts.append(ip)
+        if (num + 1) % batch == 0:
+            transaction.commit()
+            connection.cacheMinimize()
+    transaction.commit()
+    connection.close()
+    now = datetime.datetime.now()
+    for days in (2, 1, 0):
+        run_time = (now - datetime.timedelta(days=days)).strftime(
+            '%d-%m-%Y %H:%M')
+        seen = hosts if days else [
+            ip for ip in hosts if rand.random() > 0.02]
+        record_sweep(db, DB_TREE, seen, run_time)
+    update_indexes(db, DB_TREE, hosts)
+    settings = AppSettings()
+    settings.uplink_pattern = UPLINK_PATTERN
+    settings.domain_prefix = DOMAIN_PREFIX
+    settings.default_zone = DEFAULT_ZONE
+    update_topology(db, DB_TREE, settings)
+    db.close()
+    Device.new_hosts = []
+    Device.changed_hosts = set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic device DB')
+    parser.add_argument('-n', '--devices', type=int, default=10000,
+                        help='number of devices')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='seed of random generator')
+    parser.add_argument('db_name', help='database file to create')
+    args = parser.parse_args()
+    make_db(args.db_name, args.devices, args.seed)
+    print('{}: {} devices, {:.1f} MB'.format(
+        args.db_name, args.devices, os.path.getsize(args.db_name) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,20 @@ action.add_argument('-G', '--generate', dest='action', action='store_const',
                     const='generate', help='generate usefull lists from DB')
 action.add_argument('-E', '--dry-run', dest='action', action='store_const',
                     const='dry_run', help='parse config and print it')
+action.add_argument('-M', '--migrate', dest='action', action='store_const',
+                    const='migrate',
+                    help='convert DB records into current compact format')
+group_u = parser.add_argument_group('-U', 'update options')
+group_u.add_argument('-e', '--engine', dest='engine', default='thread',
+                     choices=['thread', 'async', 'sharded'],
+                     help='''polling engine: thread pool, asyncio event loop or
+                     pool of processes with single DB writer''')
+group_u.add_argument('--profile', dest='profile_json', metavar='FILE',
+                     help='''write JSON report with timings of update stages,
+                     device models & SNMP requests''')
+group_u.add_argument('--prometheus', dest='profile_prom', metavar='FILE',
+                     help='''write same timings in Prometheus textfile
+                     format''')
 group_s = parser.add_argument_group('-S', 'show options')
 group_s.add_argument('-a', '--show-all', dest='show_all', action='store_true',
                      help='show all devices in compressed fashion')
@@ -22,11 +36,25 @@ group_s.add_argument('-i', '--inactive', dest='inactive', action='store_true',
                      help='show devices that was not found in last update')
 group_s.add_argument('-c', '--chain', dest='uplink_chain',
                      metavar='DEVICE', help='show device uplink chain')
+group_s.add_argument('-w', '--downstream', dest='downstream',
+                     metavar='DEVICE',
+                     help='show devices connected through DEVICE')
 group_s.add_argument('-l', '--vlan-chain', dest='find_vlan', metavar='VLAN',
                      help='show devices chain with VLAN configured')
+group_s.add_argument('-g', '--vlan-gaps', dest='vlan_gaps', metavar='DEVICE',
+                     help='''show VLANs configured on DEVICE but not on its
+                     uplinks; use 'all' to check every device''')
 group_s.add_argument(
     '-f', '--full-search', dest='full_search', metavar='SEARCH',
     help='show compressed device cards where SEARCH was found')
+group_s.add_argument('-F', '--fields', dest='fields', nargs='+',
+                     choices=list(maintools.SEARCH_FIELDS),
+                     help='fields to look in with full search')
+group_s.add_argument('-r', '--regex', dest='regex', action='store_true',
+                     help='treat search value as regular expression')
+group_s.add_argument('-I', '--ignore-case', dest='ignore_case',
+                     action='store_true',
+                     help='ignore case of letters in search')
 group_s.add_argument('-m', '--model', dest='model_search', metavar='MODEL',
                      help='show devices wich model name contain MODEL')
 group_s.add_argument('-t', '--older-than', dest='older_software',
@@ -48,6 +76,17 @@ group_g.add_argument('-T', '--trac', dest='trac', action='store_true',
                      help='generate list of hosts for Trac knowledge base')
 group_g.add_argument('-R', '--rancid', dest='rancid', action='store_true',
                      help='generate list of hosts for RANCID')
+group_g.add_argument('-O', '--output-dir', dest='output_dir', metavar='DIR',
+                     help='''write lists into files in DIR by one pass through
+                     DB; all lists if none of them chosen''')
+group_g.add_argument('--output', dest='output', metavar='PATH',
+                     help='''write chosen list into PATH, file is replaced
+                     only when list completed; gzipped if PATH ends with
+                     .gz''')
+group_g.add_argument('--since-last', dest='since_last', action='store_true',
+                     help='''show only entries changed since last export of
+                     list with that key, or rewrite output files from stored
+                     entries''')
 parser.add_argument('-v', '--verbose', dest='verbose', action='count',
                     help='verbose output into console; upto -vv')
 args = parser.parse_args()
@@ -84,13 +123,19 @@ def update_cmd():
     '''Interlayer function for different update command execution
     based on provided CLI args
     '''
-    maintools.update_db_run()
+    maintools.update_db_run(engine=args.engine,
+                            profile_json=args.profile_json,
+                            profile_prom=args.profile_prom)
 
 
 def show_cmd():
     '''Interlayer function for different show command execution
     based on provided CLI args
     '''
+    if not maintools.db_ready(maintools.run_set.db_name,
+                              maintools.run_set.db_tree):
+        print('No device records in DB, run update first')
+        return
     if args.show_all:
         maintools.show_all_records()
     elif args.show_dev:
@@ -99,35 +144,51 @@ def show_cmd():
         maintools.show_all_records(inactive=True)
     elif args.uplink_chain:
         maintools.go_high(args.uplink_chain)
+    elif args.downstream:
+        maintools.show_downstream(args.downstream)
     elif args.find_vlan:
-        maintools.search_db('c_vlans', args.find_vlan)
+        maintools.show_vlan_chain(args.find_vlan)
+    elif args.vlan_gaps:
+        maintools.show_vlan_gaps(args.vlan_gaps)
     elif args.model_search:
-        maintools.search_db('c_model', args.model_search)
+        maintools.search_db('c_model', args.model_search, regex=args.regex,
+                            ignore_case=args.ignore_case)
     elif args.full_search:
-        maintools.search_db('full', args.full_search)
+        maintools.search_db('full', args.full_search, fields=args.fields,
+                            regex=args.regex, ignore_case=args.ignore_case)
     elif args.older_software:
         maintools.software_search(*args.older_software)
     elif args.outdated:
-        for model, version in maintools.find_newest_firmware():
-            maintools.software_search(model, version)
+        maintools.show_outdated()
     elif args.purge:
         maintools.delete_record(args.purge)
 
 
 def generate_cmd():
     '''Interlayer function for different generate command execution
-    based on provided CLI args
+    based on provided CLI args. Only one list can be written into --output
+    or stdout, several ones need -O/--output-dir
     '''
-    if args.plain:
-        maintools.generate_plain_list()
-    elif args.dns:
-        maintools.generate_dns_list()
-    elif args.nagios:
-        maintools.generate_nagios_list()
-    elif args.rancid:
-        maintools.generate_rancid_list()
-    elif args.trac:
-        maintools.generate_trac_table()
+    names = [name for name, flag in (
+        ('plain', args.plain), ('dns', args.dns), ('nagios', args.nagios),
+        ('rancid', args.rancid), ('trac', args.trac)) if flag]
+    if args.output and args.output_dir:
+        parser.error('--output and -O/--output-dir can not be used together')
+    if not names and not args.output_dir:
+        parser.error('choose list to generate or use -O/--output-dir for all '
+                     'of them')
+    if len(names) > 1 and not args.output_dir:
+        parser.error('only one list can be written into --output or stdout, '
+                     'use -O/--output-dir for several lists')
+    if args.since_last:
+        maintools.generate_delta(names or list(maintools.REPORT_SINKS),
+                                 directory=args.output_dir,
+                                 output=args.output)
+    elif args.output_dir:
+        maintools.generate_reports(names or list(maintools.REPORT_SINKS),
+                                   directory=args.output_dir)
+    else:
+        maintools.generate_reports(names, output=args.output)
 
 
 def dry_run_cmd():
@@ -135,10 +196,17 @@ def dry_run_cmd():
     '''
     maintools.dry_run()
 
+
+def migrate_cmd():
+    '''Interlayer function for DB records migration
+    '''
+    maintools.migrate_db()
+
 action_dict = {
     'update': update_cmd,
     'show': show_cmd,
     'generate': generate_cmd,
-    'dry_run': dry_run_cmd
+    'dry_run': dry_run_cmd,
+    'migrate': migrate_cmd
 }
 action_dict[args.action]()
@@ -1,5 +1,6 @@
 import logging
 from collections import OrderedDict
+from functools import lru_cache
 import os.path
 from utils.wwmode_exception import WWModeException
 
@@ -42,6 +43,42 @@ def convert(text, conv_from='cyr', start=0, end=0, schema='iso9_system_A',
     Return:
         result of translit function - transliterated text
     '''
+    conv_from, dict_direction = check_options(conv_from, dict_direction)
+    start, end = text_bounds(text, start, end)
+    transliterator = compile_schema(conv_from, schema, dict_direction,
+                                    separator)
+    return transliterator.translit(text, start, end)
+
+
+def convert_many(texts, conv_from='cyr', start=0, end=0,
+                 schema='iso9_system_A', dict_direction='standart',
+                 separator=' = '):
+    '''Transliterate many text strings with one compiled schema, arguments
+    are same as for convert function & applied to every string
+    Args:
+        texts - iterable of strings to translit
+        other args are described in convert function
+    Return:
+        list of transliterated strings in same order
+    '''
+    conv_from, dict_direction = check_options(conv_from, dict_direction)
+    transliterator = compile_schema(conv_from, schema, dict_direction,
+                                    separator)
+    converted = []
+    for text in texts:
+        text_start, text_end = text_bounds(text, start, end)
+        converted.append(transliterator.translit(text, text_start, text_end))
+    return converted
+
+
+def check_options(conv_from, dict_direction):
+    '''Check conversion options & replace unknown ones with defaults
+    Args:
+        conv_from - 'cyr' or 'lat'
+        dict_direction - 'standart' or 'reverse'
+    Return:
+        tuple of checked conv_from & dict_direction
+    '''
     if conv_from not in ['cyr', 'lat']:
         m_logger.warning("""Warning: unknown option {} for conv_from parameter.
                          Using cyr instead""".format(conv_from))
@@ -51,6 +88,18 @@ def convert(text, conv_from='cyr', start=0, end=0, schema='iso9_system_A',
                          parameter. Using standart instead""".format(
                              dict_direction))
         dict_direction = 'standart'
+    return conv_from, dict_direction
+
+
+def text_bounds(text, start, end):
+    '''Check start & end of transliterated part of text
+    Args:
+        text - string to translit
+        start - from where to start in string
+        end - where to end transliteration (0 for end of string)
+    Return:
+        tuple of checked start & end
+    '''
     if not type(start) is int or not type(end) is int:
         m_logger.error('Error: start and end parameters must be a digits!')
         raise ConvertParametersError(
@@ -64,12 +113,144 @@ def convert(text, conv_from='cyr', start=0, end=0, schema='iso9_system_A',
     if end < start:
         m_logger.warning('Warning: start parameter lesser than end. Swap it!')
         end, start = start, end
+    return start, end
+
+
+@lru_cache(maxsize=None)
+def compile_schema(conv_from, schema, dict_direction, separator):
+    '''Read schema file & compile it once for every set of options, later
+    calls get same Transliterator from cache
+    Args:
+        conv_from - 'cyr' or 'lat'
+        schema - filename in schemas directory which contain schema
+        dict_direction - 'standart' or 'reverse'
+        separator - sign that separate values in file
+    Return:
+        Transliterator instance
+    '''
     if not os.path.exists('lexicon/schemas/'+schema):
         m_logger.error('Error: given schema filename does not exist!')
         raise SchemaDoesNotExist('Given schema filename does not exist!')
-    translate_dictionary = build_dict(conv_from, schema,
-                                      dict_direction, separator)
-    return translit(text, start, end, translate_dictionary)
+    return Transliterator(build_dict(conv_from, schema, dict_direction,
+                                     separator))
+
+
+class LetterTable(dict):
+    '''Table for str.translate which replaces single letters of schema &
+    lowercase other characters. Entries are added on first use
+    instance attrs:
+        letters - dictionary with single letter as key & tuple of
+            replacement & capitalized replacement as value
+    methods:
+        overloaded __init__
+        overloaded __missing__
+    '''
+    def __init__(self, letters):
+        '''Initialize empty table
+        Args:
+            letters - dictionary with single letter as key & tuple of
+                replacement & capitalized replacement as value
+        Overloaded
+        '''
+        super().__init__()
+        self.letters = letters
+
+    def __missing__(self, code):
+        '''Compute replacement for character like translit function does:
+        letters which are not lowercase get capitalized replacement
+        Args:
+            code - code of character
+        Return:
+            replacement string
+        Overloaded
+        '''
+        char = chr(code)
+        lower = char.lower()
+        if lower in self.letters:
+            new_letters, capitalized = self.letters[lower]
+            replacement = new_letters if char.islower() else capitalized
+        else:
+            replacement = lower
+        self[code] = replacement
+        return replacement
+
+
+class Transliterator:
+    '''Transliteration schema prepared for repeated use. Letter combinations
+    are applied in same order as in translit function, but every one of them
+    split only parts of text not replaced yet, so text is not rebuilt on
+    every replacement. Single letters go after all combinations & can't
+    overlap, so they are replaced in one pass with str.translate
+    instance attrs:
+        dictionary - OrderedDict built by build_dict function
+        rules - tuple of (letters, replacement, capitalized replacement) for
+            combinations of letters in order of application
+        table - LetterTable instance for single letters
+        safe - False if replacements contain letters of schema, such schema
+            is applied by translit function
+    methods:
+        overloaded __init__
+        translit
+    '''
+    def __init__(self, dictionary):
+        '''Prepare replacements from dictionary
+        Args:
+            dictionary - transliteration schema built by build_dict function
+        Overloaded
+        '''
+        self.dictionary = dictionary
+        self.rules = tuple((letters, new_letters, new_letters.capitalize())
+                           for letters, new_letters in dictionary.items()
+                           if len(letters) > 1)
+        self.table = LetterTable({
+            letters: (new_letters, new_letters.capitalize())
+            for letters, new_letters in dictionary.items()
+            if len(letters) == 1})
+        letters = set(''.join(dictionary.keys()))
+        replaced = set(''.join(dictionary.values()))
+        self.safe = all(dictionary.keys()) and not letters & replaced
+
+    def translit(self, text, start, end):
+        '''Transliterate string from start index to end
+        Args:
+            text - string to translit
+            start - start index
+            end - end index
+        Return:
+            transliterated string
+        '''
+        part = text[start:end]
+        lowered = part.lower()
+        if not self.safe or len(lowered) != len(part):
+            return translit(text, start, end, self.dictionary)
+        # pieces are (position in part, string) for text not replaced yet
+        # & (None, string) for replacements
+        pieces = [(0, lowered)]
+        for letters, new_letters, capitalized in self.rules:
+            if letters not in lowered:
+                continue
+            split_pieces = []
+            for pos, piece in pieces:
+                if pos is None or letters not in piece:
+                    split_pieces.append((pos, piece))
+                    continue
+                chunks = piece.split(letters)
+                for chunk in chunks[:-1]:
+                    if chunk:
+                        split_pieces.append((pos, chunk))
+                    pos += len(chunk)
+                    if part[pos].islower():
+                        split_pieces.append((None, new_letters))
+                    else:
+                        split_pieces.append((None, capitalized))
+                    pos += len(letters)
+                if chunks[-1]:
+                    split_pieces.append((pos, chunks[-1]))
+            pieces = split_pieces
+        return text[:start] + ''.join(
+            piece if pos is None else
+            part[pos:pos + len(piece)].translate(self.table)
+            for pos, piece in pieces) + text[end:]
 
 
 def build_dict(conv_from, schema, dict_direction, separator):
@@ -4,13 +4,13 @@ except ImportError:
     from distutils.core import setup
 
 config = {
-        'description': 'Network devices scanner'
-        'author': 'Yakov Shiryaev'
+        'description': 'Network devices scanner',
+        'author': 'Yakov Shiryaev',
         'url': 'https://github.com/yman45/wwmode',
         'download_url': 'https://github.com/yman45/wwmode.git',
-        'author_email': 'yman@protonmail.ch'
+        'author_email': 'yman@protonmail.ch',
         'version': '0.1',
-        'install_requires': [],
+        'install_requires': ['pysnmp==7.1.30', 'pyasn1==0.6.4', 'ZODB'],
         'packages': ['utils', 'lexicon'],
         'scripts': ['wwmode.bin'],
         'name': 'WWmode'
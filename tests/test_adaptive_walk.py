@@ -0,0 +1,33 @@
+import unittest
+from pysnmp.hlapi.v3arch.asyncio import ObjectType, ObjectIdentity
+from pysnmp.proto import errind
+from utils.snmpget import AdaptiveWalk
+
+
+class AdaptiveWalkTest(unittest.TestCase):
+    def setUp(self):
+        self.walk = AdaptiveWalk(
+            ObjectType(ObjectIdentity('1.3.6.1.2.1.31.1.1.1.18')),
+            max_repetitions=50)
+
+    def test_timeout_is_final(self):
+        self.assertFalse(self.walk.retry_on_error(errind.requestTimedOut, 0))
+        self.assertEqual(self.walk.repetitions, 8)
+
+    def test_too_big(self):
+        self.assertTrue(self.walk.retry_on_error(None, 1))
+        self.assertEqual(self.walk.repetitions, 4)
+
+    def test_bulk_refused(self):
+        self.assertTrue(self.walk.retry_on_error(None, 5))
+        self.assertEqual(self.walk.repetitions, 0)
+        # GETNEXT errors are final
+        self.assertFalse(self.walk.retry_on_error(None, 5))
+
+    def test_other_status_is_final(self):
+        # authorizationError
+        self.assertFalse(self.walk.retry_on_error(None, 16))
+
+
+if __name__ == '__main__':
+    unittest.main()
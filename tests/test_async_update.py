@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+import ipaddress
+import threading
+from unittest import mock
+from ZODB import FileStorage, DB
+from utils.snmp_fleet import Fleet
+from utils.load_settings import AppSettings, GroupSettings, FakeSettings
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.async_update import async_update_run
+from utils import profiler, async_update
+
+PORT = 16161
+WALK = [('1.3.6.1.2.1.1.1.0', '4', 'Cisco IOS C2950 Software'),
+        ('1.3.6.1.2.1.1.2.0', '6', '1.3.6.1.4.1.9.1.324'),
+        ('1.3.6.1.2.1.1.4.0', '4', 'noc@company.ru'),
+        ('1.3.6.1.2.1.1.6.0', '4', 'Lenina 5'),
+        ('1.3.6.1.2.1.47.1.1.1.1.9.1', '4', '12.1(22)EA14'),
+        ('1.3.6.1.2.1.47.1.1.1.1.13.1', '4', 'WS-C2950-24')]
+WALK += [('1.3.6.1.2.1.31.1.1.1.15.{}'.format(port), '66', '100')
+         for port in range(1, 27)]
+WALK += [('1.3.6.1.2.1.31.1.1.1.18.{}'.format(port), '4',
+          'Gi0/1@r1-core.local up' if port == 25 else 'port {}'.format(port))
+         for port in range(1, 27)]
+WALK += [('1.3.6.1.4.1.9.9.68.1.2.1.1.2.{}'.format(vlan), '2', '1')
+         for vlan in (1, 10, 20, 1002)]
+
+
+class AsyncUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        app_settings = AppSettings()
+        app_settings.unneded_vlans = ['1', '1002']
+        app_settings.uplink_pattern = r'^\S+@(?P<device>\S+) up$'
+        group_settings = GroupSettings('test')
+        group_settings.group_wanted = {'vlans': 'vlan_list',
+                                       'uplinks': 'uplink_list'}
+        self.settings = FakeSettings(app_settings, group_settings)
+        self.fleet = Fleet(['127.0.0.1'], [WALK], [(0, {})], port=PORT)
+        self.fleet.start()
+
+    def tearDown(self):
+        self.fleet.stop()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.seen_hosts = []
+        Device.changed_hosts = set()
+
+    def test_update_run(self):
+        async_update_run([ipaddress.ip_address('127.0.0.1')], self.settings,
+                         self.db, 10, port=PORT)
+        connection = self.db.open()
+        device = connection.root()['hosts']['127.0.0.1']
+        self.assertEqual(device.c_model, 'WS-C2950-24')
+        self.assertEqual(device.c_firmware, '12.1(22)EA14')
+        self.assertEqual(device.c_location, 'Lenina 5')
+        self.assertEqual(device.c_vlans, ['10', '20'])
+        self.assertEqual(device.c_uplinks,
+                         [('Gi0/1@r1-core.local up', '100 Mb/s')])
+        self.assertIn('127.0.0.1', Device.new_hosts)
+        connection.close()
+
+    def test_profile(self):
+        profile = profiler.start_profile()
+        try:
+            async_update_run([ipaddress.ip_address('127.0.0.1')],
+                             self.settings, self.db, 10, port=PORT)
+        finally:
+            profiler.stop_profile()
+        report = profile.report()
+        self.assertEqual(list(report['models']), ['WS-C2950-24'])
+        self.assertIn('sget_vlan_list', report['stages'])
+        oid = report['oids']['SNMPv2-MIB::sysDescr']
+        self.assertEqual((oid['requests'], oid['timeouts']), (1, 0))
+        self.assertIn('IF-MIB::ifAlias', report['oids'])
+
+    def test_worker_error(self):
+        run = threading.Thread(target=async_update_run, args=(
+            [ipaddress.ip_address('127.0.0.1')], self.settings, self.db, 10),
+            kwargs={'port': PORT}, daemon=True)
+        with mock.patch.object(async_update, 'choose_card',
+                               side_effect=RuntimeError('broken card')):
+            with self.assertLogs('wwmode_app.utils.async_update', 'ERROR'):
+                run.start()
+                run.join(30)
+        self.assertFalse(run.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from utils.load_cards import CardMatcher
+
+
+class CardMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.cards = [
+            {'vendor': 'Cisco', 'series': 'XL', 'info_pattern': 'XL Software'},
+            {'vendor': 'Cisco', 'series': 'IOS', 'info_pattern': '^Cisco',
+             'sys_object_id': ['1.3.6.1.4.1.9.1.324']},
+            {'vendor': 'Eltex', 'series': 'MES', 'info_pattern': '^MES'}]
+
+    def test_first_card_wins(self):
+        for combine in (False, True):
+            matcher = CardMatcher(self.cards, combine=combine)
+            self.assertIs(matcher.choose(
+                '10.0.0.1', 'Cisco C2900XL Software', {}), self.cards[0])
+            self.assertIs(matcher.choose(
+                '10.0.0.1', 'Cisco C2950 Software', {}), self.cards[1])
+            self.assertIsNone(matcher.choose('10.0.0.1', 'Linux', {}))
+
+    def test_bind_and_object_id(self):
+        matcher = CardMatcher(self.cards)
+        self.assertIs(matcher.choose(
+            '10.0.0.1', 'Cisco C2950 Software', {'10.0.0.1': 'Eltex MES'}),
+            self.cards[2])
+        self.assertIsNone(matcher.choose(
+            '10.0.0.1', 'MES-3124', {'10.0.0.1': 'Unknown'}))
+        self.assertIs(matcher.choose(
+            '10.0.0.2', 'MES-3124', {}, '1.3.6.1.4.1.9.1.324'),
+            self.cards[1])
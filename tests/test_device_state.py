@@ -0,0 +1,37 @@
+import unittest
+from utils.update_db import Device, STATE_VERSION
+
+
+class DeviceStateTest(unittest.TestCase):
+    def setUp(self):
+        self.device = Device('10.0.0.1')
+        self.device.dname = 'r1-sw1.local'
+        self.device.c_model = 'WS-C2950-24'
+        self.device.c_vlans = ['10', '20', '4000']
+        self.device.c_uplinks = [('Gi0/1@r1-core.local up', '1000 Mb/s')]
+
+    def restore(self, state):
+        device = Device.__new__(Device)
+        device.__setstate__(state)
+        return device
+
+    def test_round_trip(self):
+        state = self.device.__getstate__()
+        self.assertEqual(state[0], STATE_VERSION)
+        self.assertEqual(state[-1], {})
+        device = self.restore(state)
+        self.assertEqual(device.__getstate__(), state)
+
+    def test_unpackable_values(self):
+        self.device.c_vlans = ['10', 'default']
+        self.device.c_uplinks = [('Gi0/1@r1-core.local up', 'None Mb/s')]
+        state = self.device.__getstate__()
+        self.assertIn('c_vlans', state[-1])
+        self.assertIn('c_uplinks', state[-1])
+        device = self.restore(state)
+        self.assertEqual(device.__getstate__(), state)
+
+    def test_legacy_state(self):
+        device = self.restore(dict(self.device.__dict__))
+        self.assertEqual(device.c_vlans, self.device.c_vlans)
+        self.assertEqual(device._v_state_version, 0)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+import transaction
+from ZODB import FileStorage, DB
+from utils.dbutils import db_check
+from utils.liveness import liveness_key
+from utils.update_db import Device, register_device
+
+
+class DeviceWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.connection = self.db.open()
+        self.devdb = self.connection.root()['hosts']
+        self.liveness = self.connection.root()[liveness_key('hosts')]
+        self.device = Device('10.0.0.1')
+        self.device.liveness = self.liveness
+        self.device.c_model = 'WS-C2950-24'
+        self.device.c_location = 'Lenina 5'
+        self.device.version_pattern = r'(\d+)\.(\d+)'
+        self.devdb[self.device.ip] = self.device
+        transaction.commit()
+        self.serial = self.device._p_serial
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.seen_hosts = []
+        Device.changed_hosts = set()
+
+    def stored(self):
+        '''Load device record by another connection'''
+        connection = self.db.open()
+        try:
+            device = connection.root()['hosts']['10.0.0.1']
+            device._p_activate()
+            return dict(device.__dict__)
+        finally:
+            connection.close()
+
+    def test_unchanged_not_written(self):
+        self.device.c_model = 'WS-C2950-24'
+        self.device.c_location = 'Lenina 5'
+        self.assertFalse(self.device._p_changed)
+        transaction.commit()
+        self.assertEqual(self.device._p_serial, self.serial)
+
+    def test_restored_not_written(self):
+        self.device.c_location = 'Ленина 5'
+        self.assertTrue(self.device._p_changed)
+        self.device.c_location = 'Lenina 5'
+        self.assertFalse(self.device._p_changed)
+        transaction.commit()
+        self.assertEqual(self.device._p_serial, self.serial)
+
+    def test_deletion_written(self):
+        del self.device.version_pattern
+        self.device.c_location = 'Ленина 5'
+        self.device.c_location = 'Lenina 5'
+        transaction.commit()
+        self.assertNotEqual(self.device._p_serial, self.serial)
+        self.assertNotIn('version_pattern', self.stored())
+
+    def test_legacy_last_seen_dropped(self):
+        self.device.__dict__['last_seen'] = '01-01-2026 10:00'
+        self.device._p_changed = True
+        transaction.commit()
+        device = register_device(self.devdb, '10.0.0.1', self.liveness)
+        device.c_location = 'Ленина 5'
+        device.c_location = 'Lenina 5'
+        transaction.commit()
+        self.assertNotIn('last_seen', self.stored())
+
+
+if __name__ == '__main__':
+    unittest.main()
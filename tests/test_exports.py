@@ -0,0 +1,197 @@
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import importlib
+import contextlib
+from unittest import mock
+import transaction
+from ZODB import FileStorage, DB
+from utils.load_settings import AppSettings
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.reports import PlainSink, RancidSink
+from utils.exports import (export_marks, export_delta, entry_digest,
+                           record_removal)
+
+
+def setUpModule():
+    '''Settings are loaded on utils.maintools import, so config must be in
+    current directory; tests point settings to own DB'''
+    global workdir, maintools
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, 'wwmode.conf'), 'w') as conf_file:
+        conf_file.write('logs_path = {}/logs\n'.format(workdir))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        maintools = importlib.import_module('utils.maintools')
+    finally:
+        os.chdir(cwd)
+
+
+def tearDownModule():
+    shutil.rmtree(workdir)
+
+
+class ExportDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.connection = self.db.open()
+        self.devdb = self.connection.root()['hosts']
+        for num in range(1, 4):
+            device = Device('10.0.0.{}'.format(num))
+            device.dname = 'r1.a{}.local'.format(num)
+            device.rancid_type = 'cisco'
+            self.devdb[device.ip] = device
+        transaction.commit()
+        settings = AppSettings()
+        self.sinks = {'plain': PlainSink(None, settings),
+                      'rancid': RancidSink(None, settings)}
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def export(self):
+        marks = export_marks(self.connection.root(), 'hosts')
+        delta = export_delta(self.connection, self.devdb, marks, self.sinks)
+        transaction.commit()
+        return delta, marks
+
+    def test_only_changed_host(self):
+        written_tid = self.db.storage.lastTransaction()
+        delta, marks = self.export()
+        self.assertEqual(len(delta['plain']), 3)
+        first_tid = marks['plain'].tid
+        self.assertEqual(first_tid, written_tid)
+        self.devdb['10.0.0.2'].dname = 'r1.b2.local'
+        transaction.commit()
+        written_tid = self.db.storage.lastTransaction()
+        delta, marks = self.export()
+        self.assertEqual(delta['plain'],
+                         [('changed', '10.0.0.2', 'r1.b2.local')])
+        self.assertEqual(delta['rancid'],
+                         [('changed', '10.0.0.2', 'r1.b2.local;cisco;up')])
+        self.assertGreater(marks['plain'].tid, first_tid)
+        self.assertEqual(marks['plain'].tid, written_tid)
+        self.assertEqual(marks['rancid'].tid, marks['plain'].tid)
+        self.assertEqual(list(marks['plain'].entries.values()),
+                         [entry_digest(x) for x in
+                          ('r1.a1.local', 'r1.b2.local', 'r1.a3.local')])
+        delta, marks = self.export()
+        self.assertEqual(delta, {'plain': [], 'rancid': []})
+
+    def test_removed_host(self):
+        self.export()
+        del self.devdb['10.0.0.3']
+        record_removal(self.connection.root(), 'hosts', '10.0.0.3')
+        transaction.commit()
+        delta, marks = self.export()
+        self.assertEqual(delta['plain'], [('removed', '10.0.0.3', None)])
+        self.assertNotIn('10.0.0.3', marks['plain'].entries)
+        self.assertIsNone(marks['plain'].removed)
+
+
+class GenerateDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(self.db_name, 'hosts')
+
+        def add_devices(devdb):
+            for num in range(1, 4):
+                ip = '10.0.0.{}'.format(num)
+                devdb[ip] = self.device(ip, 'a{}'.format(num))
+        self.change(add_devices)
+        self.output = os.path.join(self.workdir, 'nagios')
+        for attr, value in (('db_name', self.db_name), ('db_tree', 'hosts')):
+            patcher = mock.patch.object(maintools.run_set, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def device(self, ip, name):
+        device = Device(ip)
+        device.dname = 'r1.{}.local'.format(name)
+        return device
+
+    def change(self, func):
+        '''Apply func to device records tree & commit'''
+        db = DB(FileStorage.FileStorage(self.db_name))
+        try:
+            connection = db.open()
+            func(connection.root()['hosts'])
+            transaction.commit()
+            connection.close()
+        finally:
+            db.close()
+
+    def generate(self, names, **kwargs):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            maintools.generate_delta(names, **kwargs)
+        return out.getvalue()
+
+    def hosts(self):
+        with open(self.output) as report:
+            return [line.split('\t')[-1] for line in report
+                    if line.startswith('\taddress')]
+
+    def test_patch_file(self):
+        self.generate(['nagios'], output=self.output)
+        self.assertEqual(self.hosts(), ['10.0.0.1\n', '10.0.0.2\n',
+                                        '10.0.0.3\n'])
+        self.change(lambda devdb: devdb.__setitem__(
+            '10.0.0.0', self.device('10.0.0.0', 'a0')))
+        maintools.delete_record('10.0.0.2')
+        with mock.patch.object(maintools.REPORT_SINKS['nagios'],
+                               'entry') as entry:
+            # only new device is read & built
+            entry.return_value = 'new entry'
+            self.assertEqual(self.generate(['nagios'], output=self.output),
+                             '{}: 3 entries, 1 added, 0 changed, 1 '
+                             'removed\n'.format(self.output))
+        self.assertEqual(entry.call_count, 1)
+        with open(self.output) as report:
+            text = report.read()
+        self.assertTrue(text.startswith('new entry\n'))
+        self.assertEqual(self.hosts(), ['10.0.0.1\n', '10.0.0.3\n'])
+
+    def test_rebuild_changed_file(self):
+        self.generate(['nagios'], output=self.output)
+        with open(self.output, 'a') as report:
+            report.write('edited by hand\n')
+        self.change(lambda devdb: setattr(devdb['10.0.0.1'], 'dname',
+                                          'r1.b1.local'))
+        self.generate(['nagios'], output=self.output)
+        with open(self.output) as report:
+            text = report.read()
+        self.assertNotIn('edited by hand', text)
+        self.assertIn('r1.b1.local', text)
+        self.assertEqual(self.hosts(), ['10.0.0.1\n', '10.0.0.2\n',
+                                        '10.0.0.3\n'])
+
+    def test_several_names(self):
+        for kwargs in ({}, {'output': self.output}):
+            with self.assertRaises(ValueError):
+                self.generate(['plain', 'rancid'], **kwargs)
+        self.generate(['plain', 'nagios'], directory=self.workdir)
+        self.assertTrue(os.path.exists(os.path.join(self.workdir,
+                                                    'plain.txt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
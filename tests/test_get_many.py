@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest import mock
+from pysnmp.proto.rfc1902 import OctetString
+from pysnmp.proto.rfc1905 import errorStatus, noSuchObject
+from utils.load_settings import AppSettings, GroupSettings, FakeSettings
+from utils.snmpget import SnmpGetter, get_many, make_engine, close_engine
+from utils.async_snmpget import AsyncSnmpGetter, async_get_many
+from utils import async_snmpget
+from utils.update_db import Device, split_requests
+
+MODEL_OID = '1.3.6.1.2.1.47.1.1.1.1.13.1'
+FIRMWARE_OID = '1.3.6.1.2.1.47.1.1.1.1.9.1'
+VALUES = {'1.3.6.1.2.1.1.6.0': 'Lenina 5',
+          '1.3.6.1.2.1.1.4.0': 'noc@company.ru',
+          MODEL_OID: 'WS-C2950-24',
+          FIRMWARE_OID: '12.1(22)EA14'}
+
+
+class FakeAgent:
+    '''Host which answers tooBig on GET for several OIDs & genErr for broken
+    OIDs, like old switch with small buffer'''
+    def __init__(self, engine, broken=()):
+        self.mib_view = engine.cache['mibViewController']
+        self.broken = broken
+        self.requests = []
+
+    def send(self, object_types):
+        '''Answer in place of snmp_run generator'''
+        oids = [str(x.resolve_with_mib(self.mib_view)[0].get_oid())
+                for x in object_types]
+        self.requests.append(oids)
+        names = [x[0] for x in object_types]
+        if len(oids) > 1:
+            return None, errorStatus.clone('tooBig'), 0, []
+        if oids[0] in self.broken:
+            return (None, errorStatus.clone('genErr'), 1,
+                    [(names[0], noSuchObject)])
+        return None, 0, 0, [(names[0], OctetString(VALUES[oids[0]]))]
+
+    async def get_cmd(self, engine, community, transport, context,
+                      *object_types):
+        '''Answer in place of pysnmp get_cmd'''
+        return self.send(object_types)
+
+
+class GetManyTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = make_engine()
+        app_settings = AppSettings()
+        self.settings = FakeSettings(app_settings, GroupSettings('test'))
+        self.card = {'model_oid': MODEL_OID, 'firmware_oid': FIRMWARE_OID}
+        self.device = Device('10.0.0.1')
+        self.device.c_firmware = '12.1(22)EA13'
+
+    def tearDown(self):
+        close_engine(self.engine)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def test_split_requests(self):
+        scalars, requests = split_requests(self.card, self.settings)
+        self.assertEqual(scalars, [
+            ('location', '1.3.6.1.2.1.1.6.0'),
+            ('contact', '1.3.6.1.2.1.1.4.0'),
+            ('model', MODEL_OID), ('firmware', FIRMWARE_OID)])
+        self.assertEqual(requests, [('uplinks', 'sget_uplink_list',
+                                     'well-known')])
+        self.assertEqual(split_requests(None, self.settings)[0],
+                         scalars[:2])
+
+    def test_split_on_too_big(self):
+        agent = FakeAgent(self.engine, broken=(FIRMWARE_OID, ))
+        oids = list(VALUES)
+        self.assertEqual(get_many(oids, '10.0.0.1', agent), [
+            'Lenina 5', 'noc@company.ru', 'WS-C2950-24', None])
+        self.assertEqual(agent.requests, [
+            oids, oids[:2], oids[:1], oids[1:2], oids[2:], oids[2:3],
+            oids[3:]])
+
+    def check_scalars(self, device):
+        self.assertEqual(device.c_location, 'Lenina 5')
+        self.assertEqual(device.c_contact, 'noc@company.ru')
+        self.assertEqual(device.c_model, 'WS-C2950-24')
+        # failed request doesn't wipe value stored by previous run
+        self.assertEqual(device.c_firmware, '12.1(22)EA13')
+
+    def test_scalars(self):
+        scalars, requests = split_requests(self.card, self.settings)
+        snmp_getter = SnmpGetter(self.engine, self.settings)
+        snmp_getter.snmp_get = FakeAgent(self.engine, broken=(FIRMWARE_OID, ))
+        snmp_getter.sget_scalars(self.device, scalars)
+        self.check_scalars(self.device)
+
+    def test_async_scalars(self):
+        scalars, requests = split_requests(self.card, self.settings)
+        agent = FakeAgent(self.engine, broken=(FIRMWARE_OID, ))
+        snmp_getter = AsyncSnmpGetter(self.engine, self.settings)
+        with mock.patch.object(async_snmpget, 'get_cmd', agent.get_cmd):
+            asyncio.run(snmp_getter.sget_scalars(self.device, scalars))
+            self.assertEqual(asyncio.run(async_get_many(
+                self.engine, 'public', '10.0.0.1', [MODEL_OID])),
+                ['WS-C2950-24'])
+        self.check_scalars(self.device)
+        self.assertEqual(len(agent.requests), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
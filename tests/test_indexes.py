@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+import transaction
+from ZODB import FileStorage, DB
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.indexes import update_indexes, indexes_key
+
+
+class UpdateIndexesTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.connection = self.db.open()
+        self.devdb = self.connection.root()['hosts']
+        self.device = Device('10.0.0.1')
+        self.device.c_model = 'WS-C2950-24'
+        self.devdb[self.device.ip] = self.device
+        transaction.commit()
+        update_indexes(self.db, 'hosts', [self.device.ip])
+        Device.changed_hosts = set()
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def lookup(self, model):
+        connection = self.db.open()
+        try:
+            indexes = connection.root()[indexes_key('hosts')]
+            return indexes.lookup('model', model)
+        finally:
+            connection.close()
+
+    def test_unchanged_value(self):
+        self.device.c_model = 'WS-C2950-24'
+        self.assertEqual(Device.changed_hosts, set())
+        self.device.c_model = 'WS-C2960-24'
+        self.assertEqual(Device.changed_hosts, {'10.0.0.1'})
+
+    def test_catch_up_after_failed_run(self):
+        self.device.c_model = 'WS-C2960-24'
+        transaction.commit()
+        # run failed before indexes update, changed hosts are lost
+        Device.changed_hosts = set()
+        update_indexes(self.db, 'hosts', [])
+        self.assertEqual(self.lookup('WS-C2960-24'), ['10.0.0.1'])
+        self.assertEqual(self.lookup('WS-C2950-24'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
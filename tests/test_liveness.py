@@ -0,0 +1,50 @@
+import unittest
+from utils.liveness import Liveness
+
+HOSTS = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+
+
+class LivenessTest(unittest.TestCase):
+    def setUp(self):
+        self.liveness = Liveness()
+        self.liveness.record_run(HOSTS, '01-01-2026 10:00')
+        self.liveness.record_run(HOSTS[:2], '02-01-2026 10:00')
+        self.liveness.record_run(HOSTS[:1], '03-01-2026 10:00')
+
+    def test_last_seen(self):
+        self.assertEqual(self.liveness.last_seen('10.0.0.1'),
+                         '03-01-2026 10:00')
+        self.assertEqual(self.liveness.last_seen('10.0.0.2'),
+                         '02-01-2026 10:00')
+        self.assertEqual(self.liveness.last_seen('10.0.0.3'),
+                         '01-01-2026 10:00')
+        self.assertIsNone(self.liveness.last_seen('10.0.0.4'))
+        self.assertEqual(dict(self.liveness.missing.items()), {1: 2, 2: 1})
+
+    def test_found_again(self):
+        self.liveness.record_run(HOSTS[1:] + ['10.0.0.4'],
+                                 '04-01-2026 10:00')
+        self.assertEqual(dict(self.liveness.missing.items()), {0: 3})
+        self.assertEqual(self.liveness.last_seen('10.0.0.1'),
+                         '03-01-2026 10:00')
+        self.assertEqual(self.liveness.last_seen('10.0.0.3'),
+                         '04-01-2026 10:00')
+        self.assertTrue(self.liveness.seen_last_run('10.0.0.4'))
+
+    def test_old_storage(self):
+        # storages created before missing was kept have no such attribute
+        missing = self.liveness.missing
+        del self.liveness.missing
+        self.assertIsNone(self.liveness.missing)
+        self.assertEqual(self.liveness.last_seen('10.0.0.3'),
+                         '01-01-2026 10:00')
+        self.assertEqual(dict(self.liveness.find_missing().items()),
+                         dict(missing.items()))
+        self.liveness.record_run(HOSTS[:1], '04-01-2026 10:00')
+        self.assertEqual(dict(self.liveness.missing.items()), {1: 2, 2: 1})
+        self.assertEqual(self.liveness.last_seen('10.0.0.2'),
+                         '02-01-2026 10:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
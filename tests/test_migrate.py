@@ -0,0 +1,110 @@
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import importlib
+import contextlib
+from unittest import mock
+import transaction
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree
+from ZODB import FileStorage, DB
+from utils.update_db import Device, STATE_VERSION
+from utils.indexes import indexes_key
+
+
+def setUpModule():
+    '''Settings are loaded on utils.maintools import, so config must be in
+    current directory; tests point settings to own DB'''
+    global workdir, maintools
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, 'wwmode.conf'), 'w') as conf_file:
+        conf_file.write('logs_path = {}/logs\n'.format(workdir))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        maintools = importlib.import_module('utils.maintools')
+    finally:
+        os.chdir(cwd)
+
+
+def tearDownModule():
+    shutil.rmtree(workdir)
+
+
+class MigrateTest(unittest.TestCase):
+    def setUp(self):
+        '''Make DB with records pickled as plain attributes dictionary, like
+        versions before compact state stored them'''
+        self.workdir = tempfile.mkdtemp()
+        self.db_name = os.path.join(self.workdir, 'test.fs')
+        with mock.patch.object(Device, '__getstate__',
+                               Persistent.__getstate__):
+            self.change(self.add_devices)
+        for attr, value in (('db_name', self.db_name), ('db_tree', 'hosts')):
+            patcher = mock.patch.object(maintools.run_set, attr, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def add_devices(self, root):
+        devdb = root['hosts'] = OOBTree()
+        for num in range(1, 4):
+            device = Device('10.0.0.{}'.format(num))
+            device.dname = 'r1.a{}.local'.format(num)
+            # separate string objects, like ones received from hosts
+            device.c_model = ''.join(['WS-C2950', '-24'])
+            device.c_vlans = ['10', '20']
+            device.c_uplinks = [('Gi0/1@r1-core.local up', '100 Mb/s')]
+            devdb[device.ip] = device
+
+    def change(self, func):
+        '''Call func with DB root & commit'''
+        db = DB(FileStorage.FileStorage(self.db_name))
+        try:
+            connection = db.open()
+            result = func(connection.root())
+            transaction.commit()
+            connection.close()
+        finally:
+            db.close()
+        return result
+
+    def migrate(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            maintools.migrate_db(batch=2)
+        return out.getvalue().splitlines()
+
+    def test_migrate(self):
+        self.assertEqual(self.change(lambda root: [
+            dev._v_state_version for dev in root['hosts'].values()]),
+            [0, 0, 0])
+        report = self.migrate()
+        self.assertEqual(report[0], 'Migrated records: 3')
+        before, after = [float(line.split('(')[1].split()[0])
+                         for line in report[1:3]]
+        self.assertLess(after, before)
+
+        def check(root):
+            devices = list(root['hosts'].values())
+            self.assertEqual([dev._v_state_version for dev in devices],
+                             [STATE_VERSION] * 3)
+            self.assertIs(devices[0].c_model, devices[2].c_model)
+            self.assertEqual(devices[1].c_vlans, ['10', '20'])
+            self.assertEqual(devices[1].c_uplinks,
+                             [('Gi0/1@r1-core.local up', '100 Mb/s')])
+            self.assertEqual(root[indexes_key('hosts')].lookup(
+                'model', 'WS-C2950-24'), ['10.0.0.1', '10.0.0.2',
+                                          '10.0.0.3'])
+        self.change(check)
+        self.assertEqual(self.migrate(), ['Migrated records: 0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import socket
+import threading
+import ipaddress
+from utils.prescan import prescan, build_probe
+
+
+class PrescanTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.agent.bind(('127.0.0.1', 0))
+        self.agent.settimeout(2)
+        self.port = self.agent.getsockname()[1]
+        self.received = []
+
+        def answer():
+            try:
+                data, address = self.agent.recvfrom(65535)
+            except socket.timeout:
+                return
+            self.received.append(data)
+            self.agent.sendto(data, address)
+
+        self.responder = threading.Thread(target=answer)
+        self.responder.start()
+
+    def tearDown(self):
+        self.responder.join()
+        self.agent.close()
+
+    def test_probe_format(self):
+        probe = build_probe('public', 300)
+        self.assertEqual(probe[0], 0x30)
+        self.assertIn(b'public', probe)
+        self.assertIn(b'\x2b\x06\x01\x02\x01\x01\x02\x00', probe)
+
+    def test_live_hosts(self):
+        hosts = [ipaddress.ip_address('127.0.0.1'),
+                 ipaddress.ip_address('127.0.0.2')]
+        live = prescan(hosts, 'public', port=self.port, timeout=0.5)
+        self.assertEqual(live, hosts[:1])
+        self.assertEqual(len(self.received), 1)
+
+if __name__ == '__main__':
+    unittest.main()
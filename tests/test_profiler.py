@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import unittest
+from utils import profiler
+
+
+class SweepProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.profile = profiler.SweepProfile()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(profiler.percentile(values, 50), 50)
+        self.assertEqual(profiler.percentile(values, 99), 99)
+        self.assertEqual(profiler.percentile([7], 90), 7)
+        self.assertIsNone(profiler.percentile([], 50))
+
+    def test_report(self):
+        for num in range(10):
+            self.profile.add('scalars', num / 100)
+        self.profile.host('WS-C2950', 1.5)
+        self.profile.host('DES-3028', 0.5)
+        self.profile.request(['1.3.6.1.2.1.1.1.0'], 2, timeout=True)
+        self.profile.request(['1.3.6.1.2.1.1.1.0'], 0.1)
+        report = self.profile.report()
+        self.assertEqual(report['hosts'], 2)
+        self.assertEqual(report['stages']['scalars']['count'], 10)
+        self.assertEqual(report['stages']['scalars']['p50'], 0.04)
+        self.assertEqual(list(report['models']), ['WS-C2950', 'DES-3028'])
+        oid = report['oids']['1.3.6.1.2.1.1.1.0']
+        self.assertEqual((oid['requests'], oid['timeouts']), (2, 1))
+
+    def test_merge(self):
+        other = profiler.SweepProfile()
+        other.add('scalars', 0.5)
+        other.host('WS-C2950', 1.5)
+        other.request(['IF-MIB::ifAlias'], 2, timeout=True)
+        self.profile.add('scalars', 0.1)
+        self.profile.request(['IF-MIB::ifAlias'], 0.1)
+        self.profile.merge(other.state())
+        report = self.profile.report()
+        self.assertEqual(report['hosts'], 1)
+        self.assertEqual(report['stages']['scalars']['count'], 2)
+        oid = report['oids']['IF-MIB::ifAlias']
+        self.assertEqual((oid['requests'], oid['timeouts']), (2, 1))
+
+    def test_prometheus(self):
+        self.profile.add('dns', 0.02)
+        self.profile.request(['IF-MIB::ifAlias'], 0.3)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'wwmode.prom')
+            self.profile.write_prometheus(path)
+            with open(path) as metrics:
+                lines = metrics.read().splitlines()
+            json_path = os.path.join(tmp, 'profile.json')
+            self.profile.write_json(json_path)
+            with open(json_path) as report:
+                self.assertIn('dns', json.load(report)['stages'])
+        self.assertIn('wwmode_stage_seconds_bucket{stage="dns",le="0.01"} 0',
+                      lines)
+        self.assertIn('wwmode_stage_seconds_bucket{stage="dns",le="0.025"} 1',
+                      lines)
+        self.assertIn('wwmode_oid_timeouts_total{oid="IF-MIB::ifAlias"} 0',
+                      lines)
+
+    def test_null_profile(self):
+        profile = profiler.start_profile()
+        self.assertIs(profiler.active, profile)
+        with profiler.active.timer('commit'):
+            pass
+        self.assertIs(profiler.stop_profile(), profile)
+        self.assertIn('commit', profile.stages)
+        profiler.active.add('commit', 1)
+        self.assertEqual(profiler.active.report()['stages'], {})
@@ -0,0 +1,102 @@
+import os
+import io
+import gzip
+import shutil
+import tempfile
+import unittest
+from utils.load_settings import AppSettings
+from utils.update_db import Device
+from utils.reports import AtomicWriter, REPORT_SINKS, run_reports
+
+
+class ReportSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = AppSettings()
+        self.settings.location_transliteration = 'iso9_system_B'
+        self.device = Device('10.0.0.1')
+        self.device.dname = 'r1.a1.local'
+        self.device.rancid_type = 'cisco'
+        self.device.c_model = 'WS-C2950-24'
+        self.device.c_location = 'Lenina 5'
+        self.device.c_uplinks = [('Gi0/1@r1-core.local up', '100 Mb/s')]
+
+    def report(self, name, devices=None):
+        out = io.StringIO()
+        sink = REPORT_SINKS[name](out, self.settings, with_title=True)
+        run_reports(devices or [self.device], [sink])
+        return out.getvalue(), sink.entries
+
+    def test_plain(self):
+        self.assertEqual(self.report('plain'),
+                         ('Plain list entries:\nr1.a1.local\n', 1))
+
+    def test_rancid(self):
+        self.assertEqual(self.report('rancid'),
+                         ('Rancid router.db entries:\n'
+                          'r1.a1.local;cisco;up\n', 1))
+
+    def test_dns(self):
+        self.assertEqual(self.report('dns'),
+                         ('DNS list entries:\n'
+                          'p1.lenin5\t\t\tIN A\t\t\t10.0.0.1\n', 1))
+
+    def test_nagios(self):
+        self.assertEqual(self.report('nagios'),
+                         ('Nagios list entries:\ndefine host{\n'
+                          '\tuse\t\tgeneric-host\n'
+                          '\thostname\tr1.a1.local\n'
+                          '\talias\t\tDEVICE at Lenina 5\n'
+                          '\taddress\t\t10.0.0.1\n'
+                          '\tparents\t\tGi0/1@r1-core.local up\n}\n\n', 1))
+
+    def test_trac(self):
+        self.assertEqual(self.report('trac'),
+                         ('Trac table entries:\n'
+                          '|| Location || Device model || Domain name || '
+                          'IP address || Link speed ||\n'
+                          '|| Lenina 5 || WS-C2950-24 || r1.a1.local || '
+                          '10.0.0.1 || 100 Mb/s ||\n', 1))
+
+    def test_no_entry(self):
+        device = Device('10.0.0.2')
+        device.dname = None
+        for name in ('plain', 'rancid', 'dns', 'nagios'):
+            self.assertEqual(self.report(name, [device])[1], 0)
+
+
+class AtomicWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'plain.txt')
+        with open(self.path, 'w') as old_file:
+            old_file.write('old\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_replace(self):
+        with AtomicWriter(self.path) as out:
+            out.write('new\n')
+        with open(self.path) as new_file:
+            self.assertEqual(new_file.read(), 'new\n')
+        self.assertEqual(os.listdir(self.workdir), ['plain.txt'])
+
+    def test_failed_write(self):
+        with self.assertRaises(RuntimeError):
+            with AtomicWriter(self.path) as out:
+                out.write('partial\n')
+                raise RuntimeError('DB gone')
+        with open(self.path) as old_file:
+            self.assertEqual(old_file.read(), 'old\n')
+        self.assertEqual(os.listdir(self.workdir), ['plain.txt'])
+
+    def test_gzip(self):
+        path = self.path + '.gz'
+        with AtomicWriter(path) as out:
+            out.write('new\n')
+        with gzip.open(path, 'rt') as new_file:
+            self.assertEqual(new_file.read(), 'new\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
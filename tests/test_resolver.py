@@ -0,0 +1,37 @@
+import socket
+import unittest
+from unittest import mock
+from utils.resolver import CachingResolver
+
+
+class CachingResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.resolver = CachingResolver(concurrency=2, ttl=60)
+
+    def tearDown(self):
+        self.resolver.shutdown()
+
+    def test_answers_cached(self):
+        with mock.patch('socket.gethostbyname',
+                        return_value='10.0.0.1') as lookup:
+            for _ in range(3):
+                self.assertEqual(self.resolver.gethostbyname('sw1.local'),
+                                 '10.0.0.1')
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_errors_cached(self):
+        error = socket.herror(1, 'Unknown host')
+        with mock.patch('socket.gethostbyaddr', side_effect=error) as lookup:
+            for _ in range(2):
+                with self.assertRaises(socket.herror):
+                    self.resolver.gethostbyaddr('10.0.0.1')
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_expired(self):
+        self.resolver.ttl = -1
+        with mock.patch('socket.gethostbyname',
+                        return_value='10.0.0.1') as lookup:
+            self.resolver.submit(self.resolver.gethostbyname,
+                                 'sw1.local').result()
+            self.resolver.gethostbyname('sw1.local')
+        self.assertEqual(lookup.call_count, 2)
@@ -0,0 +1,294 @@
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import importlib
+import contextlib
+from unittest import mock
+import transaction
+from BTrees.OOBTree import OOBTree
+from ZODB import FileStorage, DB
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.indexes import update_indexes
+
+DEVICES = [('10.0.0.1', 'r1.c0.local', 'Lenina 5', 'WS-C2950-24',
+            ['10', '20']),
+           ('10.0.0.2', 'r1.a1.local', 'Lenina 12', 'WS-C2960-24TT-L',
+            ['20']),
+           ('10.0.0.3', 'r1.a2.local', 'lenina 7', 'MES-3124F', ['30']),
+           ('10.0.0.4', 'r1.a3.local', 'Mira 1', 'WS-C2950-24', ['10'])]
+CONF = '''logs_path = {workdir}/logs
+db_name = {workdir}/test.fs
+db_tree = hosts
+'''
+
+
+def setUpModule():
+    '''Make DB & config in temporary directory, settings are loaded on
+    utils.maintools import'''
+    global workdir, cwd, maintools
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    db_name = os.path.join(workdir, 'test.fs')
+    db_check(db_name, 'hosts')
+    db = DB(FileStorage.FileStorage(db_name))
+    connection = db.open()
+    devdb = connection.root()['hosts']
+    for ip, dname, location, model, vlans in DEVICES:
+        device = Device(ip)
+        device.dname = dname
+        device.c_location = location
+        device.c_model = model
+        device.c_vlans = vlans
+        devdb[ip] = device
+    transaction.commit()
+    connection.close()
+    update_indexes(db, 'hosts', [device[0] for device in DEVICES])
+    db.close()
+    Device.new_hosts = []
+    Device.changed_hosts = set()
+    with open(os.path.join(workdir, 'wwmode.conf'), 'w') as conf_file:
+        conf_file.write(CONF.format(workdir=workdir))
+    os.chdir(workdir)
+    maintools = importlib.import_module('utils.maintools')
+    # module can be imported by other tests already, with their config
+    maintools.run_set.db_name = db_name
+    maintools.run_set.db_tree = 'hosts'
+
+
+def tearDownModule():
+    os.chdir(cwd)
+    shutil.rmtree(workdir)
+
+
+class SearchTest(unittest.TestCase):
+    def search(self, *args, **kwargs):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            maintools.search_db(*args, **kwargs)
+        return out.getvalue()
+
+    def found(self, *args, **kwargs):
+        return [line.split()[0] for line in
+                self.search(*args, **kwargs).splitlines()]
+
+    def test_substring(self):
+        self.assertEqual(self.found('full', 'Lenina'),
+                         ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(self.found('c_location', 'Mira'), ['10.0.0.4'])
+
+    def test_trigram(self):
+        # trigram candidates are checked, so case & order of grams matter
+        self.assertEqual(self.found('full', 'nina 1'), ['10.0.0.2'])
+        self.assertEqual(self.found('full', 'anin'), [])
+        self.assertEqual(self.found('full', 'Le'),
+                         ['10.0.0.1', '10.0.0.2'])
+
+    def test_ignore_case(self):
+        self.assertEqual(self.found('full', 'LENINA', ignore_case=True),
+                         ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+    def test_regex(self):
+        self.assertEqual(self.found('c_location', r'^Lenina \d$',
+                                    regex=True), ['10.0.0.1'])
+        self.assertEqual(self.found('c_location', r'^lenina \d+$',
+                                    regex=True, ignore_case=True),
+                         ['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+
+    def test_bad_regex(self):
+        self.assertTrue(self.search('full', 'Lenina (', regex=True).
+                        startswith('Incorrect regular expression'))
+
+    def test_indexed(self):
+        self.assertEqual(self.found('c_model', 'C2950'),
+                         ['10.0.0.1', '10.0.0.4'])
+        self.assertEqual(self.found('c_vlans', '20'),
+                         ['10.0.0.1', '10.0.0.2'])
+
+
+class WithoutIndexesTest(unittest.TestCase):
+    def setUp(self):
+        '''Make DB like one of old version, without secondary indexes'''
+        self.db_name = os.path.join(workdir, 'old.fs')
+        db = DB(FileStorage.FileStorage(self.db_name))
+        connection = db.open()
+        devdb = connection.root()['hosts'] = OOBTree()
+        for ip, dname, location, model, vlans in DEVICES:
+            device = Device(ip)
+            device.dname = dname
+            device.c_location = location
+            devdb[ip] = device
+        transaction.commit()
+        connection.close()
+        db.close()
+        patcher = mock.patch.object(maintools.run_set, 'db_name',
+                                    self.db_name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for suffix in ('', '.index', '.lock', '.tmp'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def last_tid(self):
+        storage = FileStorage.FileStorage(self.db_name, read_only=True)
+        try:
+            return storage.lastTransaction()
+        finally:
+            storage.close()
+
+    def test_search_read_only(self):
+        tid = self.last_tid()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), \
+                self.assertLogs('wwmode_app.utils.utils', 'WARNING'):
+            maintools.search_db('full', 'Lenina')
+        self.assertEqual([line.split()[0] for line in
+                          out.getvalue().splitlines()],
+                         ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(self.last_tid(), tid)
+        self.assertTrue(maintools.db_ready(self.db_name, 'hosts'))
+        self.assertFalse(maintools.db_ready(self.db_name, 'other'))
+
+    def test_delete_record(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            maintools.delete_record('10.0.0.1')
+        db = DB(FileStorage.FileStorage(self.db_name))
+        try:
+            connection = db.open()
+            self.assertNotIn('10.0.0.1', connection.root()['hosts'])
+            connection.close()
+        finally:
+            db.close()
+
+
+class SoftwareTest(unittest.TestCase):
+    JUNOS_PATTERN = r'^(\d+)\.(\d+)([A-Z])(\d+)'
+    FIRMWARE = [('10.0.1.1', 'WS-C2950-24', '12.1(22)EA14', None),
+                ('10.0.1.2', 'WS-C2950-24', '12.1(9)EA1', None),
+                ('10.0.1.3', 'WS-C2950-24', '12.1(22)EA9', None),
+                ('10.0.1.4', 'EX3300-48P', '12.3R12.4', JUNOS_PATTERN),
+                ('10.0.1.5', 'EX3300-48P', '12.3R3', JUNOS_PATTERN),
+                ('10.0.1.6', 'EX3300-48P', '15.1R7', JUNOS_PATTERN)]
+
+    def setUp(self):
+        self.db_name = os.path.join(workdir, 'software.fs')
+        db_check(self.db_name, 'hosts')
+        db = DB(FileStorage.FileStorage(self.db_name))
+        connection = db.open()
+        devdb = connection.root()['hosts']
+        for ip, model, firmware, pattern in self.FIRMWARE:
+            device = Device(ip)
+            device.dname = ''
+            device.c_location = 'Lenina 5'
+            device.c_model = model
+            device.c_firmware = firmware
+            if pattern:
+                device.version_pattern = pattern
+            devdb[ip] = device
+        transaction.commit()
+        connection.close()
+        update_indexes(db, 'hosts', [x[0] for x in self.FIRMWARE])
+        db.close()
+        patcher = mock.patch.object(maintools.run_set, 'db_name',
+                                    self.db_name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for suffix in ('', '.index', '.lock', '.tmp'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def run_cmd(self, func, *args, **kwargs):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            func(*args, **kwargs)
+        return out.getvalue().splitlines()
+
+    def found(self, *args, **kwargs):
+        return [line.split()[0] for line in
+                self.run_cmd(maintools.software_search, *args, **kwargs)]
+
+    def test_older_than(self):
+        self.assertEqual(self.found('2950', '12.1(22)EA10'),
+                         ['10.0.1.2', '10.0.1.3'])
+        self.assertEqual(self.found('2950', '12.1(22)EA10', older=False),
+                         ['10.0.1.1'])
+        # pattern from card ignores part after JUNOS release number
+        self.assertEqual(self.found('ex3300', '12.3R12', older=False),
+                         ['10.0.1.6'])
+        self.assertEqual(self.found('ex3300', '12.3R4'), ['10.0.1.5'])
+
+    def test_outdated(self):
+        self.assertEqual(self.run_cmd(maintools.show_outdated), [
+            'EX3300-48P: 15.1R7',
+            'WS-C2950-24: 12.1(22)EA14',
+            '-' * 30,
+            '10.0.1.5 -  - Lenina 5 - EX3300-48P',
+            '10.0.1.4 -  - Lenina 5 - EX3300-48P',
+            '10.0.1.2 -  - Lenina 5 - WS-C2950-24',
+            '10.0.1.3 -  - Lenina 5 - WS-C2950-24'])
+
+
+class DeviceGeneratorTest(unittest.TestCase):
+    def setUp(self):
+        self.db_name = os.path.join(workdir, 'generator.fs')
+        db_check(self.db_name, 'hosts')
+        db = DB(FileStorage.FileStorage(self.db_name))
+        connection = db.open()
+        devdb = connection.root()['hosts']
+        # more records than one bucket of tree holds
+        self.hosts = ['10.0.{}.{}'.format(x // 50, x % 50)
+                      for x in range(100)]
+        for ip in self.hosts:
+            devdb[ip] = Device(ip)
+        transaction.commit()
+        connection.close()
+        db.close()
+        patcher = mock.patch.object(maintools.run_set, 'db_name',
+                                    self.db_name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for suffix in ('', '.index', '.lock', '.tmp'):
+            if os.path.exists(self.db_name + suffix):
+                os.remove(self.db_name + suffix)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def test_lazy_order(self):
+        loads = []
+        setstate = Device.__setstate__
+
+        def counted(device, state):
+            loads.append(state)
+            setstate(device, state)
+        with mock.patch.object(Device, '__setstate__', counted):
+            devices, ips = [], []
+            for num, dev in enumerate(maintools.device_generator(batch=7)):
+                devices.append(dev)
+                ips.append(dev.ip)
+                # only records already yielded are loaded
+                self.assertEqual(len(loads), num + 1)
+                if num == 7:
+                    # cache is minimized after batch of records
+                    self.assertEqual(devices[0]._p_status, 'ghost')
+        self.assertEqual(ips, sorted(self.hosts))
+
+    def test_hosts(self):
+        hosts = ['10.0.1.2', '10.0.9.9', '10.0.0.1']
+        self.assertEqual([dev.ip for dev in maintools.device_generator(
+            hosts)], ['10.0.1.2', '10.0.0.1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import ipaddress
+from unittest import mock
+import transaction
+from ZODB import FileStorage, DB
+from utils.snmp_fleet import Fleet
+from utils.load_settings import AppSettings, GroupSettings
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.liveness import liveness_key
+from utils import sharded_update
+from utils.sharded_update import apply_result, sharded_update_run
+
+JUNOS_PATTERN = r'^(\d+)\.(\d+)([A-Z])(\d+)'
+PORT = 16163
+WALK = [('1.3.6.1.2.1.1.1.0', '4', 'Cisco IOS C2950 Software'),
+        ('1.3.6.1.2.1.1.6.0', '4', 'Lenina 5'),
+        ('1.3.6.1.2.1.47.1.1.1.1.13.1', '4', 'WS-C2950-24')]
+
+
+class ApplyResultTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.connection = self.db.open()
+        self.devdb = self.connection.root()['hosts']
+        self.liveness = self.connection.root()[liveness_key('hosts')]
+        apply_result(self.devdb, self.liveness, self.result(
+            version_pattern=JUNOS_PATTERN))
+        transaction.commit()
+        Device.changed_hosts = set()
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.seen_hosts = []
+        Device.changed_hosts = set()
+
+    def result(self, **attrs):
+        result = {'ip': '10.0.0.1', 'dname': 'r1.c0.local',
+                  'c_model': 'EX3300-48P', 'vtree': False,
+                  'rancid_type': 'juniper'}
+        result.update(attrs)
+        return result
+
+    def test_card_pattern_dropped(self):
+        apply_result(self.devdb, self.liveness, self.result())
+        self.assertFalse(hasattr(self.devdb['10.0.0.1'], 'version_pattern'))
+        self.assertEqual(Device.changed_hosts, {'10.0.0.1'})
+
+    def test_pattern_kept(self):
+        apply_result(self.devdb, self.liveness, self.result(
+            version_pattern=JUNOS_PATTERN))
+        self.assertEqual(self.devdb['10.0.0.1'].version_pattern,
+                         JUNOS_PATTERN)
+        self.assertEqual(Device.changed_hosts, set())
+
+    def test_no_card(self):
+        apply_result(self.devdb, self.liveness, {
+            'ip': '10.0.0.1', 'dname': 'r1.c0.local',
+            'c_model': 'unrecognized'})
+        self.assertEqual(self.devdb['10.0.0.1'].version_pattern,
+                         JUNOS_PATTERN)
+
+
+class ShardedRunTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.app_settings = AppSettings()
+        self.group_settings = GroupSettings('test')
+        self.hosts = [ipaddress.ip_address('127.0.0.1'),
+                      ipaddress.ip_address('127.0.0.2')]
+        self.fleet = Fleet([x.exploded for x in self.hosts], [WALK],
+                           [(0, {}), (0, {})], port=PORT)
+        self.fleet.start()
+
+    def tearDown(self):
+        self.fleet.stop()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.seen_hosts = []
+        Device.changed_hosts = set()
+
+    def run_broken(self, broken, timeout=600):
+        '''Run update by two pollers, second one calls broken instead of
+        polling its host'''
+        poll_host = sharded_update.poll_host
+
+        def fake_poll(snmp_getter, ip, settings, resolver):
+            if ip == '127.0.0.2':
+                broken()
+            return poll_host(snmp_getter, ip, settings, resolver)
+        with mock.patch.object(sharded_update, 'poll_host', fake_poll):
+            with self.assertLogs('wwmode_app.utils.sharded_update',
+                                 'ERROR') as logs:
+                sharded_update_run(self.hosts, self.app_settings,
+                                   self.group_settings, self.db, 2, 1,
+                                   timeout=timeout, port=PORT)
+        connection = self.db.open()
+        try:
+            self.assertEqual(list(connection.root()['hosts'].keys()),
+                             ['127.0.0.1'])
+        finally:
+            connection.close()
+        return logs.output
+
+    def test_poller_crash(self):
+        output = self.run_broken(lambda: os._exit(3))
+        self.assertIn('Poller 1 died with exit code 3', output[0])
+
+    def test_poller_hang(self):
+        started = time.monotonic()
+        output = self.run_broken(lambda: time.sleep(60), timeout=5)
+        self.assertIn('No results from pollers [1]', output[0])
+        self.assertLess(time.monotonic() - started, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from pysnmp.hlapi import SnmpEngine
+from pysnmp.hlapi.v3arch.asyncio import SnmpEngine
 import utils.snmpget
 
 
@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+from utils.snmp_fleet import Fleet
+from utils import profiler, snmpget
+from utils.load_settings import AppSettings
+from utils.snmpget import table_fetch, make_engine, close_engine
+
+PORT = 16162
+IF_ALIAS = '1.3.6.1.2.1.31.1.1.1.18'
+IF_HIGH_SPEED = '1.3.6.1.2.1.31.1.1.1.15'
+WALK = [('{}.{}'.format(IF_ALIAS, port), '4', 'port {}'.format(port))
+        for port in range(1, 24)]
+WALK += [('{}.{}'.format(IF_HIGH_SPEED, port), '66', '100')
+         for port in range(1, 24)]
+
+
+class TableFetchTest(unittest.TestCase):
+    def setUp(self):
+        self.fleet = Fleet(['127.0.0.1'], [WALK], [(0, {})], port=PORT)
+        self.fleet.start()
+        self.engine = make_engine()
+        self.profile = profiler.start_profile()
+
+    def tearDown(self):
+        profiler.stop_profile()
+        close_engine(self.engine)
+        self.fleet.stop()
+
+    def test_requests_counted(self):
+        # 23 rows by 10 in request: two full pages & short last one
+        table = table_fetch(self.engine, 'public', '127.0.0.1',
+                            [IF_ALIAS, IF_HIGH_SPEED], max_repetitions=10,
+                            port=PORT)
+        self.assertEqual(len(table), 23)
+        self.assertEqual(table['23'], {IF_ALIAS: 'port 23',
+                                       IF_HIGH_SPEED: '100'})
+        requests = self.fleet.collect()['127.0.0.1'][2]
+        self.assertEqual(requests, 3)
+        for oid in (IF_ALIAS, IF_HIGH_SPEED):
+            self.assertEqual(self.profile.oids[oid][0], requests)
+            self.assertEqual(len(self.profile.oids[oid][2]), requests)
+
+    def test_repeated_rows(self):
+        pages = []
+
+        async def repeating_bulk(*args):
+            # agent which answers every request with its first page
+            if len(pages) > 5:
+                raise RuntimeError('fetch is not finished')
+            if not pages:
+                pages.append(await bulk_cmd(*args))
+            pages.append(pages[0])
+            return pages[0]
+        bulk_cmd = snmpget.bulk_cmd
+        with mock.patch.object(snmpget, 'bulk_cmd', repeating_bulk):
+            with self.assertLogs('wwmode_app.utils.snmpget', 'WARNING'):
+                table = table_fetch(self.engine, 'public', '127.0.0.1',
+                                    [IF_ALIAS, IF_HIGH_SPEED],
+                                    max_repetitions=10, port=PORT)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(table, key=int),
+                         [str(x) for x in range(1, 11)])
+
+
+class MaxRepetitionsTest(unittest.TestCase):
+    def test_parse(self):
+        settings = AppSettings()
+        settings.parse_param('max_repetitions = 40', settings)
+        self.assertEqual(settings.max_repetitions, 40)
+        for value in ('many', '0'):
+            settings.parse_param('max_repetitions = ' + value, settings)
+            self.assertEqual(settings.max_repetitions, 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import transaction
+from ZODB import FileStorage, DB
+from utils.dbutils import db_check
+from utils.update_db import Device
+from utils.indexes import DeviceIndexes, update_indexes
+from utils import topology as topology_module
+from utils.topology import (Topology, full_dname, vlan_chain, vlan_gaps,
+                            topology_key, update_topology)
+
+
+class TopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.topology = Topology()
+        self.topology.set_uplinks('10.0.0.2', ('10.0.0.1', ))
+        self.topology.set_uplinks('10.0.0.3', ('10.0.0.2', ), ('ghost', ))
+        self.topology.set_uplinks('10.0.0.4', ('10.0.0.5', ))
+        self.topology.set_uplinks('10.0.0.5', ('10.0.0.4', '10.0.0.1'))
+
+    def test_chain(self):
+        self.assertEqual(self.topology.chain('10.0.0.3'), [
+            (0, '10.0.0.3', 'ok'), (1, 'ghost', 'unresolved'),
+            (1, '10.0.0.2', 'ok'), (2, '10.0.0.1', 'ok')])
+
+    def test_cycle(self):
+        self.assertEqual(self.topology.chain('10.0.0.4'), [
+            (0, '10.0.0.4', 'ok'), (1, '10.0.0.5', 'ok'),
+            (2, '10.0.0.4', 'cycle'), (2, '10.0.0.1', 'ok')])
+
+    def test_diamond(self):
+        topology = Topology()
+        for num in range(30):
+            top, left, right, bottom = ['{}.{}'.format(num, x)
+                                        for x in 'abcd']
+            topology.set_uplinks(top, (left, right))
+            topology.set_uplinks(left, (bottom, ))
+            topology.set_uplinks(right, (bottom, ))
+            topology.set_uplinks(bottom, ('{}.a'.format(num + 1), ))
+        self.assertEqual(topology.chain('0.a')[:6], [
+            (0, '0.a', 'ok'), (1, '0.b', 'ok'), (2, '0.d', 'ok'),
+            (3, '1.a', 'ok'), (4, '1.b', 'ok'), (5, '1.d', 'ok')])
+        self.assertIn((1, '0.c', 'ok'), topology.chain('0.a'))
+        self.assertIn((2, '0.d', 'seen'), topology.chain('0.a'))
+        self.assertEqual(len(topology.chain('0.a')), 30 * 5 + 1)
+
+    def test_remove(self):
+        self.topology.remove('10.0.0.2')
+        self.assertNotIn('10.0.0.2', self.topology.down)
+        self.assertEqual(self.topology.chain('10.0.0.3'), [
+            (0, '10.0.0.3', 'ok'), (1, 'ghost', 'unresolved'),
+            (1, '10.0.0.2', 'unresolved')])
+
+    def test_downstream(self):
+        self.assertEqual(self.topology.downstream('10.0.0.1'), [
+            (1, '10.0.0.2'), (1, '10.0.0.5'), (2, '10.0.0.3'),
+            (2, '10.0.0.4')])
+        self.topology.remove('10.0.0.2')
+        self.assertEqual(self.topology.downstream('10.0.0.1'), [
+            (1, '10.0.0.5'), (2, '10.0.0.4')])
+
+    def test_full_dname(self):
+        self.assertEqual(full_dname('sw1', 'r1', 'local'), 'r1.sw1.local')
+        self.assertEqual(full_dname('r1.sw1', 'r1', 'local'), 'r1.sw1.local')
+
+    def test_vlans(self):
+        indexes = DeviceIndexes()
+        for ip, vlans in (('10.0.0.1', ['10']), ('10.0.0.2', ['10', '20']),
+                          ('10.0.0.3', ['10', '20', '300'])):
+            indexes.reindex(SimpleNamespace(ip=ip, c_vlans=vlans))
+        self.assertEqual(vlan_chain(self.topology, indexes, '20'), [
+            (0, '10.0.0.2', ('10.0.0.1', )), (1, '10.0.0.3', ())])
+        self.assertEqual(vlan_gaps(self.topology, indexes, '10.0.0.3'),
+                         ['300'])
+        self.assertEqual(vlan_gaps(self.topology, indexes, '10.0.0.1'), [])
+
+
+class UpdateTopologyTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        db_name = os.path.join(self.workdir, 'test.fs')
+        db_check(db_name, 'hosts')
+        self.db = DB(FileStorage.FileStorage(db_name))
+        self.settings = SimpleNamespace(
+            uplink_pattern=r'^\S+@(?P<device>\S+) up$', domain_prefix='r1',
+            default_zone='local')
+        self.connection = self.db.open()
+        self.devdb = self.connection.root()['hosts']
+        for num, uplink in ((1, None), (2, 'core'), (3, 'sw2'), (4, 'sw9')):
+            device = Device('10.0.0.{}'.format(num))
+            device.dname = 'r1.{}.local'.format('core' if num == 1 else
+                                                'sw{}'.format(num))
+            if uplink:
+                device.c_uplinks = [('Gi0/1@{} up'.format(uplink),
+                                     '1000 Mb/s')]
+            self.devdb[device.ip] = device
+        transaction.commit()
+        self.update()
+
+    def tearDown(self):
+        transaction.abort()
+        self.connection.close()
+        self.db.close()
+        shutil.rmtree(self.workdir)
+        Device.new_hosts = []
+        Device.changed_hosts = set()
+
+    def update(self):
+        update_indexes(self.db, 'hosts', list(self.devdb.keys()))
+        with mock.patch.object(topology_module, 'parse_uplinks',
+                               wraps=topology_module.parse_uplinks) as parse:
+            update_topology(self.db, 'hosts', self.settings)
+        self.connection.sync()
+        return sorted(call[0][0].ip for call in parse.call_args_list)
+
+    def topology(self):
+        return self.connection.root()[topology_key('hosts')]
+
+    def test_changed_only(self):
+        self.assertEqual(self.topology().chain('10.0.0.3'), [
+            (0, '10.0.0.3', 'ok'), (1, '10.0.0.2', 'ok'),
+            (2, '10.0.0.1', 'ok')])
+        self.devdb['10.0.0.3'].c_uplinks = [('Gi0/1@core up', '1000 Mb/s')]
+        transaction.commit()
+        # device with unresolved uplink is parsed on every run
+        self.assertEqual(self.update(), ['10.0.0.3', '10.0.0.4'])
+        self.assertEqual(self.topology().up['10.0.0.3'], ('10.0.0.1', ))
+        self.assertEqual(self.update(), ['10.0.0.4'])
+
+    def test_new_uplink_device(self):
+        self.assertEqual(self.topology().unresolved['10.0.0.4'], ('sw9', ))
+        device = Device('10.0.0.9')
+        device.dname = 'r1.sw9.local'
+        self.devdb[device.ip] = device
+        transaction.commit()
+        self.update()
+        self.assertEqual(self.topology().up['10.0.0.4'], ('10.0.0.9', ))
+        self.assertNotIn('10.0.0.4', self.topology().unresolved)
@@ -0,0 +1,37 @@
+import random
+import unittest
+from lexicon.translate import (build_dict, compile_schema, convert,
+                               convert_many, translit)
+
+
+class CompiledSchemaTest(unittest.TestCase):
+    schemas = ('custom_ascii_latin', 'custom_switch_location',
+               'iso9_system_A', 'iso9_system_B')
+
+    def test_same_as_translit(self):
+        rand = random.Random(0)
+        for schema in self.schemas:
+            for conv_from in ('cyr', 'lat'):
+                for dict_direction in ('standart', 'reverse'):
+                    dictionary = build_dict(conv_from, schema,
+                                            dict_direction, ' = ')
+                    compiled = compile_schema(conv_from, schema,
+                                              dict_direction, ' = ')
+                    letters = ''.join(dictionary) + ''.join(
+                        dictionary.values())
+                    letters += letters.upper() + ' ,.-1`'
+                    for _ in range(500):
+                        text = ''.join(rand.choice(letters) for _ in range(
+                            rand.randint(0, 20)))
+                        start = rand.randint(0, len(text))
+                        end = rand.randint(start, len(text))
+                        self.assertEqual(
+                            compiled.translit(text, start, end),
+                            translit(text, start, end, dictionary), text)
+
+    def test_convert_many(self):
+        texts = ['Moskva, ul. Shhukinskaya', 'Sankt-Peterburg y``', '']
+        self.assertEqual(
+            convert_many(texts, conv_from='lat', schema='iso9_system_B'),
+            [convert(text, conv_from='lat', schema='iso9_system_B')
+             for text in texts])
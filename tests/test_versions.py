@@ -0,0 +1,21 @@
+import unittest
+from utils.versions import version_key
+
+
+class VersionKeyTest(unittest.TestCase):
+    def test_natural_order(self):
+        versions = ['12.2(55)SE12', '12.2(9)', '12.2(55)SE', '12.1(22)EA14',
+                    '12.2(55)SE5']
+        self.assertEqual(sorted(versions, key=version_key), [
+            '12.1(22)EA14', '12.2(9)', '12.2(55)SE', '12.2(55)SE5',
+            '12.2(55)SE12'])
+
+    def test_pattern(self):
+        pattern = r'^(\d+)\.(\d+)([A-Z])(\d+)(?:-S(\d+))?(?:\.(\d+))?'
+        versions = ['15.1R7-S6.3', '15.1R7.5', '12.3R12.4', '12.3R6.6']
+        self.assertEqual(
+            sorted(versions, key=lambda x: version_key(x, pattern)),
+            ['12.3R6.6', '12.3R12.4', '15.1R7.5', '15.1R7-S6.3'])
+
+    def test_pattern_mismatch(self):
+        self.assertEqual(version_key('beta', r'^(\d+)'), version_key('beta'))
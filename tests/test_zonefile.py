@@ -0,0 +1,69 @@
+import os.path
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from utils.resolver import CachingResolver
+from utils.update_db import check_domain
+from utils.zonefile import load_zones
+
+ZONES = os.path.join(os.path.dirname(__file__), 'zones')
+
+
+class ZoneFileTest(unittest.TestCase):
+    def setUp(self):
+        self.zones = load_zones([
+            os.path.join(ZONES, 'r1.local.zone'),
+            os.path.join(ZONES, 'mon.local.axfr'),
+            os.path.join(ZONES, '0.0.10.in-addr.arpa.zone') +
+            ':0.0.10.in-addr.arpa'])
+        self.settings = SimpleNamespace(supply_zone='mon.local',
+                                        default_zone='r1.local')
+
+    def test_records(self):
+        self.assertEqual(self.zones.gethostbyname('sw2.r1.local.'),
+                         '10.0.0.2')
+        self.assertEqual(self.zones.gethostbyname('www.r1.local'),
+                         '10.0.0.1')
+        self.assertEqual(self.zones.gethostbyaddr('10.0.0.1')[0],
+                         'sw1.r1.local')
+        self.assertTrue(self.zones.covers('sw9.mon.local'))
+        self.assertFalse(self.zones.covers('sw1.branch.r1.local'))
+        self.assertFalse(self.zones.covers('example.com'))
+
+    def test_loaded_child_zone(self):
+        branch = os.path.join(ZONES, 'branch.r1.local.zone')
+        parent = os.path.join(ZONES, 'r1.local.zone')
+        for paths in ([branch, parent], [parent, branch]):
+            zones = load_zones(paths)
+            self.assertTrue(zones.covers('sw1.branch.r1.local'))
+            self.assertEqual(zones.gethostbyname('sw1.branch.r1.local'),
+                             '10.0.1.1')
+
+    def test_external_alias(self):
+        resolver = CachingResolver(zones=self.zones)
+        with mock.patch('socket.gethostbyname',
+                        return_value='192.0.2.1') as lookup:
+            self.assertEqual(resolver.gethostbyname('ext.r1.local'),
+                             '192.0.2.1')
+            self.assertEqual(resolver.gethostbyname('www.r1.local'),
+                             '10.0.0.1')
+        resolver.shutdown()
+        lookup.assert_called_once_with('www.example.com')
+
+    def test_checks_without_lookups(self):
+        resolver = CachingResolver(zones=self.zones)
+        with mock.patch('socket.gethostbyaddr', side_effect=AssertionError), \
+                mock.patch('socket.gethostbyname', side_effect=AssertionError):
+            with self.assertLogs('wwmode_app.utils.update_db') as logs:
+                names = [check_domain('10.0.0.{}'.format(num), self.settings,
+                                      resolver) for num in range(1, 6)]
+        resolver.shutdown()
+        self.assertEqual(names, ['sw1.r1.local', 'sw2.r1.local',
+                                 'sw3.r1.local', 'sw4.r1.local', ''])
+        self.assertEqual([record.getMessage() for record in logs.records], [
+            '10.0.0.2: DNS: no domain name in mon.local zone',
+            '10.0.0.3: DNS: A record not same as PTR',
+            '10.0.0.3: DNS: no domain name in mon.local zone',
+            '10.0.0.4: DNS: No A record on received PTR',
+            '10.0.0.4: DNS: no domain name in mon.local zone',
+            '10.0.0.5: DNS: No PTR record for that host'])
@@ -0,0 +1,322 @@
+import logging
+import re
+import time
+from pysnmp.hlapi.v3arch.asyncio import (
+    CommunityData, ContextData, UdpTransportTarget, ObjectIdentity,
+    ObjectType, get_cmd, next_cmd, bulk_cmd)
+from utils.snmpget import (process_output, pretty_value, AdaptiveWalk,
+                           join_columns, oid_tuple, count_request,
+                           SYS_OBJECT_ID_OID)
+
+
+m_logger = logging.getLogger('wwmode_app.utils.async_snmpget')
+
+
+class AsyncSnmpGetter:
+    '''Class for retriving params from hosts with PySNMP asyncio API. Mirror
+    utils.snmpget.SnmpGetter, but every sget_* method is a coroutine, so many
+    hosts can be polled by one event loop
+    args:
+        engine - PySNMP engine
+        settings - load_settings.FakeSettings instance
+        port - UDP port of hosts (DEFAULT - 161)
+    methods:
+        overloaded __init__
+        sget_sys_description
+        sget_sys_ids
+        sget_equal
+        sget_scalars
+        sget_uplink_list
+        sget_vlan_list
+    '''
+    def __init__(self, engine, settings, port=161):
+        '''Initialize instance
+        args:
+            engine - PySNMP engine
+            settings - load_settings.FakeSettings instance
+            port - UDP port of hosts (DEFAULT - 161)
+        No return value
+        overloaded
+        '''
+        self.engine = engine
+        self.settings = settings
+        self.port = port
+
+    async def sget_sys_description(self, ip):
+        '''Get host sysDescr value by SNMP get
+        args:
+            ip - IP address of host
+        return:
+            value - sysDescr value or None if request failed
+        '''
+        oid, value = await async_get(self.engine, self.settings.ro_community,
+                                     ip, 'sysDescr', mib='SNMPv2-MIB',
+                                     port=self.port)
+        return value
+
+    async def sget_sys_ids(self, ip, object_id=True):
+        '''Get host sysDescr & sysObjectID values by one SNMP get
+        args:
+            ip - IP address of host
+            object_id - request sysObjectID too (DEFAULT - True)
+        return:
+            tuple of sysDescr value & sysObjectID value, None for failed or
+            not requested ones
+        '''
+        if not object_id:
+            return await self.sget_sys_description(ip), None
+        transport = await UdpTransportTarget.create((ip, self.port))
+        started = time.perf_counter()
+        error_indication, error_status, error_index, var_binds = await get_cmd(
+            self.engine, CommunityData(self.settings.ro_community),
+            transport, ContextData(),
+            ObjectType(ObjectIdentity('SNMPv2-MIB', 'sysDescr', 0)),
+            ObjectType(ObjectIdentity(SYS_OBJECT_ID_OID)))
+        count_request(['SNMPv2-MIB::sysDescr', SYS_OBJECT_ID_OID], started,
+                      error_indication)
+        oid, value = process_output(error_indication, error_status,
+                                    error_index, var_binds, ip)
+        if value is None or len(var_binds) < 2:
+            return value, None
+        # prettyPrint gives name from MIB, cards keep numerical OID
+        return value, str(var_binds[1][1])
+
+    async def sget_equal(self, device, param, oid):
+        '''Get parameter from host by running SNMP get request & set it to
+        device object
+        args:
+            device - Device object
+            param - requested parameter name
+            oid - SNMP OID
+        No return value
+        '''
+        oid, result = await async_get(self.engine, self.settings.ro_community,
+                                      device.ip, oid, port=self.port)
+        setattr(device, 'c_' + param, result)
+
+    async def sget_scalars(self, device, params):
+        '''Get several parameters from host by running one SNMP get request
+        with all OIDs & set them to device object. Parameter which request
+        failed keeps value stored before, or set to None if there is none
+        args:
+            device - Device object
+            params - list of tuples (parameter name, SNMP OID)
+        No return value
+        '''
+        results = await async_get_many(
+            self.engine, self.settings.ro_community, device.ip,
+            [oid for param, oid in params], port=self.port)
+        for (param, oid), result in zip(params, results):
+            if result is not None or not hasattr(device, 'c_' + param):
+                setattr(device, 'c_' + param, result)
+
+    async def sget_uplink_list(self, device, param, oid):
+        '''Get list of uplink descriptions and speed of appropriate interface
+        from host by fetching ifAlias & ifHighSpeed columns in one table
+        request & set list to device object
+        args:
+            device - Device object
+            param - requested parameter name
+            oid - SNMP OID
+        No return value
+        '''
+        all_uplinks = []
+        if_table = await async_table_fetch(
+            self.engine, self.settings.ro_community, device.ip,
+            ['ifAlias', 'ifHighSpeed'], mib='IF-MIB',
+            max_repetitions=self.settings.max_repetitions,
+            port=self.port)
+        for if_index, row in if_table.items():
+            if_descr = row.get('ifAlias')
+            if if_descr and re.match(self.settings.uplink_pattern, if_descr):
+                if_speed = str(row.get('ifHighSpeed')) + ' Mb/s'
+                all_uplinks.append((if_descr, if_speed))
+        setattr(device, 'c_' + param, all_uplinks)
+
+    async def sget_vlan_list(self, device, param, oid):
+        '''Get list of VLANs from host by running SNMP walk request & set list
+        to device object
+        args:
+            device - Device object
+            param - requested parameter name
+            oid - SNMP OID
+        No return value
+        '''
+        all_vlans = []
+        async for oid, vlan in async_tree_walk(
+                self.engine, self.settings.ro_community, device.ip, oid,
+                max_repetitions=self.settings.max_repetitions,
+                port=self.port):
+            if not oid:
+                m_logger.warning(
+                    'No OID when running tree walk at {} on {}'.format(
+                        oid, device.ip))
+                continue
+            if device.vtree:
+                vlan = oid.split('.')[-1]
+            if vlan not in self.settings.unneded_vlans:
+                all_vlans.append(vlan)
+        setattr(device, 'c_' + param, all_vlans)
+
+
+def make_identity(oid, mib=None, index=None):
+    '''Build ObjectIdentity from numerical OID or names of MIB & OID with
+    optional index
+    Args:
+        oid - OID to query for
+        mib - MIB to query for (DEFAULT - None)
+        index - OID index to query for (DEFAULT - None)
+    Return:
+        ObjectIdentity instance
+    '''
+    object_identity = (mib, oid) if mib else (oid, )
+    if index is not None:
+        object_identity += (index, )
+    return ObjectIdentity(*object_identity)
+
+
+async def async_get(engine, community, address, oid, mib=None, index=0,
+                    port=161):
+    '''Send SNMP GET query & process response with process_output function
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+        community - SNMP community for reading
+        address - IPv4 address of host
+        oid - OID to query for
+        mib - MIB to query for (DEFAULT - None)
+        index - OID index to query for, used only with MIB (DEFAULT - 0)
+        port - UDP port (DEFAULT - 161)
+    Return:
+        result of process_output
+    '''
+    object_identity = make_identity(oid, mib, index if mib else None)
+    transport = await UdpTransportTarget.create((address, port))
+    started = time.perf_counter()
+    error_indication, error_status, error_index, var_binds = await get_cmd(
+        engine, CommunityData(community), transport, ContextData(),
+        ObjectType(object_identity))
+    count_request(['{}::{}'.format(mib, oid) if mib else oid], started,
+                  error_indication)
+    return process_output(error_indication, error_status, error_index,
+                          var_binds, address)
+
+
+async def async_get_many(engine, community, address, oids, port=161):
+    '''Coroutine analog of utils.snmpget.get_many. Send one GET request for
+    several OIDs, split it in halves on error
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+        community - SNMP community for reading
+        address - IPv4 address of host
+        oids - list of numerical OIDs to query for
+        port - UDP port (DEFAULT - 161)
+    Return:
+        list of values in order of OIDs, None for failed ones
+    '''
+    if not oids:
+        return []
+    transport = await UdpTransportTarget.create((address, port))
+    started = time.perf_counter()
+    error_indication, error_status, error_index, var_binds = await get_cmd(
+        engine, CommunityData(community), transport, ContextData(),
+        *[ObjectType(ObjectIdentity(oid)) for oid in oids])
+    count_request(oids, started, error_indication)
+    if error_status and len(oids) > 1:
+        m_logger.debug('{} for {} OIDs at {}, split request'.format(
+            error_status.prettyPrint(), len(oids), address))
+        half = len(oids) // 2
+        return (await async_get_many(engine, community, address, oids[:half],
+                                     port) +
+                await async_get_many(engine, community, address, oids[half:],
+                                     port))
+    if error_indication or error_status:
+        process_output(error_indication, error_status, error_index,
+                       var_binds, address)
+        return [None] * len(oids)
+    return [pretty_value(value) for name, value in var_binds]
+
+
+async def async_tree_walk(engine, community, address, oid, mib=None,
+                          bulk=True, max_repetitions=50, port=161):
+    '''Coroutine analog of utils.snmpget.tree_walk. Simulate SNMP WALK
+    behaviour by sending GETBULK (or GETNEXT) requests with AdaptiveWalk
+    state until response leave requested subtree
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+        community - SNMP community for reading
+        address - IPv4 address of host
+        oid - OID to query for
+        mib - MIB to query for (DEFAULT - None)
+        bulk - use GETBULK requests (DEFAULT - True)
+        max_repetitions - upper limit of rows in one GETBULK response
+            (DEFAULT - 50)
+        port - UDP port (DEFAULT - 161)
+    Yield:
+        result of process_output; (None, None) on error, after which walk
+        stops
+    '''
+    walk = AdaptiveWalk(ObjectType(make_identity(oid, mib)),
+                        max_repetitions=max_repetitions, bulk=bulk)
+    transport = await UdpTransportTarget.create((address, port))
+    request_oid = '{}::{}'.format(mib, oid) if mib else oid
+    while not walk.done:
+        started = time.perf_counter()
+        if walk.repetitions:
+            error_indication, error_status, error_index, var_binds = (
+                await bulk_cmd(engine, CommunityData(community), transport,
+                               ContextData(), 0, walk.repetitions,
+                               walk.next_request()))
+        else:
+            error_indication, error_status, error_index, var_binds = (
+                await next_cmd(engine, CommunityData(community), transport,
+                               ContextData(), walk.next_request()))
+        count_request([request_oid], started, error_indication)
+        if error_indication or error_status:
+            if walk.retry_on_error(error_indication, error_status):
+                continue
+            yield process_output(error_indication, error_status, error_index,
+                                 var_binds, address)
+            return
+        for row in walk.accept(var_binds):
+            yield process_output(None, None, None, [row], address)
+
+
+async def async_table_fetch(engine, community, address, columns, mib=None,
+                            max_repetitions=25, port=161):
+    '''Coroutine analog of utils.snmpget.table_fetch. Fetch several columns
+    of SNMP table with GETBULK requests & join values by row index
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+        community - SNMP community for reading
+        address - IPv4 address of host
+        columns - list of column names or numerical OIDs
+        mib - MIB to query for (DEFAULT - None)
+        max_repetitions - rows requested in one GETBULK (DEFAULT - 25)
+        port - UDP port (DEFAULT - 161)
+    Return:
+        table - dictionary with row index as key and dictionary of
+            column: value as value
+    '''
+    table = {}
+    transport = await UdpTransportTarget.create((address, port))
+    var_binds = [ObjectType(make_identity(column, mib)) for column in columns]
+    request_oids = ['{}::{}'.format(mib, x) if mib else x for x in columns]
+    active = list(range(len(columns)))
+    bases = None
+    last = {}
+    while active:
+        started = time.perf_counter()
+        error_indication, error_status, error_index, var_bind_table = (
+            await bulk_cmd(engine, CommunityData(community), transport,
+                           ContextData(), 0, max_repetitions, *var_binds))
+        count_request(request_oids, started, error_indication)
+        if error_indication or error_status:
+            process_output(error_indication, error_status, error_index,
+                           var_bind_table, address)
+            break
+        if bases is None:
+            # ObjectTypes are resolved against MIB by first request
+            bases = [oid_tuple(x[0]) for x in var_binds]
+        active, var_binds = join_columns(table, columns, bases, active,
+                                         var_bind_table, last)
+    return table
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+import transaction
+from utils.snmpget import make_engine
+from utils.async_snmpget import AsyncSnmpGetter
+from utils.liveness import liveness_key
+from utils.update_db import (register_device, check_domain, choose_card,
+                             card_matcher, apply_card, split_requests)
+from utils import profiler
+
+
+m_logger = logging.getLogger('wwmode_app.utils.async_update')
+
+
+async def async_worker(queue, settings, devdb, liveness, snmp_getter,
+                       resolver=None):
+    '''Coroutine analog of utils.update_db.worker. Get hosts from asyncio
+    Queue, poll them & update or create records in database. All workers
+    share one connection to database, as they run in one thread. Error in
+    polling of one host is logged & worker go on, so queue is always joined
+    Args:
+        queue - instance of asyncio.Queue class which hold all hosts
+        settings - instance of utils.load_settings.FakeSettings
+        devdb - database tree with device records
+        liveness - utils.liveness.Liveness instance
+        snmp_getter - instance of utils.async_snmpget.AsyncSnmpGetter
+        resolver - utils.resolver.CachingResolver instance (DEFAULT - None)
+    No return value
+    '''
+    while True:
+        host = await queue.get()
+        try:
+            if host is None:
+                break
+            await async_poll_host(host, settings, devdb, liveness,
+                                  snmp_getter, resolver)
+        except Exception as exc:
+            m_logger.error('Polling of {} failed: {!r}'.format(host, exc))
+        finally:
+            queue.task_done()
+
+
+async def async_poll_host(host, settings, devdb, liveness, snmp_getter,
+                          resolver=None):
+    '''Poll one host & update or create its record. DNS lookups are
+    blocking, so they run in resolver pool (or default executor of event
+    loop without it) alongside SNMP requests
+    Args:
+        host - ipaddress.IPv4Address instance
+        settings - instance of utils.load_settings.FakeSettings
+        devdb - database tree with device records
+        liveness - utils.liveness.Liveness instance
+        snmp_getter - instance of utils.async_snmpget.AsyncSnmpGetter
+        resolver - utils.resolver.CachingResolver instance (DEFAULT - None)
+    No return value
+    '''
+    loop = asyncio.get_event_loop()
+    profile = profiler.active
+    started = time.perf_counter()
+    with profile.timer('sysdescr'):
+        sys_descr, sys_object_id = await snmp_getter.sget_sys_ids(
+            host.exploded, bool(card_matcher.object_ids))
+    if not sys_descr:
+        profile.host('no answer', time.perf_counter() - started)
+        return
+    device = register_device(devdb, host.exploded, liveness)
+    # resolver must not touch records from other thread, so only name is
+    # checked there & it's set here
+    if resolver:
+        dns = asyncio.wrap_future(resolver.submit(
+            check_domain, device.ip, settings, resolver))
+    else:
+        dns = loop.run_in_executor(None, check_domain, device.ip, settings)
+    with profile.timer('card'):
+        dev_card = choose_card(device.ip, sys_descr, settings, sys_object_id)
+    scalars, requests = split_requests(dev_card, settings)
+    with profile.timer('scalars'):
+        await snmp_getter.sget_scalars(device, scalars)
+    if settings.location_transliteration != 'straight':
+        with profile.timer('translit'):
+            device.translit_location(settings.location_transliteration)
+    if dev_card:
+        apply_card(device, dev_card)
+        for param, method, oid in requests:
+            with profile.timer(method):
+                await getattr(snmp_getter, method)(device, param, oid)
+        m_logger.info('{} ----> {}'.format(host, device.c_model))
+    else:
+        device.c_model = 'unrecognized'
+        m_logger.info('{} unrecognized...'.format(host))
+    with profile.timer('dns_wait'):
+        device.set_domain_name(await dns)
+    profile.host(device.c_model or 'unknown', time.perf_counter() - started)
+
+
+async def sweep(hosts, settings, devdb, liveness, concurrency,
+                resolver=None, port=161):
+    '''Start async workers, feed them with hosts & wait till all of them
+    would be polled
+    Args:
+        hosts - list of ipaddress.IPv4Address instances
+        settings - instance of utils.load_settings.FakeSettings
+        devdb - database tree with device records
+        liveness - utils.liveness.Liveness instance
+        concurrency - number of hosts polled simultaneously
+        resolver - utils.resolver.CachingResolver instance (DEFAULT - None)
+        port - UDP port of hosts (DEFAULT - 161)
+    No return value
+    '''
+    queue = asyncio.Queue()
+    snmp_getter = AsyncSnmpGetter(make_engine(), settings, port)
+    workers = [asyncio.ensure_future(
+        async_worker(queue, settings, devdb, liveness, snmp_getter,
+                     resolver))
+        for _ in range(concurrency)]
+    for item in hosts:
+        queue.put_nowait(item)
+    for _ in range(concurrency):
+        queue.put_nowait(None)
+    await queue.join()
+    await asyncio.gather(*workers)
+    snmp_getter.engine.close_dispatcher()
+
+
+def async_update_run(hosts, settings, db, concurrency, resolver=None,
+                     port=161):
+    '''Poll all hosts with one event loop & commit results. Event loop run in
+    current thread, so it can safely share one database connection
+    Args:
+        hosts - list of ipaddress.IPv4Address instances
+        settings - instance of utils.load_settings.FakeSettings
+        db - instance of ZODB.DB class
+        concurrency - upper limit of hosts polled simultaneously
+        resolver - utils.resolver.CachingResolver instance (DEFAULT - None)
+        port - UDP port of hosts (DEFAULT - 161)
+    No return value
+    '''
+    if concurrency > len(hosts):
+        concurrency = len(hosts)
+    if not concurrency:
+        return
+    connection = db.open()
+    devdb = connection.root()[settings.db_tree]
+    liveness = connection.root()[liveness_key(settings.db_tree)]
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(sweep(hosts, settings, devdb, liveness,
+                                      concurrency, resolver, port))
+        with profiler.active.timer('commit'):
+            transaction.commit()
+    finally:
+        loop.close()
+        connection.close()
@@ -1,7 +1,10 @@
 import logging
 import datetime
+import os.path
 import transaction
 from ZODB import FileStorage, DB
+from utils.liveness import Liveness, liveness_key
+from utils.indexes import build_indexes, indexes_key
 
 m_logger = logging.getLogger('wwmode_app.utils.dbutils')
 
@@ -55,8 +58,9 @@ class DBOpen:
 
 
 def db_check(db_name, db_tree):
-    '''Create database tree if it doesn't exist. Get tree name and db from
-    loaded configuration file
+    '''Create database tree, storage of device presence on runs & secondary
+    indexes if they don't exist. Get tree name and db from loaded
+    configuration file
     No args and return value
     '''
     with DBOpen(db_name) as connection:
@@ -66,6 +70,30 @@ def db_check(db_name, db_tree):
             from BTrees.OOBTree import OOBTree
             dbroot[db_tree] = OOBTree()
             transaction.commit()
+        if liveness_key(db_tree) not in dbroot:
+            m_logger.info('Create new liveness storage')
+            dbroot[liveness_key(db_tree)] = Liveness()
+            transaction.commit()
+        if (indexes_key(db_tree) not in dbroot or
+                not dbroot[indexes_key(db_tree)].is_current()):
+            m_logger.info('Build secondary indexes')
+            dbroot[indexes_key(db_tree)] = build_indexes(dbroot[db_tree])
+            transaction.commit()
+
+
+def db_ready(db_name, db_tree):
+    '''Check that DB has tree of device records without creating anything,
+    so commands which only read DB don't write it
+    Args:
+        db_name - name of DB
+        db_tree - name of tree with device records
+    Return:
+        True or False
+    '''
+    if not os.path.exists(db_name):
+        return False
+    with DBOpen(db_name) as connection:
+        return db_tree in connection.root()
 
 
 def get_last_transaction_time(db):
@@ -80,3 +108,19 @@ def get_last_transaction_time(db):
         storage.undoLog(0, 1)[0]['time'])
     del storage  # delete DB lock
     return last_transaction_time
+
+
+def get_last_run_time(db_name, db_tree):
+    '''Get start time of last update run recorded in liveness storage
+    Args:
+        db_name - name of DB
+        db_tree - name of tree with device records
+    Return:
+        time of last run or None if there was no runs
+    '''
+    with DBOpen(db_name) as connection:
+        liveness = connection.root().get(liveness_key(db_tree))
+        last_run = liveness.last_run() if liveness is not None else None
+        if last_run is None:
+            return None
+        return datetime.datetime.strptime(last_run.time, '%d-%m-%Y %H:%M')
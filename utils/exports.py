@@ -0,0 +1,201 @@
+import logging
+import gzip
+import hashlib
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree, OOTreeSet
+from ZODB.POSException import POSKeyError
+from ZODB.utils import p64, u64
+from utils.update_db import Device
+
+m_logger = logging.getLogger('wwmode_app.utils.exports')
+# Lines of longest entry any report format builds, with margin; report file
+# which entries don't match digests is rebuilt instead of being read further
+MAX_ENTRY_LINES = 100
+
+
+class ExportMark(Persistent):
+    '''State of report after last export. Only digests of entries are kept,
+    entries themselves are in report file
+    instance attrs:
+        tid - last DB transaction id included into export (None before
+            first export)
+        entries - OOBTree with IP address as key and digest of report entry
+            as value
+        removed - OOTreeSet of IP addresses of devices deleted from DB after
+            export (None if there are no such devices)
+    methods:
+        overloaded __init__
+    '''
+    removed = None
+
+    def __init__(self):
+        '''Initialize empty mark
+        No args
+        Overloaded
+        '''
+        self.tid = None
+        self.entries = OOBTree()
+
+
+def exports_key(db_tree):
+    '''Get name of export marks storage in DB root
+    Args:
+        db_tree - name of tree with device records
+    Return:
+        key of OOBTree with report name as key and ExportMark as value
+    '''
+    return db_tree + '_exports'
+
+
+def export_marks(dbroot, db_tree):
+    '''Get storage of export marks from DB root, create it if it's absent
+    Args:
+        dbroot - root of DB
+        db_tree - name of tree with device records
+    Return:
+        OOBTree with report name as key and ExportMark as value
+    '''
+    if exports_key(db_tree) not in dbroot:
+        dbroot[exports_key(db_tree)] = OOBTree()
+    return dbroot[exports_key(db_tree)]
+
+
+def entry_digest(entry):
+    '''Get short digest of report entry to store in ExportMark
+    Args:
+        entry - entry string
+    Return:
+        bytes
+    '''
+    return hashlib.blake2b(entry.encode(), digest_size=8).digest()
+
+
+def record_removal(dbroot, db_tree, ip):
+    '''Put deleted device into every export mark, so next export finds it
+    without scanning all marked devices. Caller commits transaction
+    Args:
+        dbroot - root of DB
+        db_tree - name of tree with device records
+        ip - IPv4 address of deleted device
+    No return value
+    '''
+    for mark in dbroot.get(exports_key(db_tree), {}).values():
+        if mark.removed is None:
+            mark.removed = OOTreeSet()
+        mark.removed.insert(ip)
+
+
+def changed_hosts(connection, since):
+    '''Find devices which records were written after transaction. Only
+    transactions after it are read from storage, not whole DB
+    Args:
+        connection - connection to DB
+        since - transaction id
+    Return:
+        set of IPv4 addresses
+    '''
+    hosts = set()
+    storage = connection.db().storage
+    for txn in storage.iterator(start=p64(u64(since) + 1)):
+        for record in txn:
+            try:
+                obj = connection.get(record.oid)
+            except POSKeyError:
+                continue
+            if isinstance(obj, Device):
+                hosts.add(obj.ip)
+    return hosts
+
+
+def export_delta(connection, devdb, marks, sinks):
+    '''Compute report entries changed since last export of every sink &
+    store digests of new entries & watermark in marks. First export include
+    all devices. Caller commits transaction
+    Args:
+        connection - connection to DB
+        devdb - database tree with device records
+        marks - OOBTree with report name as key and ExportMark as value
+        sinks - dictionary with report name as key and ReportSink instance
+            as value
+    Return:
+        dictionary with report name as key and list of tuples (state, IP
+        address, entry) as value, where state is 'added', 'changed' or
+        'removed' (entry is None for removed)
+    '''
+    last_tid = connection.db().storage.lastTransaction()
+    full = False
+    hosts = set()
+    for name in sinks:
+        if name not in marks:
+            marks[name] = ExportMark()
+        mark = marks[name]
+        if mark.tid is None:
+            full = True
+        else:
+            hosts |= changed_hosts(connection, mark.tid)
+        hosts.update(mark.removed or ())
+    if full:
+        hosts = set(devdb.keys()) | hosts
+    m_logger.debug('Export check {} hosts'.format(len(hosts)))
+    delta = {name: [] for name in sinks}
+    for num, ip in enumerate(sorted(hosts), 1):
+        dev = devdb.get(ip)
+        for name, sink in sinks.items():
+            mark = marks[name]
+            entry = sink.entry(dev) if dev is not None else None
+            digest = entry_digest(entry) if entry is not None else None
+            old = mark.entries.get(ip)
+            if digest == old:
+                continue
+            if entry is None:
+                del mark.entries[ip]
+                delta[name].append(('removed', ip, None))
+            else:
+                mark.entries[ip] = digest
+                delta[name].append(
+                    ('added' if old is None else 'changed', ip, entry))
+        if num % 1000 == 0:
+            connection.cacheMinimize()
+    for name in sinks:
+        marks[name].tid = last_tid
+        marks[name].removed = None
+    return delta
+
+
+def read_report(path, header, written):
+    '''Split report file written by previous export into entries of
+    devices, entries are recognized by digests stored in ExportMark
+    Args:
+        path - path of report file, gzipped if it ends with .gz
+        header - first line of report or None if format has no header
+        written - list of tuples (IP address, entry digest) in order
+            entries were written
+    Return:
+        dictionary with IP address as key and entry as value, None if file
+        is absent or doesn't match digests
+    '''
+    opener = gzip.open if path.endswith('.gz') else open
+    entries = {}
+    pending = iter(written)
+    ip, digest = next(pending, (None, None))
+    lines = []
+    try:
+        with opener(path, 'rt', encoding='utf-8') as report:
+            if header is not None and report.readline() != header + '\n':
+                return None
+            for line in report:
+                lines.append(line)
+                if ip is None or len(lines) > MAX_ENTRY_LINES:
+                    return None
+                # every entry is written with trailing newline
+                entry = ''.join(lines)[:-1]
+                if entry_digest(entry) == digest:
+                    entries[ip] = entry
+                    lines = []
+                    ip, digest = next(pending, (None, None))
+    except (OSError, ValueError) as exc:
+        m_logger.debug('Report {} not read: {}'.format(path, exc))
+        return None
+    if ip is not None or lines:
+        return None
+    return entries
@@ -0,0 +1,324 @@
+import logging
+import re
+import transaction
+from functools import reduce
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree, OOTreeSet
+from BTrees.OIBTree import OIBTree
+from BTrees.IOBTree import IOBTree
+from BTrees.IIBTree import IITreeSet, intersection
+from ZODB.utils import z64
+from utils.versions import version_key
+
+m_logger = logging.getLogger('wwmode_app.utils.indexes')
+
+# Device attributes that take part in full-text trigram index
+TEXT_ATTRS = ('ip', 'dname', 'c_contact', 'c_location', 'c_model',
+              'c_firmware')
+# Device attributes which changes need reindexing, IP address never changes
+INDEXED_ATTRS = ('dname', 'c_contact', 'c_location', 'c_model', 'c_firmware',
+                 'c_vlans', 'version_pattern')
+
+
+def location_tokens(location):
+    '''Split location into lowercase word tokens
+    Args:
+        location - location string
+    Return:
+        tuple of unique tokens
+    '''
+    if not location:
+        return ()
+    return tuple(sorted(set(re.findall(r'\w+', location.lower()))))
+
+
+def trigrams(text):
+    '''Split casefolded text into overlapping three character substrings
+    Args:
+        text - string
+    Return:
+        set of trigrams (empty if text is shorter than three characters)
+    '''
+    text = text.casefold()
+    return set(text[num:num + 3] for num in range(len(text) - 2))
+
+
+def device_keys(device):
+    '''Compute keys under which device is stored in every index
+    Args:
+        device - Device instance
+    Return:
+        dictionary with index name as key and tuple of keys as value
+    '''
+    dname = getattr(device, 'dname', '')
+    model = getattr(device, 'c_model', None)
+    firmware = getattr(device, 'c_firmware', None)
+    pattern = getattr(device, 'version_pattern', None)
+    grams = set()
+    for attr in TEXT_ATTRS:
+        value = getattr(device, attr, None)
+        if isinstance(value, str):
+            grams |= trigrams(value)
+    return {
+        'dname': (dname, ) if dname else (),
+        'model': (model, ) if model else (),
+        'firmware': ((model, version_key(firmware, pattern), firmware), )
+        if model and isinstance(firmware, str) else (),
+        'pattern': ((model, pattern), ) if model and pattern else (),
+        'vlan': tuple(sorted(set(getattr(device, 'c_vlans', None) or ()))),
+        'location': location_tokens(getattr(device, 'c_location', None)),
+        'trigram': tuple(sorted(grams)),
+        }
+
+
+class DeviceIndexes(Persistent):
+    '''Secondary indexes of device records. Every index is OOBTree with
+    OOTreeSet of device IP addresses as value, except VLAN & full-text
+    trigram indexes which keep compact IITreeSet of device numbers for fast
+    set operations
+    instance attrs:
+        dname - domain name to IPs
+        model - device model to IPs
+        firmware - tuple (model, version key, firmware) to IPs, so versions
+            of every model are sorted from oldest to newest
+        pattern - tuple (model, version_pattern) to IPs
+        vlan - VLAN to device numbers
+        location - location word token to IPs
+        trigram - trigram of TEXT_ATTRS values to device numbers
+        entries - IP to keys under which device is indexed now
+        numbers - IP to device number
+        addresses - device number to IP
+        next_number - number for next indexed device
+        layout - version of indexes layout instance was built with
+        tid - last DB transaction which changes of records are indexed
+            (None if unknown)
+    methods:
+        overloaded __init__
+        index_names
+        number_indexes
+        current_layout
+        is_current
+        number
+        reindex
+        unindex
+        lookup
+        device_vlans
+        model_versions
+        model_pattern
+        search_text
+    '''
+    index_names = ('dname', 'model', 'firmware', 'pattern', 'vlan',
+                   'location', 'trigram')
+    number_indexes = ('vlan', 'trigram')
+    current_layout = 4
+    tid = None
+
+    def __init__(self):
+        '''Initialize empty indexes
+        No args
+        Overloaded
+        '''
+        for name in self.index_names:
+            setattr(self, name, OOBTree())
+        self.entries = OOBTree()
+        self.numbers = OIBTree()
+        self.addresses = IOBTree()
+        self.next_number = 0
+        self.layout = self.current_layout
+
+    def is_current(self):
+        '''Check that instance was built with current indexes layout, indexes
+        stored by older versions should be rebuilt
+        No args
+        Return:
+            True or False
+        '''
+        return getattr(self, 'layout', 0) == self.current_layout
+
+    def number(self, ip):
+        '''Get number of device in number indexes, assign new one if device
+        has none
+        Args:
+            ip - IPv4 address of device
+        Return:
+            device number
+        '''
+        if ip not in self.numbers:
+            self.numbers[ip] = self.next_number
+            self.addresses[self.next_number] = ip
+            self.next_number += 1
+        return self.numbers[ip]
+
+    def _update(self, ip, old_keys, new_keys):
+        '''Move IP address between keys of all indexes
+        Args:
+            ip - IPv4 address of device
+            old_keys - result of device_keys stored for device before
+            new_keys - result of device_keys for device now
+        No return value
+        '''
+        for name in self.index_names:
+            index = getattr(self, name)
+            if name in self.number_indexes:
+                member, set_type = self.number(ip), IITreeSet
+            else:
+                member, set_type = ip, OOTreeSet
+            old = set(old_keys.get(name, ()))
+            new = set(new_keys.get(name, ()))
+            for key in old - new:
+                if key in index:
+                    index[key].remove(member)
+                    if not index[key]:
+                        del index[key]
+            for key in new - old:
+                if key not in index:
+                    index[key] = set_type()
+                index[key].insert(member)
+
+    def reindex(self, device):
+        '''Update indexes with current values of device record. Nothing is
+        written if indexed values didn't change
+        Args:
+            device - Device instance
+        No return value
+        '''
+        new_keys = device_keys(device)
+        old_keys = self.entries.get(device.ip, {})
+        if old_keys == new_keys:
+            return
+        self._update(device.ip, old_keys, new_keys)
+        self.entries[device.ip] = new_keys
+
+    def unindex(self, ip):
+        '''Remove device from all indexes
+        Args:
+            ip - IPv4 address of device
+        No return value
+        '''
+        if ip in self.entries:
+            self._update(ip, self.entries[ip], {})
+            del self.entries[ip]
+        if ip in self.numbers:
+            del self.addresses[self.numbers[ip]]
+            del self.numbers[ip]
+
+    def lookup(self, name, key):
+        '''Get IP addresses of devices stored under key of index
+        Args:
+            name - index name
+            key - key to look for
+        Return:
+            list of IPv4 addresses (empty if none)
+        '''
+        found = getattr(self, name).get(key, ())
+        if name in self.number_indexes:
+            return sorted(self.addresses[number] for number in found)
+        return list(found)
+
+    def device_vlans(self, ip):
+        '''Get VLANs under which device is indexed, without record loading
+        Args:
+            ip - IPv4 address of device
+        Return:
+            tuple of VLANs
+        '''
+        return self.entries.get(ip, {}).get('vlan', ())
+
+    def model_versions(self, model):
+        '''Get firmware versions of model devices found in DB
+        Args:
+            model - device model
+        Return:
+            list of tuples (version key, firmware) from oldest to newest
+        '''
+        return [(key, firmware) for dev_model, key, firmware in
+                self.firmware.keys(min=(model, ), max=(model + '\x00', ),
+                                   excludemax=True)]
+
+    def model_pattern(self, model):
+        '''Get version_pattern of model devices without record loading. All
+        devices of model come from one card, so they share it
+        Args:
+            model - device model
+        Return:
+            pattern or None if model devices have none
+        '''
+        for dev_model, pattern in self.pattern.keys(
+                min=(model, ), max=(model + '\x00', ), excludemax=True):
+            return pattern
+        return None
+
+    def search_text(self, text):
+        '''Find devices which TEXT_ATTRS values can contain text by
+        intersection of trigram sets. Result is superset of matched devices
+        ignoring case, so found records need to be checked
+        Args:
+            text - string at least three characters long
+        Return:
+            sorted list of IPv4 addresses of candidate devices
+        '''
+        sets = [self.trigram.get(gram) for gram in trigrams(text)]
+        if not sets or None in sets:
+            return []
+        found = reduce(intersection, sorted(sets, key=len))
+        return sorted(self.addresses[number] for number in found)
+
+
+def indexes_key(db_tree):
+    '''Get name of indexes storage in DB root
+    Args:
+        db_tree - name of tree with device records
+    Return:
+        key of DeviceIndexes instance in DB root
+    '''
+    return db_tree + '_indexes'
+
+
+def build_indexes(devdb):
+    '''Build indexes from scratch by scanning all device records
+    Args:
+        devdb - database tree with device records
+    Return:
+        DeviceIndexes instance
+    '''
+    indexes = DeviceIndexes()
+    for device in devdb.values():
+        indexes.reindex(device)
+    if devdb._p_jar is not None:
+        indexes.tid = devdb._p_jar.db().storage.lastTransaction()
+    else:
+        # new tree, every record is written after that
+        indexes.tid = z64
+    return indexes
+
+
+def update_indexes(db, db_tree, hosts):
+    '''Reindex changed devices in separate transaction. Workers have own
+    connections, so indexes are updated after run by one writer to avoid
+    conflicts. Records written after last indexes update are reindexed too,
+    so indexes catch up after run which failed before that point
+    Args:
+        db - instance of ZODB.DB class
+        db_tree - name of tree with device records
+        hosts - IPv4 addresses of devices which indexed attributes changed
+    No return value
+    '''
+    # utils.exports need Device class, which module imports this one
+    from utils.exports import changed_hosts
+    connection = db.open()
+    try:
+        dbroot = connection.root()
+        devdb = dbroot[db_tree]
+        indexes = dbroot[indexes_key(db_tree)]
+        last_tid = db.storage.lastTransaction()
+        hosts = set(hosts)
+        if indexes.tid is not None:
+            hosts |= changed_hosts(connection, indexes.tid)
+        for ip in hosts:
+            if ip in devdb:
+                indexes.reindex(devdb[ip])
+        indexes.tid = last_tid
+        transaction.commit()
+    finally:
+        connection.close()
+    m_logger.debug('Indexes updated for {} hosts'.format(len(hosts)))
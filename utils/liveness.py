@@ -0,0 +1,220 @@
+import logging
+import transaction
+from persistent import Persistent
+from BTrees.OIBTree import OIBTree
+from BTrees.IOBTree import IOBTree
+from BTrees.IIBTree import IIBTree
+
+m_logger = logging.getLogger('wwmode_app.utils.liveness')
+
+
+class SweepRun(Persistent):
+    '''Record of one update run
+    instance attrs:
+        time - time of run start in '%d-%m-%Y %H:%M' format
+        seen - bitmap of device ordinals found on the run (bytes)
+    methods:
+        overloaded __init__
+        has
+    '''
+    def __init__(self, time, seen):
+        '''Initialize instance
+        Args:
+            time - time of run start
+            seen - bitmap of device ordinals
+        Overloaded
+        '''
+        self.time = time
+        self.seen = seen
+
+    def has(self, ordinal):
+        '''Check presence of device ordinal in run bitmap
+        Args:
+            ordinal - device ordinal number
+        Return:
+            True or False
+        '''
+        return (ordinal // 8 < len(self.seen) and
+                bool(self.seen[ordinal // 8] & (1 << ordinal % 8)))
+
+
+class Liveness(Persistent):
+    '''Compact storage of device presence on update runs. Every device get
+    ordinal number once, every run stored as separate SweepRun with bitmap of
+    ordinals, so unchanged fleet cost one small record per run. Devices
+    missed by last run are kept with number of run where they were found
+    last time, so lookup doesn't scan old runs
+    class attrs:
+        missing - IIBTree with ordinal as key and run number as value for
+            devices not found on last run (DEFAULT - None, for storages
+            created before it & filled by next record_run)
+    instance attrs:
+        ordinals - OIBTree with IP address as key and ordinal as value
+        next_ordinal - ordinal for next new device
+        runs - IOBTree with run number as key and SweepRun as value
+    methods:
+        overloaded __init__
+        ordinal
+        record_run
+        find_missing
+        last_run
+        last_seen
+        seen_last_run
+    '''
+    missing = None
+
+    def __init__(self):
+        '''Initialize empty storage
+        No args
+        Overloaded
+        '''
+        self.ordinals = OIBTree()
+        self.next_ordinal = 0
+        self.runs = IOBTree()
+        self.missing = IIBTree()
+
+    def ordinal(self, ip):
+        '''Get ordinal number of device, assign new one if device has none
+        Args:
+            ip - IPv4 address of device
+        Return:
+            ordinal number
+        '''
+        if ip not in self.ordinals:
+            self.ordinals[ip] = self.next_ordinal
+            self.next_ordinal += 1
+        return self.ordinals[ip]
+
+    def record_run(self, hosts, time):
+        '''Store new run with hosts found on it
+        Args:
+            hosts - list of IPv4 addresses of found devices
+            time - time of run start in '%d-%m-%Y %H:%M' format
+        No return value
+        '''
+        ordinals = [self.ordinal(ip) for ip in hosts]
+        bitmap = bytearray((self.next_ordinal + 7) // 8)
+        for ordinal in ordinals:
+            bitmap[ordinal // 8] |= 1 << ordinal % 8
+        if self.missing is None:
+            self.missing = self.find_missing()
+        previous = self.last_run()
+        if previous is not None:
+            # bit number of bitmap read as little endian integer is ordinal
+            before = int.from_bytes(previous.seen, 'little')
+            now = int.from_bytes(bitmap, 'little')
+            for ordinal in set_bits(before & ~now):
+                self.missing[ordinal] = self.runs.maxKey()
+            for ordinal in set_bits(now & ~before):
+                if ordinal in self.missing:
+                    del self.missing[ordinal]
+        run_number = self.runs.maxKey() + 1 if self.runs else 1
+        self.runs[run_number] = SweepRun(time, bytes(bitmap))
+
+    def find_missing(self):
+        '''Find last run of every device not found on last run by scanning
+        stored runs, for storages created before missing was kept
+        No args
+        Return:
+            IIBTree with ordinal as key and run number as value
+        '''
+        missing = IIBTree()
+        last = self.last_run()
+        if last is None:
+            return missing
+        left = set(ordinal for ordinal in self.ordinals.values()
+                   if not last.has(ordinal))
+        for run_number in reversed(self.runs.keys()):
+            if not left:
+                break
+            found = set(ordinal for ordinal in left
+                        if self.runs[run_number].has(ordinal))
+            for ordinal in found:
+                missing[ordinal] = run_number
+            left -= found
+        return missing
+
+    def last_run(self):
+        '''Get last stored run
+        No args
+        Return:
+            SweepRun instance or None if there was no runs
+        '''
+        if not self.runs:
+            return None
+        return self.runs[self.runs.maxKey()]
+
+    def last_seen(self, ip):
+        '''Find time of last run on which device was found
+        Args:
+            ip - IPv4 address of device
+        Return:
+            time of run or None if device never was found
+        '''
+        ordinal = self.ordinals.get(ip)
+        if ordinal is None:
+            return None
+        if self.missing is None:
+            # storage of older version till next run, scan runs
+            for run_number in reversed(self.runs.keys()):
+                if self.runs[run_number].has(ordinal):
+                    return self.runs[run_number].time
+            return None
+        run = self.last_run()
+        if run is not None and run.has(ordinal):
+            return run.time
+        run_number = self.missing.get(ordinal)
+        return self.runs[run_number].time if run_number is not None else None
+
+    def seen_last_run(self, ip):
+        '''Check that device was found on last run
+        Args:
+            ip - IPv4 address of device
+        Return:
+            True or False
+        '''
+        run = self.last_run()
+        ordinal = self.ordinals.get(ip)
+        return run is not None and ordinal is not None and run.has(ordinal)
+
+
+def set_bits(number):
+    '''Get numbers of set bits of integer
+    Args:
+        number - non-negative integer
+    Yield:
+        bit number from lowest one
+    '''
+    while number:
+        low = number & -number
+        yield low.bit_length() - 1
+        number ^= low
+
+
+def liveness_key(db_tree):
+    '''Get name of liveness storage in DB root
+    Args:
+        db_tree - name of tree with device records
+    Return:
+        key of Liveness instance in DB root
+    '''
+    return db_tree + '_liveness'
+
+
+def record_sweep(db, db_tree, hosts, time):
+    '''Store hosts found by update run in separate transaction
+    Args:
+        db - instance of ZODB.DB class
+        db_tree - name of tree with device records
+        hosts - list of IPv4 addresses of found devices
+        time - time of run start in '%d-%m-%Y %H:%M' format
+    No return value
+    '''
+    connection = db.open()
+    try:
+        liveness = connection.root()[liveness_key(db_tree)]
+        liveness.record_run(hosts, time)
+        transaction.commit()
+    finally:
+        connection.close()
+    m_logger.debug('Run recorded with {} hosts'.format(len(hosts)))
@@ -2,6 +2,7 @@ import logging
 import os
 import os.path
 import json
+import re
 from .wwmode_exception import WWModeException
 
 m_logger = logging.getLogger('wwmode_app.utils.load_cards')
@@ -76,3 +77,98 @@ def retrive():
                 "No switch cards retrived, check your dev_cards directory")
         else:
             return cards
+
+
+class CardMatcher:
+    '''Recognize device cards for hosts. Patterns are compiled once, cards
+    with sys_object_id are found by dictionary lookup
+    instance attrs:
+        cards - list of device cards
+        patterns - list of tuples (compiled info_pattern, card) in cards
+            order
+        combined - one compiled regular expression for all info_pattern's
+            with named group for every card or None if patterns can't be
+            combined
+        names - dictionary with 'vendor series' as key & card as value for
+            static binds
+        object_ids - dictionary with sysObjectID as key & card as value
+    methods:
+        overloaded __init__
+        choose
+        match_description
+    '''
+    def __init__(self, cards, combine=False):
+        '''Compile patterns of cards
+        Args:
+            cards - list of device cards
+            combine - build one regular expression for all patterns, it's
+                slower than loop for few cards with short patterns
+                (DEFAULT - False)
+        Overloaded
+        '''
+        self.cards = cards
+        self.patterns = []
+        self.names = {}
+        self.object_ids = {}
+        for card in cards:
+            self.names.setdefault(card['vendor'] + ' ' + card['series'], card)
+            object_ids = card.get('sys_object_id', [])
+            if isinstance(object_ids, str):
+                object_ids = [object_ids]
+            for object_id in object_ids:
+                self.object_ids.setdefault(object_id.lstrip('.'), card)
+            try:
+                self.patterns.append((re.compile(card['info_pattern']), card))
+            except (KeyError, re.error):
+                m_logger.error('Card {} {} has no valid info_pattern'.format(
+                    card.get('vendor'), card.get('series')))
+        self.combined = None
+        # groups of cards would be renumbered, so backreferences break
+        if combine and self.patterns and not any(
+                re.search(r'\\\d|\(\?P=', pattern.pattern)
+                for pattern, card in self.patterns):
+            # lookahead from start of string finds pattern anywhere like
+            # re.search does & first card wins like in cards loop
+            try:
+                self.combined = re.compile('|'.join(
+                    r'(?=[\s\S]*?(?:{}))(?P<card{}>)'.format(
+                        pattern.pattern, num)
+                    for num, (pattern, card) in enumerate(self.patterns)))
+            except re.error:
+                m_logger.debug('Card patterns are matched one by one')
+
+    def choose(self, ip, sys_descr, bind_dict, sys_object_id=None):
+        '''Find device card for host. Static bind is checked first, then
+        sysObjectID & then sysDescr
+        Args:
+            ip - string representation of device IPv4 address
+            sys_descr - sysDescr value received from host
+            bind_dict - dictionary with static binds IP - card name
+            sys_object_id - sysObjectID value received from host
+                (DEFAULT - None)
+        Return:
+            card - device card or None if host not recognized
+        '''
+        bind = bind_dict.get(ip)
+        if bind is not None:
+            return self.names.get(bind)
+        if sys_object_id in self.object_ids:
+            return self.object_ids[sys_object_id]
+        return self.match_description(sys_descr)
+
+    def match_description(self, sys_descr):
+        '''Find first card which info_pattern match sysDescr
+        Args:
+            sys_descr - sysDescr value received from host
+        Return:
+            card - device card or None if no pattern match
+        '''
+        if self.combined:
+            match = self.combined.match(sys_descr)
+            if match:
+                return self.patterns[int(match.lastgroup[4:])][1]
+            return None
+        for pattern, card in self.patterns:
+            if pattern.search(sys_descr):
+                return card
+        return None
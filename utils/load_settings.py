@@ -60,11 +60,30 @@ class AppSettings:
         logs_path - directory to store logs
         num_threads (default - 1) - parallel working threads, which taking part
             in scanning
+        max_concurrency (default - 1000) - hosts polled simultaneously by
+            async engine
+        num_processes (default - 0) - poller processes of sharded engine, 0
+            means number of CPUs; num_threads are divided between them
+        commit_batch (default - 500) - records in one transaction of sharded
+            engine writer
+        poller_timeout (default - 600) - seconds sharded engine writer waits
+            for any result from pollers before terminating them
+        prescan (default - 'no') - probe hosts with single SNMP packet before
+            polling & poll only answered ones ('yes' to enable)
+        prescan_rate (default - 2000) - probes per second
+        prescan_timeout (default - 2) - seconds to wait for probe answers
+        dns_concurrency (default - 20) - DNS checks run simultaneously
+            alongside SNMP polling
+        dns_cache_ttl (default - 300) - seconds to keep DNS answers in cache
+        zone_files (default - '') - comma separated zone files or AXFR dumps
+            to answer DNS checks from, file name can be followed by
+            ':origin' if file doesn't contain SOA record
         unneded_vlans (default - []) - list of VLANs that would be omitted from
             DB
         uplink_pattern (default - 'up .+') - string pattern for uplink
             interface description searching
         ro_community (default - 'public') - SNMP community for reading
+        max_repetitions (default - 25) - rows requested in one SNMP GETBULK
         location_transliteration (default - 'straight') - transliterate or not
             locations to russian (and which schema to use)
         db_name (default - hosts_db) - database filename
@@ -91,9 +110,20 @@ class AppSettings:
         self.conf_location = os.path.join(os.getcwd(), 'wwmode.conf')
         self.logs_path = os.path.join(os.getcwd(), 'logs')
         self.num_threads = 1
+        self.max_concurrency = 1000
+        self.num_processes = 0
+        self.commit_batch = 500
+        self.poller_timeout = 600
+        self.prescan = 'no'
+        self.prescan_rate = 2000
+        self.prescan_timeout = 2
+        self.dns_concurrency = 20
+        self.dns_cache_ttl = 300
+        self.zone_files = ''
         self.unneded_vlans = []
         self.uplink_pattern = 'up .+'
         self.ro_community = 'public'
+        self.max_repetitions = 25
         self.location_transliteration = 'straight'
         self.db_name = 'hosts_db'
         self.db_tree = 'hosts'
@@ -213,6 +243,17 @@ class AppSettings:
             elif parameter == 'unneded_vlans':
                 getattr(group, parameter).extend(
                     [x.strip() for x in value.split(',')])
+            elif parameter == 'max_repetitions' and hasattr(group, parameter):
+                try:
+                    max_repetitions = int(value)
+                except ValueError:
+                    max_repetitions = 0
+                if max_repetitions > 0:
+                    group.max_repetitions = max_repetitions
+                else:
+                    m_logger.error(
+                        'Incorrect max_repetitions - {}, {} used'.format(
+                            value, group.max_repetitions))
             elif hasattr(group, parameter):
                 try:
                     setattr(group, parameter, value)
@@ -1,4 +1,7 @@
 import datetime
+import contextlib
+import io
+import sys
 import time
 import threading
 import ipaddress
@@ -12,52 +15,145 @@ from queue import Queue
 from ZODB import FileStorage, DB
 import transaction
 from utils.load_settings import AppSettings, FakeSettings
-from utils.update_db import worker, Device
-from utils.dbutils import db_check, DBOpen, get_last_transaction_time
-from lexicon.translate import convert
+from utils.update_db import worker, Device, STATE_VERSION
+from utils.prescan import prescan
+from utils.dbutils import db_check, db_ready, DBOpen, get_last_run_time
+from utils.liveness import record_sweep
+from utils.indexes import (indexes_key, update_indexes, build_indexes,
+                           TEXT_ATTRS)
+from utils.versions import version_key
+from utils.topology import (topology_key, update_topology, full_dname,
+                            resolve_device, vlan_chain, vlan_gaps)
+from utils.reports import REPORT_SINKS, AtomicWriter, run_reports
+from utils.exports import (export_marks, export_delta, read_report,
+                           record_removal)
+from utils.resolver import make_resolver
+from utils import profiler
 
 m_logger = logging.getLogger('wwmode_app.utils.utils')
 run_set = AppSettings()
 run_set.load_conf()
+# Names of fields for full search & appropriate device attributes
+SEARCH_FIELDS = {'ip': 'ip', 'dname': 'dname', 'contact': 'c_contact',
+                 'location': 'c_location', 'model': 'c_model',
+                 'firmware': 'c_firmware'}
 if not os.path.isdir(run_set.logs_path):
     os.mkdir(run_set.logs_path)
 
 
-def update_db_run():
+def update_db_run(engine='thread', profile_json=None, profile_prom=None):
     '''Update device database using multithreading with utils/update_db.worker
-    function. Update do not use DBOpen custom context manager because workers
-    make connections themselves to only one instance of DB
-    No args & return value
+    function or with asyncio event loop. Update do not use DBOpen custom
+    context manager because workers make connections themselves to only one
+    instance of DB
+    Args:
+        engine - polling engine to use:
+            thread - pool of utils/update_db.worker threads (DEFAULT)
+            async - utils/async_update.async_update_run event loop
+            sharded - hosts split across poller processes by
+                utils/sharded_update.sharded_update_run, thread engine is
+                used where processes can't be forked
+        profile_json - file to write JSON report with timings of run stages,
+            hosts & SNMP requests (DEFAULT - None)
+        profile_prom - file to write same timings in Prometheus text format
+            (DEFAULT - None)
+    No return value
     '''
     start_time = time.time()
+    if profile_json or profile_prom:
+        profile = profiler.start_profile()
+    run_time = datetime.datetime.now().strftime('%d-%m-%Y %H:%M')
     try:
         num_threads = int(run_set.num_threads)
     except ValueError:
-        m_logger.error('Incorrect number of threads - {}'.format(num_threads))
+        m_logger.error('Incorrect number of threads - {}'.format(
+            run_set.num_threads))
         num_threads = 10
+    if engine == 'sharded':
+        from utils.sharded_update import fork_supported
+        if not fork_supported():
+            m_logger.warning('Sharded engine needs fork start method, which '
+                             'is not available on {}, thread engine is '
+                             'used'.format(sys.platform))
+            engine = 'thread'
     db_check(run_set.db_name, run_set.db_tree)
     storage = FileStorage.FileStorage(run_set.db_name)
     db = DB(storage, pool_size=num_threads)
+    # one resolver for all groups, so cached answers are shared; sharded
+    # pollers are forked & make their own, so no pool threads at fork time
+    resolver = make_resolver(run_set) if engine != 'sharded' else None
     for group in run_set.groups.values():
         q = Queue()
         threads = []
         total_hosts = [x for subnet in group.subnets for x in subnet.hosts()]
         total_hosts.extend(group.hosts)
-        if num_threads > len(total_hosts):
-            num_threads = len(total_hosts)
         settings = FakeSettings(run_set, group)
-        for i in range(num_threads):
-            t = threading.Thread(target=worker, args=(q, settings, db))
+        if settings.prescan == 'yes':
+            try:
+                total_hosts = prescan(total_hosts, settings.ro_community,
+                                      rate=int(settings.prescan_rate),
+                                      timeout=float(settings.prescan_timeout))
+            except ValueError:
+                m_logger.error('Incorrect prescan rate or timeout')
+        if not total_hosts:
+            m_logger.info('No hosts to poll in group {}'.format(
+                group.group_name))
+            continue
+        # every group is limited by configured number, not by previous group
+        group_threads = min(num_threads, len(total_hosts))
+        if engine == 'async':
+            # asyncio PySNMP API imported only when needed
+            from utils.async_update import async_update_run
+            try:
+                concurrency = int(settings.max_concurrency)
+            except ValueError:
+                m_logger.error('Incorrect concurrency - {}'.format(
+                    settings.max_concurrency))
+                concurrency = 100
+            async_update_run(total_hosts, settings, db, concurrency,
+                             resolver)
+            continue
+        elif engine == 'sharded':
+            from utils.sharded_update import sharded_update_run
+            try:
+                num_processes = int(settings.num_processes) or os.cpu_count()
+                batch = int(settings.commit_batch)
+                timeout = float(settings.poller_timeout)
+            except ValueError:
+                m_logger.error('Incorrect number of processes, batch size or '
+                               'poller timeout')
+                num_processes, batch, timeout = os.cpu_count(), 500, 600
+            sharded_update_run(total_hosts, run_set, group, db, num_processes,
+                               max(group_threads // num_processes, 1),
+                               batch, timeout)
+            continue
+        for i in range(group_threads):
+            t = threading.Thread(target=worker,
+                                 args=(q, settings, db, resolver))
             t.start()
             threads.append(t)
         for item in total_hosts:
             q.put(item)
         q.join()
-        for i in range(num_threads):
+        for i in range(group_threads):
             q.put(None)
         for t in threads:
             t.join()
+    if resolver:
+        resolver.shutdown()
+    with profiler.active.timer('record_sweep'):
+        record_sweep(db, run_set.db_tree, Device.seen_hosts, run_time)
+    with profiler.active.timer('indexes'):
+        update_indexes(db, run_set.db_tree, Device.changed_hosts)
+    with profiler.active.timer('topology'):
+        update_topology(db, run_set.db_tree, run_set)
     db.close()
+    if profile_json or profile_prom:
+        profiler.stop_profile()
+        if profile_json:
+            profile.write_json(profile_json)
+        if profile_prom:
+            profile.write_prometheus(profile_prom)
     exec_time_msg = 'Total execution time: {:.2f} sec.'.format(
         time.time() - start_time)
     new_hosts_msg = 'New hosts founded: {}'.format(Device.num_instances)
@@ -67,16 +163,14 @@ def update_db_run():
     m_logger.debug(total_hosts_msg)
     if Device.new_hosts and run_set.mail_to:
         print(Device.new_hosts)
-        r_list = generate_rancid_list(Device.new_hosts)
-        p_list = generate_plain_list(Device.new_hosts)
-        d_list = generate_dns_list(Device.new_hosts)
-        t_list = generate_trac_table(Device.new_hosts)
-        n_list = generate_nagios_list(Device.new_hosts)
+        buffers = [io.StringIO() for name in REPORT_SINKS]
+        run_reports(device_generator(Device.new_hosts), [
+            sink(out, run_set, with_title=True)
+            for sink, out in zip(REPORT_SINKS.values(), buffers)])
         cfg_msg = 'Config for new devices:\n'
         raw_msg = 'Run complete.\n' + exec_time_msg + '\n' + new_hosts_msg
-        raw_msg += '\n' + total_hosts_msg + '\n' + cfg_msg + '\n' + r_list
-        raw_msg += '\n' + p_list + '\n' + d_list + '\n' + t_list + '\n'
-        raw_msg += n_list + '\n'
+        raw_msg += '\n' + total_hosts_msg + '\n' + cfg_msg + '\n'
+        raw_msg += '\n'.join(out.getvalue() for out in buffers) + '\n'
         msg = MIMEText(raw_msg.encode('utf-8'), _charset='utf-8')
         msg['Subject'] = run_set.mail_subject
         msg['From'] = run_set.mail_from
@@ -89,42 +183,142 @@ def update_db_run():
             m_logger.error("Email sending failed with error: {}".format(e))
 
 
-def search_db(field, value):
-    '''Search for given value through requested records attribute & print it
+def load_indexes(dbroot):
+    '''Get secondary indexes of device records. Indexes are stored by update
+    & migrate runs, show commands don't write DB; if indexes are absent or
+    have old layout, they are built in memory for one command
+    Args:
+        dbroot - root of DB
+    Return:
+        utils.indexes.DeviceIndexes instance
+    '''
+    indexes = dbroot.get(indexes_key(run_set.db_tree))
+    if indexes is None or not indexes.is_current():
+        m_logger.warning('Secondary indexes are absent or outdated, run '
+                         'update or migration to store them')
+        indexes = build_indexes(dbroot[run_set.db_tree])
+    return indexes
+
+
+def make_matcher(value, regex=False, ignore_case=False):
+    '''Build function that test string for presence of searched value
+    Args:
+        value - value to find, substring or regular expression
+        regex - treat value as regular expression (DEFAULT - False)
+        ignore_case - ignore case of letters (DEFAULT - False)
+    Return:
+        function that take string & return True if value found in it, or
+        None if regular expression is incorrect
+    '''
+    if regex:
+        try:
+            pattern = re.compile(value, re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            print('Incorrect regular expression - {}: {}'.format(value, e))
+            return None
+        return lambda string: pattern.search(string) is not None
+    if ignore_case:
+        value = value.casefold()
+        return lambda string: value in string.casefold()
+    return lambda string: value in string
+
+
+def search_db(field, value, fields=None, regex=False, ignore_case=False):
+    '''Search for given value through requested records attribute & print it.
+    Full search test all fields of record in one visit; records which can
+    contain value are found with trigram index, full pass through DB is done
+    only for regular expressions & values shorter than three characters.
+    Models & VLANs are looked up in secondary indexes
     Args:
-        field - attribute in where we look for value
+        field - attribute in where we look for value or 'full' for search
+            through several fields
         value - value to find
+        fields - list of SEARCH_FIELDS names for full search (DEFAULT - None,
+            so search in all of them)
+        regex - treat value as regular expression (DEFAULT - False)
+        ignore_case - ignore case of letters (DEFAULT - False)
     No return value
     '''
-    def run_search(attr, val):
-        '''Supporting function for value searching in specific field
+    def print_match(dev, attr, dev_val):
+        '''Supporting function for printing found record
         args:
-            attr - field to look in
-            val - value to find
+            dev - Device instance
+            attr - field in which value found
+            dev_val - value of field
         No return value
         '''
+        if attr != 'c_vlans':
+            print("{} - {} - {} >>> {}".format(
+                dev.ip, dev.dname, getattr(dev, 'c_location', ''), dev_val))
+        else:
+            print("{} - {} - {}".format(
+                dev.ip, dev.dname, getattr(dev, 'c_location', '')))
+
+    def indexed_records():
+        '''Supporting generator of records which can contain value found by
+        trigram index
+        No args
+        Yield:
+            device record from DB
+        '''
         with DBOpen(run_set.db_name) as connection:
             dbroot = connection.root()
             devdb = dbroot[run_set.db_tree]
-            for dev in devdb:
-                try:
-                    dev_val = getattr(devdb[dev], attr)
-                except AttributeError:
-                    continue
-                if val in dev_val and attr is not 'c_vlans':
-                    print("{} - {} - {} >>> {}".format(
-                        devdb[dev].ip, devdb[dev].dname, devdb[dev].c_location,
-                        dev_val))
-                elif val in dev_val:
-                    print("{} - {} - {}".format(
-                        devdb[dev].ip, devdb[dev].dname,
-                        devdb[dev].c_location))
+            indexes = load_indexes(dbroot)
+            for ip in indexes.search_text(value):
+                yield devdb[ip]
+
+    def run_search(attrs):
+        '''Supporting function for value searching in several fields by one
+        visit of record. Every record printed once with all found values
+        args:
+            attrs - list of attributes to look in
+        No return value
+        '''
+        if (regex or len(value) < 3 or
+                not all(attr in TEXT_ATTRS for attr in attrs)):
+            records = device_generator()
+        else:
+            records = indexed_records()
+        for dev in records:
+            found = []
+            for attr in attrs:
+                dev_val = getattr(dev, attr, None)
+                if (isinstance(dev_val, str) and dev_val not in found and
+                        match(dev_val)):
+                    found.append(dev_val)
+            if found:
+                print_match(dev, field, '; '.join(found))
+
+    def index_search(attr):
+        '''Supporting function for value searching with secondary indexes
+        args:
+            attr - field to look in, c_model or c_vlans
+        No return value
+        '''
+        with DBOpen(run_set.db_name) as connection:
+            dbroot = connection.root()
+            devdb = dbroot[run_set.db_tree]
+            indexes = load_indexes(dbroot)
+            name = 'vlan' if attr == 'c_vlans' else 'model'
+            if attr == 'c_vlans' and not regex and not ignore_case:
+                found = indexes.lookup(name, value)
+            else:
+                found = sorted(set(ip for key in getattr(indexes, name).keys()
+                                   if match(key)
+                                   for ip in indexes.lookup(name, key)))
+            for ip in found:
+                print_match(devdb[ip], attr, getattr(devdb[ip], attr))
+
+    match = make_matcher(value, regex, ignore_case)
+    if match is None:
+        return
     if field == 'full':
-        for a in ['ip', 'dname', 'c_contact', 'c_location', 'c_model',
-                  'c_firmware']:
-            run_search(a, value)
+        run_search([SEARCH_FIELDS[x] for x in fields or SEARCH_FIELDS])
+    elif field in ('c_model', 'c_vlans'):
+        index_search(field)
     else:
-        run_search(field, value)
+        run_search([field])
 
 
 def print_devices(device):
@@ -148,11 +342,13 @@ def compute_time_diff(one, another):
         one - first time
         another - second time OR Device instance
     Return:
-        absolute difference in seconds
+        absolute difference in seconds (None if device never was seen)
     '''
     if isinstance(another, Device):
-            another = datetime.datetime.strptime(
-                another.last_seen, '%d-%m-%Y %H:%M')
+        if another.last_seen == 'never':
+            return None
+        another = datetime.datetime.strptime(
+            another.last_seen, '%d-%m-%Y %H:%M')
     return abs((one - another).total_seconds())
 
 
@@ -162,20 +358,22 @@ def show_all_records(inactive=False, inactivity_time=600):
         inactive - if that flag in True state, print only inactive devices
             (not contacted in last update run (see next arg)) (DEFAULT - False)
         inactivity_time - consider device inactive if that time of seconds
-            elapsed betwen update time and device last_seen (update time -
-            time of last DB transaction, there can be some minutes between
-            first device update and last transaction) (DEFAULT - 600)
+            elapsed betwen last update run start and device last_seen
+            (DEFAULT - 600)
     No return value
     '''
     if inactive:
-        last_transaction_time = get_last_transaction_time(run_set.db_name)
+        last_run_time = get_last_run_time(run_set.db_name, run_set.db_tree)
+        if last_run_time is None:
+            print('No update runs recorded')
+            return
         counter = 1
     for num, dev in enumerate(device_generator()):
         if not inactive:
             print_devices(dev)
         else:
-            diff = compute_time_diff(last_transaction_time, dev)
-            if diff > inactivity_time:
+            diff = compute_time_diff(last_run_time, dev)
+            if diff is None or diff > inactivity_time:
                 print_devices(dev)
                 counter += 1
     count = counter if inactive else num
@@ -206,23 +404,18 @@ def show_single_device(device, quiet=False):
                 # there can be couple of items with 'device' in dname so we
                 # make a list and choose first
                 rec = ''
-                mod = ''
-                if len(device.split('.')) == 1:
-                    mod = (run_set.domain_prefix + '.' + device + '.' +
-                           run_set.default_zone)
-                elif len(device.split('.')) == 2:
-                    mod = device + '.' + run_set.default_zone
-                elif run_set.default_zone and len(device.split('.')) == len(
-                        run_set.default_zone.split('.')) + 1:
-                    mod = run_set.domain_prefix + '.' + device
-                q_list = list(
-                    [devdb[x] for x in devdb if devdb[x].dname == device])
-                m_list = list(
-                    [devdb[x] for x in devdb if devdb[x].dname == mod])
+                mod = full_dname(device, run_set.domain_prefix,
+                                 run_set.default_zone)
+                indexes = load_indexes(dbroot)
+                q_list = indexes.lookup('dname', device)
+                m_list = indexes.lookup('dname', mod)
                 if q_list:
-                    rec = q_list[0]
+                    rec = devdb[q_list[0]]
                 elif m_list:
-                    rec = m_list[0]
+                    rec = devdb[m_list[0]]
+                if rec:
+                    # record is used after connection close, load it now
+                    rec._p_activate()
                 if not quiet:
                     if rec:
                         print(rec)
@@ -231,11 +424,15 @@ def show_single_device(device, quiet=False):
                 return rec
 
 
-def device_generator(hosts=None):
+def device_generator(hosts=None, batch=1000):
     '''Open ZODB, unpack device records and yields it one at a time.
+    Records are read from tree lazily & connection cache is minimized after
+    every batch of records, so memory usage don't grow with DB size
     Args:
         hosts - list of hosts to be yielded (default - None, so yield all
             of them)
+        batch - number of records yielded between cache minimizations
+            (DEFAULT - 1000)
     Return:
         devdb[dev] - device record from DB
     '''
@@ -243,13 +440,18 @@ def device_generator(hosts=None):
         dbroot = connection.root()
         devdb = dbroot[run_set.db_tree]
         if hosts:
-            yield from [devdb[x] for x in hosts if x in devdb]
+            records = (devdb[x] for x in hosts if x in devdb)
         else:
-            yield from [devdb[x] for x in devdb]
+            records = devdb.values()
+        for num, dev in enumerate(records, 1):
+            yield dev
+            if num % batch == 0:
+                connection.cacheMinimize()
 
 
 def software_search(model, version, older=True):
-    '''Search for software older or newer then provided
+    '''Search for software older or newer then provided. Versions are
+    compared in natural order or with version_pattern of device card
     Args:
         model - devices of what model we search
         version - software version for comparison with
@@ -272,14 +474,21 @@ def software_search(model, version, older=True):
         else:
             return False
 
-    for dev in device_generator():
-        try:
-            dev.c_model
-        except AttributeError:
-            continue
-        if model.upper() in dev.c_model and check_soft(
-                version, dev.c_firmware):
-            print_devices(dev)
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        indexes = load_indexes(dbroot)
+        found = []
+        for dev_model in indexes.model.keys():
+            if model.upper() not in dev_model:
+                continue
+            wanted = version_key(version, indexes.model_pattern(dev_model))
+            for key, firmware in indexes.model_versions(dev_model):
+                if check_soft(wanted, key):
+                    found.extend(indexes.lookup(
+                        'firmware', (dev_model, key, firmware)))
+        for ip in sorted(found):
+            print_devices(devdb[ip])
 
 
 def find_newest_firmware():
@@ -289,14 +498,12 @@ def find_newest_firmware():
         model, version - model of device, latest firmware for that model
     '''
     d = {}
-    for dev in device_generator():
-        try:
-            dev.c_firmware
-        except AttributeError:
-            continue
-        if dev.c_model not in d or (
-                dev.c_firmware > d[dev.c_model]):
-            d[dev.c_model] = dev.c_firmware
+    with DBOpen(run_set.db_name) as connection:
+        indexes = load_indexes(connection.root())
+        for model in indexes.model.keys():
+            versions = indexes.model_versions(model)
+            if versions:
+                d[model] = versions[-1][1]
     for k, v in d.items():
         print('{}: {}'.format(k, v))
     print('-' * 30)
@@ -304,205 +511,257 @@ def find_newest_firmware():
         yield model, d[model]
 
 
-def generate_plain_list(hosts=None):
-    '''Generate list of hosts domain names one on a line
-    Args:
-        hosts - list of hosts which values need to be generated
-    Return:
-        overall - string containing all resulting list
-    '''
-    overall = 'Plain list entries:\n'
-    for dev in device_generator(hosts):
-        if dev.dname:
-            result = '{}'.format(dev.dname)
-            if not hosts:
-                print(result)
-            overall += result + '\n'
-    return overall
-
-
-def generate_dns_list(hosts=None):
-    '''Generate list of DNS records based on SNMP location
-    Output of that function can be very weird and most likely
-    need manual intervention!
-    Args:
-        hosts - list of hosts which values need to be generated
-    Return:
-        overall - string containing all resulting list
+def show_outdated():
+    '''Print newest firmware in DB for every device model & devices which
+    run older firmware than newest for their model. Everything is taken from
+    firmware index by one DB opening
+    No args & return value
     '''
-    overall = 'DNS list entries:\n'
-    for dev in device_generator(hosts):
-        if not dev.c_location:
-            continue
-        dev_loc = convert(dev.c_location,
-                          schema=run_set.location_transliteration).lower()
-        if ',' in dev_loc:
-            if re.search(r'\d{0,4}(-.{1,3} )?(\D )*?\d{1,3}',
-                         dev_loc.split(',')[0]):
-                dev_loc = dev_loc.split(',')[0]
-            else:
-                print('{}\t\t\tIN A\t\t\t{}'.format(dev_loc.split(',')[0],
-                                                    dev.ip))
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        indexes = load_indexes(dbroot)
+        outdated = []
+        for model in indexes.model.keys():
+            versions = indexes.model_versions(model)
+            if not versions:
                 continue
-        result = '{}\t\t\tIN A\t\t\t{}'.format(generate_dname(dev_loc, 'p',
-                                                              '1'), dev.ip)
-        if not hosts:
-            print(result)
-        overall += result + '\n'
-    return overall
-
-
-def generate_nagios_list(hosts=None):
-    '''Generate Nagios host definitions
+            newest_key, newest = versions[-1]
+            print('{}: {}'.format(model, newest))
+            for key, firmware in versions:
+                if key < newest_key:
+                    outdated.extend(indexes.lookup(
+                        'firmware', (model, key, firmware)))
+        print('-' * 30)
+        for ip in outdated:
+            print_devices(devdb[ip])
+
+
+def generate_reports(names, hosts=None, directory=None, output=None):
+    '''Generate reports of several formats by one pass through DB records.
+    Reports are streamed to stdout, to output file or to files of output
+    directory; files are replaced atomically & gzipped if name ends with .gz
     Args:
-        hosts - list of hosts which values need to be generated
-    Return:
-        overall - string containing all resulting list
+        names - list of utils.reports.REPORT_SINKS names
+        hosts - list of hosts to include into reports (DEFAULT - None, so
+            include all of them)
+        directory - directory to write report files into (DEFAULT - None)
+        output - path of file to write first report into (DEFAULT - None)
+    No return value
     '''
-    overall = 'Nagios list entries:\n'
-    for dev in device_generator(hosts):
-        if not dev.dname:
-            continue
-        template = 'define host{\n'
-        template += '\tuse\t\tgeneric-host\n\thostname\t{}\n'.format(
-            dev.dname)
-        if hasattr(dev, 'c_location') and dev.c_location:
-            template += '\talias\t\tDEVICE at {}\n'.format(dev.c_location)
-        template += '\taddress\t\t{}\n'.format(dev.ip)
-        if hasattr(dev, 'c_uplinks'):
-            template += '\tparents\t\t'
-            for node in dev.c_uplinks:
-                if node:
-                    template += node[0] + ','
-            template = template[:-1]
-            template += '\n'
-        template += '}\n'
-        if not hosts:
-            print(template)
-        overall += template + '\n'
-    return overall
-
-
-def generate_rancid_list(hosts=None):
-    '''Generate Rancid router.db list
+    if directory is not None:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = [os.path.join(directory, REPORT_SINKS[name].filename)
+                 for name in names]
+    elif output is not None:
+        names = names[:1]
+        paths = [output]
+    else:
+        run_reports(device_generator(hosts), [
+            REPORT_SINKS[name](sys.stdout, run_set) for name in names])
+        return
+    with contextlib.ExitStack() as stack:
+        sinks = [REPORT_SINKS[name](stack.enter_context(AtomicWriter(path)),
+                                    run_set)
+                 for name, path in zip(names, paths)]
+        run_reports(device_generator(hosts), sinks)
+    for sink, path in zip(sinks, paths):
+        print('{}: {} entries'.format(path, sink.entries))
+
+
+def generate_delta(names, directory=None, output=None):
+    '''Generate only entries of reports which changed since last export of
+    that reports. Changes are printed, or report files written by previous
+    export are patched with them without reading of unchanged device
+    records; file which doesn't match export mark is rebuilt from records.
+    Export watermark is moved only if output written successfully
     Args:
-        hosts - list of hosts which values need to be generated
-    Return:
-        overall - string containing all resulting list
+        names - list of utils.reports.REPORT_SINKS names
+        directory - directory to write report files into (DEFAULT - None)
+        output - path of file to write report into, only one name can be
+            given with it or without directory (DEFAULT - None)
+    No return value
     '''
-    overall = 'Rancid router.db entries:\n'
-    for dev in device_generator(hosts):
-        if not dev.dname:
-            continue
-        if hasattr(dev, 'rancid_type'):
-            result = '{};{};up'.format(dev.dname, dev.rancid_type)
-            if not hosts:
-                print(result)
-            overall += result + '\n'
-    return overall
+    if directory is None and len(names) > 1:
+        raise ValueError('Only one report can be written into {}, got '
+                         '{}'.format(output or 'stdout', ', '.join(names)))
+    if directory is not None:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = [os.path.join(directory, REPORT_SINKS[name].filename)
+                 for name in names]
+    elif output is not None:
+        paths = [output]
+    else:
+        paths = None
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        marks = export_marks(dbroot, run_set.db_tree)
+        sinks = {name: REPORT_SINKS[name](None, run_set) for name in names}
+        # order & digests of entries in files before export
+        written = {name: list(marks[name].entries.items())
+                   for name in names
+                   if paths and name in marks and
+                   marks[name].tid is not None}
+        delta = export_delta(connection, devdb, marks, sinks)
+        if paths is None:
+            for state, ip, entry in delta[names[0]]:
+                print('# {} {}'.format(state, ip))
+                if entry is not None:
+                    print(entry)
+        else:
+            for name, path in zip(names, paths):
+                entries = None
+                if name in written:
+                    entries = read_report(path, sinks[name].header,
+                                          written[name])
+                if entries is None:
+                    m_logger.info('Rebuild {} from DB records'.format(path))
+                    entries = {ip: sinks[name].entry(devdb[ip])
+                               for ip in marks[name].entries.keys()}
+                else:
+                    for state, ip, entry in delta[name]:
+                        if entry is None:
+                            del entries[ip]
+                        else:
+                            entries[ip] = entry
+                with AtomicWriter(path) as out:
+                    sink = REPORT_SINKS[name](out, run_set)
+                    sink.start()
+                    for ip in marks[name].entries.keys():
+                        out.write(entries[ip] + '\n')
+                    sink.finish()
+                states = [state for state, ip, entry in delta[name]]
+                print('{}: {} entries, {} added, {} changed, {} removed'.
+                      format(path, len(marks[name].entries),
+                             states.count('added'), states.count('changed'),
+                             states.count('removed')))
+        transaction.commit()
 
 
-def generate_trac_table(hosts=None):
-    '''Generate markdown table for Trac knowledge base
+def go_high(device):
+    '''Print device uplink chain from given device to upper level that can
+    be find. Chain is taken from topology graph built on update run
     Args:
-        hosts - list of hosts which values need to be generated
-    Return:
-        overall - string containing all resulting list
+        device - IP address or domain name of device (FQDN or main part)
+    No return value
     '''
-    if not hosts:
-        header = '|| Location || Device model || Domain name || IP address ||'
-        header += ' Link speed ||'
-        print(header)
-    overall = 'Trac table entries:\n'
-    for dev in device_generator(hosts):
-        template = '|| '
-        t_location = getattr(dev, 'c_location', '  ')
-        t_model = getattr(dev, 'c_model', '  ')
-        t_dname = getattr(dev, 'dname', '  ')
-        template += t_location + ' || ' + t_model + ' || ' + t_dname + ' || '
-        template += dev.ip + ' || '
-        if hasattr(dev, 'c_uplinks') and dev.c_uplinks:
-            template += dev.c_uplinks[0][1] + ' ||'
-        else:
-            template += '  ||'
-        if not hosts:
-            print(template)
-        overall += template + '\n'
-    return overall
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        topology = dbroot.get(topology_key(run_set.db_tree))
+        if topology is None:
+            print('No topology in DB, run update first')
+            return
+        ip = resolve_device(device, devdb, load_indexes(dbroot),
+                            run_set.domain_prefix, run_set.default_zone)
+        if ip is None:
+            print('-'*10)
+            return
+        for depth, node, state in topology.chain(ip):
+            dev = devdb.get(node) if state != 'unresolved' else None
+            if dev is None:
+                print('-'*10)
+            elif state == 'cycle':
+                print('Uplink cycle: {} ({})'.format(
+                    node, getattr(dev, 'dname', '')))
+            elif state == 'seen':
+                print('{} (see above)'.format(
+                    getattr(dev, 'c_location', node)))
+            else:
+                print(getattr(dev, 'c_location', node))
 
 
-def generate_dname(address, role, number):
-    '''Generate domain name from postal address using custom Intertax rules
+def show_downstream(device):
+    '''Print all devices connected to given device directly or through other
+    devices, with indent by number of hops
     Args:
-        address - postal address
-        role - device role (one letter: p, n, s...
-        number - device ordinal number
-    Return:
-        generated domain name (without zone)
+        device - IP address or domain name of device (FQDN or main part)
+    No return value
     '''
-    vowels = ('a', 'e', 'i', 'o', 'u', 'y')
-    address = re.sub(r'[^a-zA-Z0-9 .,]', '', address).lower()
-    if ',' in address:
-        address = address.split(',')[0]
-    location_pattern = re.compile(
-        r'^(?P<fnum>\d{0,4})(?:-.{1,3} )?(?P<street>.+?) (?P<lnum>\d{1,3}.*)$')
-    location_match = location_pattern.match(address)
-    if not location_match:
-        return role + number + '.' + address.replace(' ', '')
-    middle_part = location_match.group('street')
-    if len(middle_part.split()) > 1:
-        middle_part_split = middle_part.split()
-        middle_part_last_word = middle_part_split.pop(-1)
-        middle_part = ''
-        for word in middle_part_split:
-            middle_part += word[0]
-        middle_part += middle_part_last_word
-    tmp_word = ''
-    for num, letter in enumerate(middle_part):
-        if num > 3 and letter not in vowels:
-            break
-        elif num > 3 and middle_part[num-1] not in vowels:
-            break
-        tmp_word += letter
-    if middle_part[num-1] in vowels:
-        tmp_word += middle_part[num]
-    last_part = ''
-    for part in location_match.group('lnum').split():
-        if part[0].isdigit():
-            last_part += part
-        else:
-            last_part += part[0]
-    dname = ''
-    for part in [location_match.group('fnum'), tmp_word, last_part]:
-        if part:
-            dname += part
-    return role + number + '.' + dname
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        topology = dbroot.get(topology_key(run_set.db_tree))
+        if topology is None:
+            print('No topology in DB, run update first')
+            return
+        ip = resolve_device(device, devdb, load_indexes(dbroot),
+                            run_set.domain_prefix, run_set.default_zone)
+        if ip is None:
+            print('No such device in DB')
+            return
+        found = topology.downstream(ip)
+        for depth, node in found:
+            print('  ' * (depth - 1), end='')
+            dev = devdb.get(node)
+            if dev is None:
+                print('{} - not in DB'.format(node))
+            else:
+                print_devices(dev)
+        print('Total downstream devices - {}'.format(len(found)))
 
 
-def go_high(device):
-    '''Print device uplink chain from given device to upper level that can
-    be find
+def show_vlan_chain(vlan):
+    '''Print chains of connected devices with VLAN configured, with indent
+    by number of hops. Chain top without VLAN on its uplinks is marked
     Args:
-        device - IP address or domain name of device (FQDN or main part)
+        vlan - VLAN to look for
     No return value
     '''
-    if not hasattr(run_set, 'uplink_pattern'):
-        print('no uplink pattern defined')
-        return
-    pattern = re.compile(run_set.uplink_pattern)
-    dev = show_single_device(device, quiet=True)
-    if not dev:
-        print('-'*10)
-        return
-    print(dev.c_location)
-    for up in dev.c_uplinks:
-        m_res = pattern.match(up[0])
-        if m_res:
-            try:
-                up_dev = m_res.group('device')
-            except IndexError:
-                up_dev = up[0]
-        go_high(up_dev)
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        topology = dbroot.get(topology_key(run_set.db_tree))
+        if topology is None:
+            print('No topology in DB, run update first')
+            return
+        chain = vlan_chain(topology, load_indexes(dbroot),
+                           vlan)
+        for depth, ip, missing in chain:
+            if not depth:
+                print('-'*10)
+            dev = devdb[ip]
+            line = '{}{} - {} - {}'.format('  ' * depth, dev.ip, dev.dname,
+                                          getattr(dev, 'c_location', ''))
+            if missing:
+                line += ' (no VLAN on uplink {})'.format(', '.join(missing))
+            print(line)
+        print('Total devices with VLAN - {}'.format(len(chain)))
+
+
+def show_vlan_gaps(device):
+    '''Print VLANs configured on device but not on any of its uplinks
+    Args:
+        device - IP address or domain name of device (FQDN or main part) or
+            'all' to check every device in DB
+    No return value
+    '''
+    with DBOpen(run_set.db_name) as connection:
+        dbroot = connection.root()
+        devdb = dbroot[run_set.db_tree]
+        indexes = load_indexes(dbroot)
+        topology = dbroot.get(topology_key(run_set.db_tree))
+        if topology is None:
+            print('No topology in DB, run update first')
+            return
+        if device == 'all':
+            hosts = topology.up.keys()
+        else:
+            ip = resolve_device(device, devdb, indexes, run_set.domain_prefix,
+                                run_set.default_zone)
+            if ip is None:
+                print('No such device in DB')
+                return
+            hosts = [ip]
+        for ip in hosts:
+            gaps = vlan_gaps(topology, indexes, ip)
+            if gaps:
+                print('{} - {} >>> {}'.format(
+                    ip, getattr(devdb.get(ip), 'dname', ''),
+                    ', '.join(gaps)))
 
 
 def dry_run():
@@ -525,5 +784,46 @@ def delete_record(ip):
         dbroot = connection.root()
         devdb = dbroot[run_set.db_tree]
         del devdb[ip]
+        record_removal(dbroot, run_set.db_tree, ip)
+        indexes = dbroot.get(indexes_key(run_set.db_tree))
+        if indexes is not None:
+            indexes.unindex(ip)
+        if topology_key(run_set.db_tree) in dbroot:
+            dbroot[topology_key(run_set.db_tree)].remove(ip)
         transaction.commit()
     print('Deletion done!')
+
+
+def migrate_db(batch=1000):
+    '''Rewrite device records stored in older format with compact state of
+    current version & print size of records pickles before & after.
+    Secondary indexes are built too if they are absent or outdated
+    Args:
+        batch - number of records in one transaction (DEFAULT - 1000)
+    No return value
+    '''
+    db_check(run_set.db_name, run_set.db_tree)
+    migrated = []
+    size_before = 0
+    with DBOpen(run_set.db_name) as connection:
+        devdb = connection.root()[run_set.db_tree]
+        storage = connection.db().storage
+        for dev in devdb.values():
+            dev._p_activate()
+            if dev._v_state_version >= STATE_VERSION:
+                continue
+            size_before += len(storage.load(dev._p_oid)[0])
+            dev._p_changed = True
+            migrated.append(dev._p_oid)
+            if len(migrated) % batch == 0:
+                transaction.commit()
+                connection.cacheMinimize()
+        transaction.commit()
+        size_after = sum(len(storage.load(oid)[0]) for oid in migrated)
+    print('Migrated records: {}'.format(len(migrated)))
+    if migrated:
+        print('Pickle size before: {} bytes ({:.1f} per record)'.format(
+            size_before, size_before / len(migrated)))
+        print('Pickle size after: {} bytes ({:.1f} per record)'.format(
+            size_after, size_after / len(migrated)))
+        print('Old records are kept in DB file till it packed')
@@ -0,0 +1,147 @@
+import logging
+import select
+import socket
+import time
+
+
+m_logger = logging.getLogger('wwmode_app.utils.prescan')
+
+SYS_OBJECT_ID_OID = '1.3.6.1.2.1.1.2.0'
+
+
+def ber_length(length):
+    '''Encode length of BER TLV
+    Args:
+        length - length of value
+    Return:
+        bytes with encoded length
+    '''
+    if length < 0x80:
+        return bytes([length])
+    octets = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(octets)]) + octets
+
+
+def ber_tlv(tag, value):
+    '''Encode BER TLV
+    Args:
+        tag - tag number
+        value - encoded value
+    Return:
+        bytes with encoded TLV
+    '''
+    return bytes([tag]) + ber_length(len(value)) + value
+
+
+def ber_integer(number):
+    '''Encode non negative integer in BER
+    Args:
+        number - integer to encode
+    Return:
+        bytes with encoded integer
+    '''
+    return ber_tlv(0x02, number.to_bytes(number.bit_length() // 8 + 1, 'big'))
+
+
+def ber_oid(oid):
+    '''Encode numerical OID in BER
+    Args:
+        oid - string with numerical OID, e.g. '1.3.6.1.2.1.1.2.0'
+    Return:
+        bytes with encoded OID
+    '''
+    arcs = [int(x) for x in oid.split('.')]
+    encoded = bytearray([arcs[0] * 40 + arcs[1]])
+    for arc in arcs[2:]:
+        chunk = [arc & 0x7f]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7f))
+            arc >>= 7
+        encoded.extend(reversed(chunk))
+    return ber_tlv(0x06, bytes(encoded))
+
+
+def build_probe(community, request_id=1, oid=SYS_OBJECT_ID_OID):
+    '''Build SNMPv2c GET request message for one OID. Message is built by
+    hand, so no PySNMP machinery involved in probing
+    Args:
+        community - SNMP community for reading
+        request_id - request-id of PDU (DEFAULT - 1)
+        oid - numerical OID to query for (DEFAULT - sysObjectID.0)
+    Return:
+        bytes with encoded message
+    '''
+    var_bind = ber_tlv(0x30, ber_oid(oid) + b'\x05\x00')
+    pdu = ber_tlv(0xa0, ber_integer(request_id) + ber_integer(0) +
+                  ber_integer(0) + ber_tlv(0x30, var_bind))
+    return ber_tlv(0x30, ber_integer(1) +
+                   ber_tlv(0x04, community.encode('utf-8')) + pdu)
+
+
+def collect(sock, responders, wait):
+    '''Read all probe responses that arrive in given time
+    Args:
+        sock - UDP socket probes were sent from
+        responders - set to add addresses of answered hosts to
+        wait - how long to wait for responses in seconds
+    No return value
+    '''
+    deadline = time.monotonic() + wait
+    while True:
+        left = deadline - time.monotonic()
+        readable, _, _ = select.select([sock], [], [], max(left, 0))
+        if not readable:
+            if left <= 0:
+                return
+            continue
+        try:
+            data, address = sock.recvfrom(65535)
+        except (BlockingIOError, ConnectionRefusedError):
+            continue
+        # any SNMP message (SEQUENCE) from host means agent is alive
+        if data[:1] == b'\x30':
+            responders.add(address[0])
+
+
+def prescan(hosts, community, port=161, rate=2000, timeout=2.0):
+    '''Send one SNMP GET sysObjectID.0 probe to every host at given packet
+    rate & return hosts which answered anything. Probes aren't retried, so
+    dead addresses cost one packet instead of full PySNMP timeout cycle
+    Args:
+        hosts - list of ipaddress.IPv4Address instances
+        community - SNMP community for reading
+        port - UDP port (DEFAULT - 161)
+        rate - probes per second (DEFAULT - 2000)
+        timeout - how long to wait for answers after last probe, in seconds
+            (DEFAULT - 2.0)
+    Return:
+        live - list of hosts answered on probe in original order
+    '''
+    responders = set()
+    batch = max(rate // 100, 1)  # send in 10 ms slices
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        start_time = time.monotonic()
+        for num, host in enumerate(hosts):
+            probe = build_probe(community, num + 1)
+            while True:
+                try:
+                    sock.sendto(probe, (host.exploded, port))
+                    break
+                except (BlockingIOError, InterruptedError):
+                    select.select([], [sock], [], 0.01)
+                except OSError as e:
+                    m_logger.debug('Prescan: {} at {}'.format(e, host))
+                    break
+            if (num + 1) % batch == 0:
+                ahead = start_time + (num + 1) / rate - time.monotonic()
+                collect(sock, responders, max(ahead, 0))
+        collect(sock, responders, timeout)
+    finally:
+        sock.close()
+    live = [host for host in hosts if host.exploded in responders]
+    m_logger.info('Prescan: {} of {} hosts answered'.format(
+        len(live), len(hosts)))
+    return live
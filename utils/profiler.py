@@ -0,0 +1,345 @@
+import json
+import math
+import logging
+import threading
+import time
+from utils.reports import AtomicWriter
+
+m_logger = logging.getLogger('wwmode_app.utils.profiler')
+
+PERCENTILES = (50, 90, 99)
+# Upper bounds of Prometheus histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class StageTimer:
+    '''Context manager which pass time spent inside it to profile
+    instance attrs:
+        profile - SweepProfile instance
+        stage - name of stage
+        start - time of enter
+    methods:
+        overloaded __init__
+        overloaded __enter__
+        overloaded __exit__
+    '''
+    def __init__(self, profile, stage):
+        '''Initialize instance
+        Args:
+            profile - SweepProfile instance
+            stage - name of stage
+        Overloaded
+        '''
+        self.profile = profile
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        '''Remember start time
+        No args
+        Return:
+            self
+        Overloaded
+        '''
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''Pass elapsed time to profile, exceptions are not suppressed
+        Args:
+            exc_type, exc_value, traceback - exception info
+        Return:
+            False
+        Overloaded
+        '''
+        self.profile.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def percentile(values, num):
+    '''Get percentile of values by nearest rank
+    Args:
+        values - sorted list of numbers
+        num - percentile (0-100)
+    Return:
+        value or None if values are empty
+    '''
+    if not values:
+        return None
+    rank = max(math.ceil(num / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(values):
+    '''Aggregate durations into count, total & percentiles
+    Args:
+        values - list of durations in seconds
+    Return:
+        dictionary with summary
+    '''
+    values = sorted(values)
+    summary = {'count': len(values), 'total': sum(values)}
+    for num in PERCENTILES:
+        summary['p{}'.format(num)] = percentile(values, num)
+    summary['max'] = values[-1] if values else None
+    return summary
+
+
+def label(value):
+    '''Escape value of Prometheus label
+    Args:
+        value - label value
+    Return:
+        escaped string
+    '''
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+class SweepProfile:
+    '''Timings collected during update run. Workers add durations from
+    several threads, so all changes are guarded by lock
+    instance attrs:
+        started - time of profile creation (seconds since epoch)
+        lock - threading.Lock instance
+        stages - dictionary with stage name as key & list of durations as
+            value
+        models - dictionary with device model as key & list of host polling
+            durations as value
+        oids - dictionary with OID as key & list [requests, timeouts, list of
+            round trip durations] as value
+    methods:
+        overloaded __init__
+        timer
+        add
+        host
+        request
+        state
+        merge
+        report
+        write_json
+        write_prometheus
+    '''
+    def __init__(self):
+        '''Initialize empty profile
+        No args
+        Overloaded
+        '''
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.models = {}
+        self.oids = {}
+
+    def timer(self, stage):
+        '''Get context manager which measure stage duration
+        Args:
+            stage - name of stage
+        Return:
+            StageTimer instance
+        '''
+        return StageTimer(self, stage)
+
+    def add(self, stage, seconds):
+        '''Add duration of stage
+        Args:
+            stage - name of stage
+            seconds - duration
+        No return value
+        '''
+        with self.lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def host(self, model, seconds):
+        '''Add duration of whole host polling
+        Args:
+            model - device model or other host category
+            seconds - duration
+        No return value
+        '''
+        with self.lock:
+            self.models.setdefault(model, []).append(seconds)
+
+    def request(self, oids, seconds, timeout=False):
+        '''Add round trip of SNMP request, it counted for every OID in it
+        Args:
+            oids - list of requested OIDs
+            seconds - round trip duration
+            timeout - request timed out (DEFAULT - False)
+        No return value
+        '''
+        with self.lock:
+            for oid in oids:
+                stat = self.oids.setdefault(str(oid), [0, 0, []])
+                stat[0] += 1
+                stat[1] += int(bool(timeout))
+                stat[2].append(seconds)
+
+    def state(self):
+        '''Get copy of collected timings which can be sent to other process
+        No args
+        Return:
+            dictionary with stages, models & oids
+        '''
+        with self.lock:
+            return {'stages': {k: list(v) for k, v in self.stages.items()},
+                    'models': {k: list(v) for k, v in self.models.items()},
+                    'oids': {k: [v[0], v[1], list(v[2])]
+                             for k, v in self.oids.items()}}
+
+    def merge(self, state):
+        '''Add timings collected by profile in other process
+        Args:
+            state - dictionary from SweepProfile.state
+        No return value
+        '''
+        with self.lock:
+            for stage, times in state['stages'].items():
+                self.stages.setdefault(stage, []).extend(times)
+            for model, times in state['models'].items():
+                self.models.setdefault(model, []).extend(times)
+            for oid, (requests, timeouts, times) in state['oids'].items():
+                stat = self.oids.setdefault(oid, [0, 0, []])
+                stat[0] += requests
+                stat[1] += timeouts
+                stat[2].extend(times)
+
+    def report(self):
+        '''Aggregate collected timings
+        No args
+        Return:
+            dictionary ready for JSON serialization, OIDs & models go from
+            slowest in total
+        '''
+        with self.lock:
+            oids = []
+            for oid, (requests, timeouts, times) in self.oids.items():
+                summary = summarize(times)
+                summary.update(requests=requests, timeouts=timeouts)
+                oids.append((oid, summary))
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'hosts': sum(len(x) for x in self.models.values()),
+                'stages': {stage: summarize(times)
+                           for stage, times in sorted(self.stages.items())},
+                'models': dict(sorted(
+                    ((model, summarize(times))
+                     for model, times in self.models.items()),
+                    key=lambda x: -x[1]['total'])),
+                'oids': dict(sorted(oids, key=lambda x: -x[1]['total']))}
+
+    def write_json(self, path):
+        '''Write report into JSON file
+        Args:
+            path - file name, file is gzipped if name ends with .gz
+        No return value
+        '''
+        with AtomicWriter(path) as report_file:
+            json.dump(self.report(), report_file, indent=2)
+            report_file.write('\n')
+        m_logger.info('Sweep profile written to {}'.format(path))
+
+    def write_prometheus(self, path):
+        '''Write histograms & counters in Prometheus text format, for
+        node_exporter textfile collector
+        Args:
+            path - file name
+        No return value
+        '''
+        lines = []
+
+        def histogram(name, help_text, key, series):
+            '''Add histogram lines for every series'''
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+            for value, times in sorted(series.items()):
+                tag = '{}="{}"'.format(key, label(value))
+                for bound in BUCKETS:
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        name, tag, bound, sum(x <= bound for x in times)))
+                lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                    name, tag, len(times)))
+                lines.append('{}_sum{{{}}} {}'.format(name, tag, sum(times)))
+                lines.append('{}_count{{{}}} {}'.format(name, tag,
+                                                        len(times)))
+
+        with self.lock:
+            histogram('wwmode_stage_seconds', 'Duration of update stages',
+                      'stage', self.stages)
+            histogram('wwmode_host_seconds', 'Duration of host polling',
+                      'model', self.models)
+            histogram('wwmode_oid_seconds', 'Round trip of SNMP requests',
+                      'oid', {oid: stat[2] for oid, stat in self.oids.items()})
+            lines.append('# HELP wwmode_oid_timeouts_total SNMP requests '
+                         'timed out')
+            lines.append('# TYPE wwmode_oid_timeouts_total counter')
+            for oid, stat in sorted(self.oids.items()):
+                lines.append('wwmode_oid_timeouts_total{{oid="{}"}} {}'.format(
+                    label(oid), stat[1]))
+        lines.append('# HELP wwmode_sweep_seconds Duration of update run')
+        lines.append('# TYPE wwmode_sweep_seconds gauge')
+        lines.append('wwmode_sweep_seconds {}'.format(
+            time.time() - self.started))
+        with AtomicWriter(path) as metrics_file:
+            metrics_file.write('\n'.join(lines) + '\n')
+        m_logger.info('Sweep metrics written to {}'.format(path))
+
+
+class NullProfile(SweepProfile):
+    '''Profile which drop all timings, used when profiling is off
+    methods:
+        overloaded add
+        overloaded host
+        overloaded request
+        overloaded merge
+    '''
+    def add(self, stage, seconds):
+        '''Drop duration
+        Overloaded
+        '''
+        pass
+
+    def host(self, model, seconds):
+        '''Drop duration
+        Overloaded
+        '''
+        pass
+
+    def request(self, oids, seconds, timeout=False):
+        '''Drop round trip
+        Overloaded
+        '''
+        pass
+
+    def merge(self, state):
+        '''Drop timings
+        Overloaded
+        '''
+        pass
+
+
+# Profile of current update run, workers take it from here
+active = NullProfile()
+
+
+def start_profile():
+    '''Begin collecting timings of update run
+    No args
+    Return:
+        SweepProfile instance
+    '''
+    global active
+    active = SweepProfile()
+    return active
+
+
+def stop_profile():
+    '''Stop collecting timings
+    No args
+    Return:
+        SweepProfile instance with collected timings
+    '''
+    global active
+    profile, active = active, NullProfile()
+    return profile
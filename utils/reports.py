@@ -0,0 +1,348 @@
+import logging
+import re
+import os
+import os.path
+import io
+import gzip
+import tempfile
+from lexicon.translate import convert
+
+m_logger = logging.getLogger('wwmode_app.utils.reports')
+
+
+class AtomicWriter:
+    '''Context manager for writing report file through temporary file in
+    same directory, which replace target file only when writing completed,
+    so readers never see partial file. Output is gzipped if path ends with
+    .gz
+    instance attrs:
+        path - path of target file
+        tmp_path - path of temporary file
+        file - temporary file object
+        out - buffered text stream to write into
+    methods:
+        overloaded __init__
+        overloaded __enter__
+        overloaded __exit__
+    '''
+    def __init__(self, path):
+        '''Add target path to instance
+        Args:
+            path - path of target file
+        Overloaded
+        '''
+        self.path = path
+
+    def __enter__(self):
+        '''Create temporary file & open text stream to it
+        No args
+        Return:
+            text stream
+        '''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=directory, prefix='.' + os.path.basename(self.path))
+        self.file = os.fdopen(fd, 'wb')
+        raw = self.file
+        if self.path.endswith('.gz'):
+            raw = gzip.GzipFile(filename=os.path.basename(self.path[:-3]),
+                                mode='wb', fileobj=raw)
+        self.out = io.TextIOWrapper(raw, encoding='utf-8')
+        return self.out
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        '''Close stream & move temporary file on place of target one, or
+        remove it if there was an error. Exception is propogated
+        Args:
+            exc_type - type of exception
+            exc_value - value of exception
+            exc_tb - traceback of exception
+        Return:
+            False
+        '''
+        try:
+            self.out.close()
+            self.file.close()
+        except Exception:
+            os.remove(self.tmp_path)
+            raise
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            m_logger.error('Report {} not written: {}'.format(
+                self.path, exc_value))
+            return False
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.tmp_path, 0o666 & ~umask)
+        os.replace(self.tmp_path, self.path)
+        return False
+
+
+class ReportSink:
+    '''Base class of report format. Sink receive device records one by one
+    & write entries for them into file object, so many reports can be built
+    by one pass through DB
+    class attrs:
+        title - title of report section in email
+        header - first line of report (DEFAULT - None)
+        filename - name of report file in output directory
+    instance attrs:
+        out - file object to write into
+        settings - instance of utils.load_settings.AppSettings
+        with_title - write title before entries
+        entries - number of written entries
+    methods:
+        overloaded __init__
+        start
+        add
+        entry
+        finish
+    '''
+    title = ''
+    header = None
+    filename = ''
+
+    def __init__(self, out, settings, with_title=False):
+        '''Initialize instance
+        Args:
+            out - file object to write into
+            settings - instance of utils.load_settings.AppSettings
+            with_title - write title before entries (DEFAULT - False)
+        Overloaded
+        '''
+        self.out = out
+        self.settings = settings
+        self.with_title = with_title
+        self.entries = 0
+
+    def start(self):
+        '''Write title & header of report
+        No args & return value
+        '''
+        if self.with_title:
+            self.out.write(self.title + '\n')
+        if self.header:
+            self.out.write(self.header + '\n')
+
+    def add(self, dev):
+        '''Write entry for device if format has one
+        Args:
+            dev - Device instance
+        No return value
+        '''
+        entry = self.entry(dev)
+        if entry is not None:
+            self.out.write(entry + '\n')
+            self.entries += 1
+
+    def entry(self, dev):
+        '''Build report entry for device, must be overloaded by formats
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        '''
+        raise NotImplementedError
+
+    def finish(self):
+        '''Complete report after all devices added
+        No args & return value
+        '''
+        self.out.flush()
+
+
+class PlainSink(ReportSink):
+    '''List of hosts domain names one on a line'''
+    title = 'Plain list entries:'
+    filename = 'plain.txt'
+
+    def entry(self, dev):
+        '''Build report entry for device
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        Overloaded
+        '''
+        if dev.dname:
+            return '{}'.format(dev.dname)
+
+
+class DnsSink(ReportSink):
+    '''List of DNS records based on SNMP location. Output of that format
+    can be very weird and most likely need manual intervention!'''
+    title = 'DNS list entries:'
+    filename = 'dns.txt'
+
+    def entry(self, dev):
+        '''Build report entry for device
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        Overloaded
+        '''
+        if not getattr(dev, 'c_location', None):
+            return None
+        dev_loc = convert(
+            dev.c_location,
+            schema=self.settings.location_transliteration).lower()
+        if ',' in dev_loc:
+            if re.search(r'\d{0,4}(-.{1,3} )?(\D )*?\d{1,3}',
+                         dev_loc.split(',')[0]):
+                dev_loc = dev_loc.split(',')[0]
+            else:
+                return '{}\t\t\tIN A\t\t\t{}'.format(dev_loc.split(',')[0],
+                                                    dev.ip)
+        return '{}\t\t\tIN A\t\t\t{}'.format(
+            generate_dname(dev_loc, 'p', '1'), dev.ip)
+
+
+class NagiosSink(ReportSink):
+    '''Nagios host definitions'''
+    title = 'Nagios list entries:'
+    filename = 'nagios.cfg'
+
+    def entry(self, dev):
+        '''Build report entry for device
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        Overloaded
+        '''
+        if not dev.dname:
+            return None
+        template = 'define host{\n'
+        template += '\tuse\t\tgeneric-host\n\thostname\t{}\n'.format(
+            dev.dname)
+        if hasattr(dev, 'c_location') and dev.c_location:
+            template += '\talias\t\tDEVICE at {}\n'.format(dev.c_location)
+        template += '\taddress\t\t{}\n'.format(dev.ip)
+        if hasattr(dev, 'c_uplinks'):
+            template += '\tparents\t\t'
+            for node in dev.c_uplinks:
+                if node:
+                    template += node[0] + ','
+            template = template[:-1]
+            template += '\n'
+        template += '}\n'
+        return template
+
+
+class RancidSink(ReportSink):
+    '''Rancid router.db list'''
+    title = 'Rancid router.db entries:'
+    filename = 'router.db'
+
+    def entry(self, dev):
+        '''Build report entry for device
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        Overloaded
+        '''
+        if dev.dname and hasattr(dev, 'rancid_type'):
+            return '{};{};up'.format(dev.dname, dev.rancid_type)
+
+
+class TracSink(ReportSink):
+    '''Markdown table for Trac knowledge base'''
+    title = 'Trac table entries:'
+    header = ('|| Location || Device model || Domain name || IP address ||' +
+              ' Link speed ||')
+    filename = 'trac.txt'
+
+    def entry(self, dev):
+        '''Build report entry for device
+        Args:
+            dev - Device instance
+        Return:
+            entry string or None if device has no entry in report
+        Overloaded
+        '''
+        template = '|| '
+        t_location = getattr(dev, 'c_location', '  ')
+        t_model = getattr(dev, 'c_model', '  ')
+        t_dname = getattr(dev, 'dname', '  ')
+        template += t_location + ' || ' + t_model + ' || ' + t_dname + ' || '
+        template += dev.ip + ' || '
+        if hasattr(dev, 'c_uplinks') and dev.c_uplinks:
+            template += dev.c_uplinks[0][1] + ' ||'
+        else:
+            template += '  ||'
+        return template
+
+
+# Report formats by name, in order of sections in email
+REPORT_SINKS = {'rancid': RancidSink, 'plain': PlainSink, 'dns': DnsSink,
+                'trac': TracSink, 'nagios': NagiosSink}
+
+
+def run_reports(devices, sinks):
+    '''Pass every device to all sinks by one iteration
+    Args:
+        devices - iterable of Device instances
+        sinks - list of ReportSink instances
+    Return:
+        number of passed devices
+    '''
+    for sink in sinks:
+        sink.start()
+    num = 0
+    for num, dev in enumerate(devices, 1):
+        for sink in sinks:
+            sink.add(dev)
+    for sink in sinks:
+        sink.finish()
+    m_logger.debug('Reports built for {} devices'.format(num))
+    return num
+
+
+def generate_dname(address, role, number):
+    '''Generate domain name from postal address using custom Intertax rules
+    Args:
+        address - postal address
+        role - device role (one letter: p, n, s...
+        number - device ordinal number
+    Return:
+        generated domain name (without zone)
+    '''
+    vowels = ('a', 'e', 'i', 'o', 'u', 'y')
+    address = re.sub(r'[^a-zA-Z0-9 .,]', '', address).lower()
+    if ',' in address:
+        address = address.split(',')[0]
+    location_pattern = re.compile(
+        r'^(?P<fnum>\d{0,4})(?:-.{1,3} )?(?P<street>.+?) (?P<lnum>\d{1,3}.*)$')
+    location_match = location_pattern.match(address)
+    if not location_match:
+        return role + number + '.' + address.replace(' ', '')
+    middle_part = location_match.group('street')
+    if len(middle_part.split()) > 1:
+        middle_part_split = middle_part.split()
+        middle_part_last_word = middle_part_split.pop(-1)
+        middle_part = ''
+        for word in middle_part_split:
+            middle_part += word[0]
+        middle_part += middle_part_last_word
+    tmp_word = ''
+    for num, letter in enumerate(middle_part):
+        if num > 3 and letter not in vowels:
+            break
+        elif num > 3 and middle_part[num-1] not in vowels:
+            break
+        tmp_word += letter
+    if middle_part[num-1] in vowels:
+        tmp_word += middle_part[num]
+    last_part = ''
+    for part in location_match.group('lnum').split():
+        if part[0].isdigit():
+            last_part += part
+        else:
+            last_part += part[0]
+    dname = ''
+    for part in [location_match.group('fnum'), tmp_word, last_part]:
+        if part:
+            dname += part
+    return role + number + '.' + dname
@@ -0,0 +1,138 @@
+import socket
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.zonefile import reverse_name, load_zones, ZoneParseError
+
+m_logger = logging.getLogger('wwmode_app.utils.resolver')
+
+
+class CachingResolver:
+    '''Pool of threads for DNS checks with in-memory cache of resolver
+    answers. Methods gethostbyaddr & gethostbyname return & raise same things
+    as socket module functions, so instance can be used in place of socket
+    module. System resolver doesn't tell records TTL, so every answer
+    (negative too) is kept for ttl seconds. Names of zones loaded from zone
+    files are answered from them without lookups
+    instance attrs:
+        ttl - seconds to keep answer in cache
+        zones - utils.zonefile.ZoneData instance or None
+        cache - dictionary with (function name, argument) as key & tuple
+            (expiration time, result, exception) as value
+        lock - threading.Lock instance guarding cache
+        executor - concurrent.futures.ThreadPoolExecutor instance
+    methods:
+        overloaded __init__
+        gethostbyaddr
+        gethostbyname
+        submit
+        shutdown
+    '''
+    def __init__(self, concurrency=20, ttl=300, zones=None):
+        '''Start pool of resolver threads
+        Args:
+            concurrency - number of simultaneous DNS queries (DEFAULT - 20)
+            ttl - seconds to keep answer in cache (DEFAULT - 300)
+            zones - utils.zonefile.ZoneData instance (DEFAULT - None)
+        Overloaded
+        '''
+        self.ttl = ttl
+        self.zones = zones
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _cached(self, name, argument):
+        '''Get answer of resolver function from cache or call it & store
+        answer
+        Args:
+            name - name of socket module function
+            argument - argument of function
+        Return:
+            result of function, exception raised by it raised again
+        '''
+        key = (name, argument)
+        now = time.monotonic()
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached is None or cached[0] < now:
+            try:
+                cached = (now + self.ttl, getattr(socket, name)(argument),
+                          None)
+            except (socket.herror, socket.gaierror) as exc:
+                cached = (now + self.ttl, None, (type(exc), exc.args))
+            with self.lock:
+                self.cache[key] = cached
+        if cached[2]:
+            exc_type, args = cached[2]
+            raise exc_type(*args)
+        return cached[1]
+
+    def gethostbyaddr(self, ip):
+        '''Cached socket.gethostbyaddr
+        Args:
+            ip - string representation of IPv4 address
+        Return:
+            tuple of host name, aliases & addresses
+        '''
+        if self.zones and self.zones.covers(reverse_name(ip)):
+            return self.zones.gethostbyaddr(ip)
+        return self._cached('gethostbyaddr', ip)
+
+    def gethostbyname(self, name):
+        '''Cached socket.gethostbyname. CNAME from loaded zone to name
+        outside of them is looked up
+        Args:
+            name - domain name
+        Return:
+            string representation of IPv4 address
+        '''
+        if self.zones and self.zones.covers(name):
+            name = self.zones.follow_aliases(name)
+            if self.zones.covers(name):
+                return self.zones.gethostbyname(name)
+        return self._cached('gethostbyname', name)
+
+    def submit(self, func, *args):
+        '''Run function in pool of resolver threads
+        Args:
+            func - function to run
+            args - arguments of function
+        Return:
+            concurrent.futures.Future instance
+        '''
+        return self.executor.submit(func, *args)
+
+    def shutdown(self):
+        '''Wait for running checks & stop threads
+        No args & return value
+        '''
+        self.executor.shutdown()
+        m_logger.debug('Resolver stopped, {} answers cached'.format(
+            len(self.cache)))
+
+
+def make_resolver(settings):
+    '''Create resolver with options from settings & load zone files. If zone
+    files can't be loaded, all names are resolved by lookups
+    Args:
+        settings - instance of utils.load_settings.AppSettings or FakeSettings
+    Return:
+        CachingResolver instance
+    '''
+    try:
+        concurrency = int(settings.dns_concurrency)
+        ttl = float(settings.dns_cache_ttl)
+    except ValueError:
+        m_logger.error('Incorrect DNS concurrency or cache TTL')
+        concurrency, ttl = 20, 300
+    zones = None
+    paths = [path.strip() for path in settings.zone_files.split(',')
+             if path.strip()]
+    if paths:
+        try:
+            zones = load_zones(paths)
+        except ZoneParseError:
+            m_logger.error('Zone files not loaded, using DNS lookups')
+    return CachingResolver(concurrency, ttl, zones)
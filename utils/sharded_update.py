@@ -0,0 +1,275 @@
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from queue import Queue, Empty
+import transaction
+from utils.load_settings import FakeSettings
+from utils.snmpget import SnmpGetter, make_engine, close_engine
+from utils.liveness import liveness_key
+from utils.update_db import (Device, register_device, check_domain,
+                             choose_card, card_matcher, apply_card,
+                             split_requests)
+from utils.resolver import make_resolver
+from utils import profiler
+
+
+m_logger = logging.getLogger('wwmode_app.utils.sharded_update')
+# Attributes from device card which are removed from record when card has
+# none; PollResult starts empty, so apply_card can't delete them itself
+CARD_OPTIONAL = ('version_pattern',)
+
+
+class PollResult:
+    '''Plain container for values received from host in poller process.
+    SnmpGetter sget_* methods set attributes on it the same way as on Device,
+    but it can be sent to writer process
+    instance attrs:
+        ip - IPv4 address of device
+        dname - domain name from PTR record
+        c_* - retrived parameters
+        vtree, rancid_type - attributes from device card
+    methods:
+        overloaded __init__
+        translit_location
+        check_supply_zone
+    '''
+    # same code works on any object with c_location & dname attributes
+    translit_location = Device.translit_location
+    check_supply_zone = Device.check_supply_zone
+
+    def __init__(self, ip):
+        '''Initialize instance
+        Args:
+            ip - string representation of device IPv4 address
+        Overloaded
+        '''
+        self.ip = ip
+        self.dname = ''
+
+
+def poll_host(snmp_getter, ip, settings, resolver):
+    '''Retrive all parameters from host without touching database
+    Args:
+        snmp_getter - instance of utils.snmpget.SnmpGetter
+        ip - string representation of device IPv4 address
+        settings - instance of utils.load_settings.FakeSettings
+        resolver - utils.resolver.CachingResolver instance, DNS checks run
+            in it alongside SNMP requests
+    Return:
+        result - PollResult instance or None if host didn't answer
+    '''
+    profile = profiler.active
+    started = time.perf_counter()
+    with profile.timer('sysdescr'):
+        sys_descr, sys_object_id = snmp_getter.sget_sys_ids(
+            ip, bool(card_matcher.object_ids))
+    if not sys_descr:
+        profile.host('no answer', time.perf_counter() - started)
+        return None
+    result = PollResult(ip)
+    dns = resolver.submit(check_domain, ip, settings, resolver)
+    with profile.timer('card'):
+        dev_card = choose_card(ip, sys_descr, settings, sys_object_id)
+    scalars, requests = split_requests(dev_card, settings)
+    with profile.timer('scalars'):
+        snmp_getter.sget_scalars(result, scalars)
+    if settings.location_transliteration != 'straight':
+        with profile.timer('translit'):
+            result.translit_location(settings.location_transliteration)
+    if dev_card:
+        apply_card(result, dev_card)
+        for param, method, oid in requests:
+            with profile.timer(method):
+                getattr(snmp_getter, method)(result, param, oid)
+    else:
+        result.c_model = 'unrecognized'
+    with profile.timer('dns_wait'):
+        result.dname = dns.result()
+    profile.host(result.c_model or 'unknown', time.perf_counter() - started)
+    return result
+
+
+def poller(num, shard, app_settings, group_settings, results,
+           num_threads, port=161):
+    '''Poll shard of hosts by pool of threads & send results to writer.
+    Function designed to run in separate process, every thread has its own
+    PySNMP engine. If update run is profiled, timings of process are
+    collected separately & sent to writer before the end
+    Args:
+        num - number of poller process
+        shard - list of ipaddress.IPv4Address instances
+        app_settings - instance of utils.load_settings.AppSettings
+        group_settings - instance of utils.load_settings.GroupSettings
+        results - multiprocessing.Queue to put attributes dictionaries of
+            PollResult instances into, dictionary with 'profile' key holding
+            SweepProfile.state & dictionary with 'finished' key holding
+            number of poller put at the end
+        num_threads - number of polling threads
+        port - UDP port of hosts (DEFAULT - 161)
+    No return value
+    '''
+    if not isinstance(profiler.active, profiler.NullProfile):
+        # forked copy of parent profile is dropped, writer has its timings
+        profiler.start_profile()
+    settings = FakeSettings(app_settings, group_settings)
+    resolver = make_resolver(settings)
+    q = Queue()
+
+    def poll_thread():
+        '''Get hosts from queue & poll them until None received
+        No args & return value
+        '''
+        snmp_getter = SnmpGetter(make_engine(), settings, port)
+        while True:
+            host = q.get()
+            if host is None:
+                close_engine(snmp_getter.engine)
+                break
+            result = poll_host(snmp_getter, host.exploded, settings,
+                               resolver)
+            if result:
+                results.put(vars(result))
+            q.task_done()
+
+    threads = [threading.Thread(target=poll_thread)
+               for _ in range(min(num_threads, len(shard)))]
+    for t in threads:
+        t.start()
+    for host in shard:
+        q.put(host)
+    q.join()
+    for t in threads:
+        q.put(None)
+    for t in threads:
+        t.join()
+    resolver.shutdown()
+    profile = profiler.stop_profile()
+    if not isinstance(profile, profiler.NullProfile):
+        results.put({'profile': profile.state()})
+    results.put({'finished': num})
+
+
+def apply_result(devdb, liveness, result):
+    '''Update or create device record with values received by poller. None
+    received for failed request doesn't replace value stored before
+    Args:
+        devdb - database tree with device records
+        liveness - utils.liveness.Liveness instance
+        result - dictionary with PollResult attributes
+    No return value
+    '''
+    device = register_device(devdb, result.pop('ip'), liveness)
+    device.set_domain_name(result.pop('dname'))
+    for attr, value in result.items():
+        if value is not None or getattr(device, attr, None) is None:
+            setattr(device, attr, value)
+    if 'vtree' in result:
+        # device card was applied, drop attributes it doesn't have anymore
+        for attr in CARD_OPTIONAL:
+            if attr not in result and hasattr(device, attr):
+                delattr(device, attr)
+                Device.changed_hosts.add(device.ip)
+    m_logger.info('{} ----> {}'.format(device.ip, device.c_model))
+
+
+def fork_supported():
+    '''Check that poller processes can be forked. Fork isn't available on
+    Windows & isn't safe on macOS, where system frameworks can crash in
+    forked child. Spawned process would run CLI module again & lose loaded
+    device cards, so there is no fallback to other start methods
+    No args
+    Return:
+        True or False
+    '''
+    return ('fork' in multiprocessing.get_all_start_methods() and
+            sys.platform != 'darwin')
+
+
+def sharded_update_run(hosts, app_settings, group_settings, db,
+                       num_processes, num_threads, batch=500, timeout=600,
+                       port=161):
+    '''Split hosts across poller processes & apply their results to database
+    in current process, which is the only one writer. Results are committed
+    in batches. Poller which exits without finishing its shard is reported
+    & the rest are waited for; if no poller sends anything for timeout
+    seconds, remaining pollers are terminated & received results committed
+    Args:
+        hosts - list of ipaddress.IPv4Address instances
+        app_settings - instance of utils.load_settings.AppSettings
+        group_settings - instance of utils.load_settings.GroupSettings
+        db - instance of ZODB.DB class
+        num_processes - number of poller processes
+        num_threads - number of polling threads in every process
+        batch - number of records in one transaction (DEFAULT - 500)
+        timeout - seconds to wait for any result from pollers (DEFAULT -
+            600)
+        port - UDP port of hosts (DEFAULT - 161)
+    No return value
+    '''
+    if not fork_supported():
+        raise RuntimeError('Sharded engine needs fork start method, which '
+                           'is not available on {}'.format(sys.platform))
+    num_processes = min(num_processes, len(hosts))
+    if not num_processes:
+        return
+    # fork is safe while parent has no threads running, callers must not
+    # start resolver or other pools before that
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = []
+    for num in range(num_processes):
+        p = context.Process(
+            target=poller, args=(num, hosts[num::num_processes],
+                                 app_settings, group_settings, results,
+                                 num_threads, port))
+        p.start()
+        processes.append(p)
+    settings = FakeSettings(app_settings, group_settings)
+    connection = db.open()
+    devdb = connection.root()[settings.db_tree]
+    liveness = connection.root()[liveness_key(settings.db_tree)]
+    running = set(range(num_processes))
+    applied = 0
+    last_result = time.monotonic()
+    try:
+        while running:
+            try:
+                result = results.get(timeout=1)
+            except Empty:
+                for num in sorted(running):
+                    # poller exited with 0 has its results in queue already
+                    if processes[num].exitcode not in (None, 0):
+                        m_logger.error(
+                            'Poller {} died with exit code {}, its hosts '
+                            'are not polled'.format(
+                                num, processes[num].exitcode))
+                        running.remove(num)
+                if time.monotonic() - last_result > timeout:
+                    m_logger.error('No results from pollers {} for {} '
+                                   'seconds, terminated'.format(
+                                       sorted(running), timeout))
+                    for num in running:
+                        processes[num].terminate()
+                    break
+                continue
+            last_result = time.monotonic()
+            if 'finished' in result:
+                running.discard(result['finished'])
+                continue
+            if 'profile' in result:
+                profiler.active.merge(result['profile'])
+                continue
+            with profiler.active.timer('apply'):
+                apply_result(devdb, liveness, result)
+            applied += 1
+            if applied % batch == 0:
+                with profiler.active.timer('commit'):
+                    transaction.commit()
+        with profiler.active.timer('commit'):
+            transaction.commit()
+    finally:
+        connection.close()
+        for p in processes:
+            p.join()
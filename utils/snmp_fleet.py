@@ -0,0 +1,470 @@
+'''Simulated fleet of SNMPv2c agents on loopback addresses for offline
+benchmarks & tests. Every device is served from its own 127.x.y.z address on UDP
+port 161 (Linux routes whole 127.0.0.0/8 to loopback, binding port 161
+needs root), devices are split across several agent processes, so agents
+don't share interpreter with poller being measured. Each device answers
+from recorded walk: synthetic one built from device card or snmpsim
+.snmprec file. Latency, jitter & loss of requests are simulated, agents
+count requests & time between first request & last answer of every device
+'''
+import re
+import time
+import heapq
+import random
+import socket
+import bisect
+import resource
+import selectors
+import multiprocessing
+from pyasn1.codec.ber import decoder, encoder
+from pyasn1.error import PyAsn1Error
+from pysnmp.proto import api
+from pysnmp.proto import rfc1902
+
+PROTO = api.PROTOCOL_MODULES[api.SNMP_VERSION_2C]
+SYS_DESCR_OID = '1.3.6.1.2.1.1.1.0'
+SYS_OBJECT_ID_OID = '1.3.6.1.2.1.1.2.0'
+SYS_CONTACT_OID = '1.3.6.1.2.1.1.4.0'
+SYS_NAME_OID = '1.3.6.1.2.1.1.5.0'
+SYS_LOCATION_OID = '1.3.6.1.2.1.1.6.0'
+IF_ALIAS_OID = '1.3.6.1.2.1.31.1.1.1.18'
+IF_HIGH_SPEED_OID = '1.3.6.1.2.1.31.1.1.1.15'
+# Value types of snmpsim .snmprec files (tag of BER type)
+SNMPREC_TYPES = {
+    '2': rfc1902.Integer, '4': rfc1902.OctetString,
+    '5': lambda value: PROTO.Null(''), '6': rfc1902.ObjectIdentifier,
+    '64': rfc1902.IpAddress, '65': rfc1902.Counter32,
+    '66': rfc1902.Gauge32, '67': rfc1902.TimeTicks,
+    '68': rfc1902.Opaque, '70': rfc1902.Counter64}
+# Responses larger than that are cut, as agents do with GETBULK answers
+MAX_MESSAGE = 65000
+
+
+def oid_key(oid):
+    '''Make sortable key from numerical OID
+    Args:
+        oid - string with numerical OID
+    Return:
+        tuple of integers
+    '''
+    return tuple(int(x) for x in oid.strip('.').split('.'))
+
+
+def load_snmprec(path):
+    '''Read recorded walk in snmpsim format, lines 'OID|TYPE|VALUE'. Hex
+    encoded values (TYPE with 'x' suffix) are supported
+    Args:
+        path - .snmprec file name
+    Return:
+        list of tuples (OID, TYPE, VALUE)
+    '''
+    walk = []
+    with open(path, 'r', encoding='utf-8') as rec_file:
+        for line in rec_file:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            oid, tag, value = line.split('|', 2)
+            if tag.endswith('x'):
+                tag = tag[:-1]
+                value = bytes.fromhex(value)
+                if tag != '4':
+                    value = value.decode('ascii')
+            walk.append((oid, tag, value))
+    return walk
+
+
+def card_walk(card, sys_descr, num, ports=26, vlans=20):
+    '''Build synthetic walk of device which recognized by device card:
+    system group, model & firmware, VLAN table & ifAlias/ifHighSpeed columns
+    Args:
+        card - device card
+        sys_descr - sysDescr value matching card info_pattern
+        num - card number, used in sysObjectID
+        ports - number of interfaces (DEFAULT - 26)
+        vlans - number of VLANs (DEFAULT - 20)
+    Return:
+        list of tuples (OID, TYPE, VALUE)
+    '''
+    walk = {SYS_DESCR_OID: ('4', sys_descr),
+            SYS_OBJECT_ID_OID: ('6', '1.3.6.1.4.1.9.1.{}'.format(1000 + num)),
+            SYS_CONTACT_OID: ('4', 'noc@fleet.local'),
+            SYS_NAME_OID: ('4', 'fleet'),
+            SYS_LOCATION_OID: ('4', '')}
+    if card['model_oid'] not in walk:
+        walk[card['model_oid']] = ('4', '{}-{}'.format(
+            card['series'].split('/')[0].replace(' ', '-'), ports - 2))
+    if 'version_pattern' in card:
+        walk[card['firmware_oid']] = ('4', '15.1R7.9')
+    else:
+        walk[card['firmware_oid']] = ('4', '12.2(55)SE12')
+    for vlan in range(1, vlans + 1):
+        vlan_id = str(vlan * 10 if vlan > 1 else 1)
+        if 'vlan_tree_by_oid' in card:
+            walk[card['vlans_oid'] + '.' + vlan_id] = ('2', '1')
+        else:
+            walk[card['vlans_oid'] + '.' + str(vlan)] = ('2', vlan_id)
+    for port in range(1, ports + 1):
+        walk['{}.{}'.format(IF_ALIAS_OID, port)] = (
+            '4', 'access port {}'.format(port))
+        walk['{}.{}'.format(IF_HIGH_SPEED_OID, port)] = (
+            '66', '1000' if port > ports - 2 else '100')
+    return [(oid, tag, value) for oid, (tag, value) in walk.items()]
+
+
+class SimulatedDevice:
+    '''Recorded walk of one device. Devices made from same walk share it &
+    keep only own values of several OIDs
+    instance attrs:
+        keys - sorted list of OID keys (shared)
+        values - dictionary with OID key as key & value as value (shared)
+        overlay - dictionary with OID key as key & own value as value
+    methods:
+        overloaded __init__
+        get
+        get_next
+    '''
+    def __init__(self, keys, values, overlay=None):
+        '''Initialize device
+        Args:
+            keys - sorted list of OID keys
+            values - dictionary with OID key as key & value as value
+            overlay - dictionary with own values (DEFAULT - None)
+        Overloaded
+        '''
+        self.keys = keys
+        self.values = values
+        self.overlay = overlay or {}
+
+    def get(self, key):
+        '''Get value of OID
+        Args:
+            key - OID key
+        Return:
+            value or None if there is no such OID
+        '''
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.values.get(key)
+
+    def get_next(self, key):
+        '''Get OID following given one in walk order
+        Args:
+            key - OID key
+        Return:
+            tuple (OID key, value) or None at end of walk
+        '''
+        pos = bisect.bisect_right(self.keys, key)
+        if pos == len(self.keys):
+            return None
+        following = self.keys[pos]
+        return following, self.get(following)
+
+
+def make_values(walk):
+    '''Convert walk into OID keys & PySNMP values
+    Args:
+        walk - list of tuples (OID, TYPE, VALUE)
+    Return:
+        tuple (sorted list of OID keys, dictionary of values)
+    '''
+    values = {oid_key(oid): SNMPREC_TYPES[tag](value)
+              for oid, tag, value in walk}
+    return sorted(values), values
+
+
+def build_devices(templates, overlays):
+    '''Make devices from walks, walk values are converted once per template
+    Args:
+        templates - list of walks
+        overlays - list of tuples (template index, dictionary with OID as key
+            & tuple (TYPE, VALUE) as value) for every device
+    Return:
+        list of SimulatedDevice instances
+    '''
+    converted = [make_values(walk) for walk in templates]
+    devices = []
+    for index, overlay in overlays:
+        keys, values = converted[index]
+        own = {oid_key(oid): SNMPREC_TYPES[tag](value)
+               for oid, (tag, value) in overlay.items()
+               if oid_key(oid) in values}
+        devices.append(SimulatedDevice(keys, values, own))
+    return devices
+
+
+def respond(device, message):
+    '''Build response message for request from poller
+    Args:
+        device - SimulatedDevice instance
+        message - bytes received from poller
+    Return:
+        bytes with response or None if request can't be decoded
+    '''
+    try:
+        request, _ = decoder.decode(message, asn1Spec=PROTO.Message())
+    except PyAsn1Error:
+        return None
+    pdu = PROTO.apiMessage.get_pdu(request)
+    response = PROTO.apiMessage.get_response(request)
+    response_pdu = PROTO.apiMessage.get_pdu(response)
+    requested = PROTO.apiPDU.get_varbinds(pdu)
+    var_binds = []
+    if pdu.isSameTypeWith(PROTO.GetRequestPDU()):
+        for oid, _ in requested:
+            value = device.get(tuple(oid))
+            var_binds.append((oid, PROTO.NoSuchObject('')
+                              if value is None else value))
+    elif pdu.isSameTypeWith(PROTO.GetNextRequestPDU()):
+        for oid, _ in requested:
+            var_binds.append(next_var_bind(device, tuple(oid)))
+    elif pdu.isSameTypeWith(PROTO.GetBulkRequestPDU()):
+        non_repeaters = int(PROTO.apiBulkPDU.get_non_repeaters(pdu))
+        repetitions = int(PROTO.apiBulkPDU.get_max_repetitions(pdu))
+        for oid, _ in requested[:non_repeaters]:
+            var_binds.append(next_var_bind(device, tuple(oid)))
+        columns = [tuple(oid) for oid, _ in requested[non_repeaters:]]
+        for _ in range(repetitions):
+            if not columns:
+                break
+            row = [next_var_bind(device, column) for column in columns]
+            var_binds.extend(row)
+            columns = [tuple(oid) for oid, _ in row]
+            if all(isinstance(value, PROTO.EndOfMibView)
+                   for _, value in row):
+                break
+    else:
+        return None
+    PROTO.apiPDU.set_varbinds(response_pdu, var_binds)
+    encoded = encoder.encode(response)
+    while len(encoded) > MAX_MESSAGE and len(var_binds) > 1:
+        var_binds = var_binds[:len(var_binds) // 2]
+        PROTO.apiPDU.set_varbinds(response_pdu, var_binds)
+        encoded = encoder.encode(response)
+    return encoded
+
+
+def next_var_bind(device, key):
+    '''Get variable binding following OID for GETNEXT & GETBULK
+    Args:
+        device - SimulatedDevice instance
+        key - OID key
+    Return:
+        tuple (OID, value), value is endOfMibView at end of walk
+    '''
+    found = device.get_next(key)
+    if found is None:
+        return rfc1902.ObjectName(key), PROTO.EndOfMibView('')
+    return rfc1902.ObjectName(found[0]), found[1]
+
+
+def serve(addresses, templates, overlays, options, control):
+    '''Serve devices in agent process until stop command. Commands from
+    control connection: 'stats' - send counters & reset them, 'stop'
+    Args:
+        addresses - list of IPv4 addresses of devices
+        templates - list of walks
+        overlays - list of tuples (template index, own values) for devices
+        options - dictionary with port, latency, jitter, loss & seed
+        control - multiprocessing connection
+    No return value
+    '''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < len(addresses) + 64 and hard != soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    devices = build_devices(templates, overlays)
+    rand = random.Random(options['seed'])
+    selector = selectors.DefaultSelector()
+    sockets = []
+    for address, device in zip(addresses, devices):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind((address, options['port']))
+        except OSError as exc:
+            control.send('{}:{} - {}'.format(address, options['port'], exc))
+            return
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, (address, device))
+        sockets.append(sock)
+    selector.register(control, selectors.EVENT_READ, None)
+    # (send time, sequence number, socket, response, poller address)
+    delayed = []
+    sequence = 0
+    # address: [first request time, last answer time, requests, dropped]
+    stats = {}
+    control.send('ready')
+    running = True
+    while running:
+        timeout = None
+        if delayed:
+            timeout = max(delayed[0][0] - time.monotonic(), 0)
+        for key, _ in selector.select(timeout):
+            if key.data is None:
+                command = control.recv()
+                if command == 'stats':
+                    control.send(stats)
+                    stats = {}
+                else:
+                    running = False
+                continue
+            address, device = key.data
+            while True:
+                try:
+                    message, poller = key.fileobj.recvfrom(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                now = time.monotonic()
+                stat = stats.setdefault(address, [now, now, 0, 0])
+                stat[2] += 1
+                if options['loss'] and rand.random() < options['loss']:
+                    stat[3] += 1
+                    continue
+                response = respond(device, message)
+                if response is None:
+                    continue
+                send_at = now + options['latency']
+                if options['jitter']:
+                    send_at += rand.uniform(0, options['jitter'])
+                sequence += 1
+                heapq.heappush(delayed, (send_at, sequence, key.fileobj,
+                                         response, poller, address))
+        now = time.monotonic()
+        while delayed and delayed[0][0] <= now:
+            _, _, sock, response, poller, address = heapq.heappop(delayed)
+            try:
+                sock.sendto(response, poller)
+            except OSError:
+                continue
+            stats[address][1] = time.monotonic()
+    for sock in sockets:
+        sock.close()
+
+
+class Fleet:
+    '''Simulated devices spread over agent processes
+    instance attrs:
+        addresses - list of IPv4 addresses of devices
+        templates - list of walks
+        overlays - list of tuples (template index, own values) for devices
+        options - dictionary with port, latency, jitter, loss & seed
+        processes - number of agent processes
+        workers - list of tuples (multiprocessing.Process, connection)
+    methods:
+        overloaded __init__
+        start
+        collect
+        stop
+        overloaded __enter__
+        overloaded __exit__
+    '''
+    def __init__(self, addresses, templates, overlays, latency=0.0,
+                 jitter=0.0, loss=0.0, processes=1, port=161, seed=0):
+        '''Initialize fleet, agents are not started
+        Args:
+            addresses - list of IPv4 addresses of devices
+            templates - list of walks
+            overlays - list of tuples (template index, own values) for every
+                device
+            latency - seconds before answer (DEFAULT - 0.0)
+            jitter - upper bound of random addition to latency (DEFAULT - 0.0)
+            loss - probability of request to be dropped (DEFAULT - 0.0)
+            processes - number of agent processes (DEFAULT - 1)
+            port - UDP port (DEFAULT - 161)
+            seed - seed of random generator for loss & jitter (DEFAULT - 0)
+        Overloaded
+        '''
+        self.addresses = addresses
+        self.templates = templates
+        self.overlays = overlays
+        self.options = {'latency': latency, 'jitter': jitter, 'loss': loss,
+                        'port': port, 'seed': seed}
+        self.processes = max(min(processes, len(addresses)), 1)
+        self.workers = []
+
+    def start(self):
+        '''Start agent processes & wait till all sockets are bound
+        No args & return value
+        '''
+        context = multiprocessing.get_context('fork')
+        for num in range(self.processes):
+            parent, child = context.Pipe()
+            options = dict(self.options, seed=self.options['seed'] + num)
+            process = context.Process(target=serve, daemon=True, args=(
+                self.addresses[num::self.processes], self.templates,
+                self.overlays[num::self.processes], options, child))
+            process.start()
+            child.close()
+            self.workers.append((process, parent))
+        for process, parent in self.workers:
+            try:
+                answer = parent.recv() if parent.poll(60) else 'timeout'
+            except EOFError:
+                answer = 'process died'
+            if answer != 'ready':
+                self.stop()
+                raise RuntimeError('Agent process failed to start: {}'.format(
+                    answer))
+
+    def collect(self):
+        '''Get counters of agents since start or previous call
+        No args
+        Return:
+            dictionary with address as key & list [first request time, last
+            answer time, requests, dropped requests] as value
+        '''
+        stats = {}
+        for _, parent in self.workers:
+            parent.send('stats')
+        for _, parent in self.workers:
+            stats.update(parent.recv())
+        return stats
+
+    def stop(self):
+        '''Stop agent processes
+        No args & return value
+        '''
+        for process, parent in self.workers:
+            try:
+                parent.send('stop')
+            except OSError:
+                pass
+        for process, _ in self.workers:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.workers = []
+
+    def __enter__(self):
+        '''Start agents
+        Overloaded
+        '''
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''Stop agents
+        Overloaded
+        '''
+        self.stop()
+        return False
+
+
+def fleet_addresses(first, number):
+    '''Get addresses of devices in 127.0.0.0/8 starting from first one,
+    addresses ending with 0 or 255 are skipped
+    Args:
+        first - first IPv4 address, e.g. '127.1.0.1'
+        number - number of addresses
+    Return:
+        list of IPv4 addresses
+    '''
+    start = int.from_bytes(socket.inet_aton(first), 'big')
+    addresses = []
+    while len(addresses) < number:
+        address = socket.inet_ntoa(start.to_bytes(4, 'big'))
+        start += 1
+        if not re.search(r'\.(0|255)$', address):
+            addresses.append(address)
+    if not addresses[-1].startswith('127.'):
+        raise ValueError('Fleet does not fit in 127.0.0.0/8')
+    return addresses
@@ -1,33 +1,59 @@
+import asyncio
 import logging
 import re
-from pysnmp.hlapi import *
+import threading
+import time
+from pysnmp.hlapi.v3arch.asyncio import (
+    SnmpEngine, CommunityData, ContextData, UdpTransportTarget,
+    ObjectIdentity, ObjectType, EndOfMibView, NoSuchObject, NoSuchInstance,
+    get_cmd, next_cmd, bulk_cmd, bulk_walk_cmd, walk_cmd)
+from pysnmp.proto import errind
+from pysnmp.smi import builder, view, compiler
+from utils import profiler
 
 
 m_logger = logging.getLogger('wwmode_app.utils.snmpget')
 
+SYS_OBJECT_ID_OID = '1.3.6.1.2.1.1.2.0'
+# error-status values of response PDU
+TOO_BIG = 1
+# agents which can't process GETBULK answer with noSuchName or genErr
+BULK_REFUSED = (2, 5)
+# PySNMP API is coroutines only, every thread run them in its own event loop
+thread_state = threading.local()
+# MIB compiler is shared by engines of process, see make_engine
+mib_compiler = []
+mib_compiler_lock = threading.Lock()
+
 
 class SnmpGetter:
     '''Class for retriving params from hosts
     args:
         engine - PySNMP engine
         settings - load_settings.FakeSettings instance
+        port - UDP port of hosts (DEFAULT - 161)
     methods:
         overloaded __init__
         sget_sys_description
+        sget_sys_ids
         sget_equal
+        sget_scalars
+        sget_table
         sget_uplink_list
         sget_vlan_list
     '''
-    def __init__(self, engine, settings):
+    def __init__(self, engine, settings, port=161):
         '''Initialize instance
         args:
             engine - PySNMP engine
             settings - load_settings.FakeSettings instance
+            port - UDP port of hosts (DEFAULT - 161)
         No return value
         overloaded
         '''
         self.engine = engine
         self.settings = settings
+        self.port = port
 
     def sget_sys_description(self, ip):
         '''Get host sysDescr value by SNMP get & produce instance snmp_get
@@ -38,13 +64,42 @@ class SnmpGetter:
             value - sysDescr value or None if request failed
         '''
         self.snmp_get = snmp_run(self.engine, self.settings.ro_community, ip,
-                                 'sysDescr', mib='SNMPv2-MIB')
+                                 'sysDescr', mib='SNMPv2-MIB', port=self.port)
+        started = time.perf_counter()
         error_indication, error_status, error_index, var_binds = next(
             self.snmp_get)
+        count_request(['SNMPv2-MIB::sysDescr'], started, error_indication)
         oid, value = process_output(error_indication, error_status,
                                     error_index, var_binds, ip)
         return value
 
+    def sget_sys_ids(self, ip, object_id=True):
+        '''Get host sysDescr & sysObjectID values in one SNMP get & produce
+        instance snmp_get attr like sget_sys_description does
+        args:
+            ip - IP address of host
+            object_id - request sysObjectID too (DEFAULT - True)
+        return:
+            tuple of sysDescr value & sysObjectID value, None for failed or
+            not requested ones
+        '''
+        if not object_id:
+            return self.sget_sys_description(ip), None
+        self.snmp_get = snmp_run(self.engine, self.settings.ro_community, ip,
+                                 'sysDescr', mib='SNMPv2-MIB', port=self.port,
+                                 more_oids=(SYS_OBJECT_ID_OID, ))
+        started = time.perf_counter()
+        error_indication, error_status, error_index, var_binds = next(
+            self.snmp_get)
+        count_request(['SNMPv2-MIB::sysDescr', SYS_OBJECT_ID_OID], started,
+                      error_indication)
+        oid, value = process_output(error_indication, error_status,
+                                    error_index, var_binds, ip)
+        if value is None or len(var_binds) < 2:
+            return value, None
+        # prettyPrint gives name from MIB, cards keep numerical OID
+        return value, str(var_binds[1][1])
+
     def sget_equal(self, device, param, oid):
         '''Get parameter from host by running SNMP get request & set it to
         device object
@@ -57,10 +112,40 @@ class SnmpGetter:
         oid, result = get_with_send(oid, device.ip, self.snmp_get)
         setattr(device, 'c_' + param, result)
 
+    def sget_scalars(self, device, params):
+        '''Get several parameters from host by running one SNMP get request
+        with all OIDs & set them to device object. Parameter which request
+        failed keeps value stored before, or set to None if there is none
+        args:
+            device - Device object
+            params - list of tuples (parameter name, SNMP OID)
+        No return value
+        '''
+        results = get_many([oid for param, oid in params], device.ip,
+                           self.snmp_get)
+        for (param, oid), result in zip(params, results):
+            if result is not None or not hasattr(device, 'c_' + param):
+                setattr(device, 'c_' + param, result)
+
+    def sget_table(self, ip, columns, mib=None):
+        '''Get columns of SNMP table from host by running SNMP bulk requests.
+        Values of different columns joined by row index
+        args:
+            ip - IP address of host
+            columns - list of column names or numerical OIDs
+            mib - MIB to query for (DEFAULT - None)
+        return:
+            result of table_fetch function
+        '''
+        return table_fetch(self.engine, self.settings.ro_community, ip,
+                           columns, mib=mib,
+                           max_repetitions=self.settings.max_repetitions,
+                           port=self.port)
+
     def sget_uplink_list(self, device, param, oid):
         '''Get list of uplink descriptions and speed of appropriate interface
-        from host by running SNMP walk and get requests & set list to device
-        object
+        from host by fetching ifAlias & ifHighSpeed columns in one table
+        request & set list to device object
         args:
             device - Device object
             param - requested parameter name
@@ -68,14 +153,12 @@ class SnmpGetter:
         No return value
         '''
         all_uplinks = []
-        for oid, if_descr in tree_walk(self.engine, self.settings.ro_community,
-                                       device.ip, 'ifAlias', mib='IF-MIB'):
+        if_table = self.sget_table(device.ip, ['ifAlias', 'ifHighSpeed'],
+                                   mib='IF-MIB')
+        for if_index, row in if_table.items():
+            if_descr = row.get('ifAlias')
             if if_descr and re.match(self.settings.uplink_pattern, if_descr):
-                if_index = oid.split('.')[-1]
-                oid, if_speed = get_with_send('ifHighSpeed', device.ip,
-                                              self.snmp_get, mib='IF-MIB',
-                                              index=if_index)
-                if_speed = if_speed + ' Mb/s'
+                if_speed = str(row.get('ifHighSpeed')) + ' Mb/s'
                 all_uplinks.append((if_descr, if_speed))
         setattr(device, 'c_' + param, all_uplinks)
 
@@ -89,8 +172,10 @@ class SnmpGetter:
         No return value
         '''
         all_vlans = []
-        for oid, vlan in tree_walk(self.engine, self.settings.ro_community,
-                                   device.ip, oid):
+        for oid, vlan in tree_walk(
+                self.engine, self.settings.ro_community, device.ip, oid,
+                max_repetitions=self.settings.max_repetitions,
+                port=self.port):
             if not oid:
                 m_logger.warning(
                     'No OID when running tree walk at {} on {}'.format(
@@ -104,12 +189,13 @@ class SnmpGetter:
 
 
 def snmp_run(engine, community_name, address, oid, mib=None, action='get',
-             port=161, index=0):
+             port=161, index=0, max_repetitions=50, max_calls=10,
+             more_oids=()):
     '''Create SNMP query generator & yield responses from it.
     Can do GET, BULKGET & NEXT queries. Can receive numerical OID, names of
     MIB & OID or names of MIB & OID + index number from wich to start
     Args:
-        engine - instance of pysnmp.hlapi.SnmpEngine class
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
         community_name - SNMP community for reading
         address - IPv4 address of host
         oid - OID to query for
@@ -120,19 +206,14 @@ def snmp_run(engine, community_name, address, oid, mib=None, action='get',
             next - snmpnext
         port - UDP port (DEFAULT - 161)
         index - OID index to query for (DEFAULT - 0)
+        max_repetitions - rows in one response for bulk action (DEFAULT - 50)
+        max_calls - requests limit for bulk action, 0 is unlimited
+            (DEFAULT - 10)
+        more_oids - numerical OIDs to add into first request (DEFAULT - ())
     Yield:
         SNMP response with contain indication of error, error status,
         error index and response
     '''
-    kw_args = {}
-    if action == 'bulk':
-        command_generator = bulkCmd
-        kw_args = {'maxCalls': 10}
-    elif action == 'next':
-        command_generator = nextCmd
-        kw_args = {'lexicographicMode': False}
-    else:
-        command_generator = getCmd
     if mib and action == 'get':
         object_identity = ObjectIdentity(mib, oid, index)
     elif mib and not oid:
@@ -141,13 +222,118 @@ def snmp_run(engine, community_name, address, oid, mib=None, action='get',
         object_identity = ObjectIdentity(mib, oid)
     else:
         object_identity = ObjectIdentity(oid)
+    object_types = [ObjectType(object_identity)]
+    object_types.extend(ObjectType(ObjectIdentity(oid)) for oid in more_oids)
     cmd_gen_args = [engine, CommunityData(community_name),
-                    UdpTransportTarget((address, port)), ContextData()]
-    if command_generator == bulkCmd:
-        cmd_gen_args.append(0)
-        cmd_gen_args.append(50)
-    cmd_gen_args.append(ObjectType(object_identity))
-    yield from command_generator(*cmd_gen_args, **kw_args)
+                    make_transport(address, port), ContextData()]
+    if action == 'bulk':
+        # GETBULK response is split in rows, as it was in PySNMP 4
+        for error_indication, error_status, error_index, var_binds in (
+                iterate_sync(bulk_walk_cmd(*cmd_gen_args, 0, max_repetitions,
+                                           object_types[0],
+                                           maxCalls=max_calls))):
+            if error_indication or error_status:
+                yield error_indication, error_status, error_index, var_binds
+                continue
+            for var_bind in var_binds:
+                yield error_indication, error_status, error_index, [var_bind]
+    elif action == 'next':
+        yield from iterate_sync(walk_cmd(*cmd_gen_args, object_types[0],
+                                         lexicographicMode=False))
+    else:
+        # new OIDs can be sent into generator, like in PySNMP 4 getCmd
+        while object_types:
+            object_types = yield run_sync(get_cmd(*cmd_gen_args,
+                                                  *object_types))
+
+
+def run_sync(coroutine):
+    '''Run PySNMP coroutine in event loop of current thread & wait for its
+    result. Loop is created on first call in thread, SnmpEngine must be used
+    by one thread only
+    Args:
+        coroutine - coroutine object
+    Return:
+        result of coroutine
+    '''
+    loop = getattr(thread_state, 'loop', None)
+    if loop is None:
+        loop = thread_state.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coroutine)
+
+
+def iterate_sync(async_generator):
+    '''Iterate over PySNMP async generator from synchronous code
+    Args:
+        async_generator - async generator object
+    Yield:
+        items of async_generator
+    '''
+    while True:
+        try:
+            yield run_sync(async_generator.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+def make_engine():
+    '''Create PySNMP engine with MIB view. PySNMP build MIB compiler for
+    every new MIB view on first request, that cost more CPU time than MIBs
+    loading, so compiler is built once & shared by all engines of process.
+    It's used only for MIBs which aren't shipped compiled
+    No args
+    Return:
+        instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+    '''
+    engine = SnmpEngine()
+    mib_builder = builder.MibBuilder()
+    with mib_compiler_lock:
+        if not mib_compiler:
+            compiler.add_mib_compiler(mib_builder, ifAvailable=True)
+            mib_compiler.append(mib_builder.get_mib_compiler())
+        elif mib_compiler[0] is not None:
+            mib_builder.set_mib_compiler(mib_compiler[0],
+                                         compiler.DEFAULT_DEST)
+    engine.cache['mibViewController'] = view.MibViewController(mib_builder)
+    return engine
+
+
+def close_engine(engine):
+    '''Release sockets of PySNMP engine & close event loop of current
+    thread, engine can't be used after that
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+    No return value
+    '''
+    engine.close_dispatcher()
+    loop = getattr(thread_state, 'loop', None)
+    if loop is not None:
+        # let cancelled timer task of dispatcher finish
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+        thread_state.loop = None
+
+
+def make_transport(address, port=161):
+    '''Create UDP transport target for host
+    Args:
+        address - IPv4 address of host
+        port - UDP port (DEFAULT - 161)
+    Return:
+        instance of UdpTransportTarget
+    '''
+    return run_sync(UdpTransportTarget.create((address, port)))
+
+
+def oid_tuple(name):
+    '''Get numerical OID from name of variable binding
+    Args:
+        name - ObjectIdentity or ObjectName instance
+    Return:
+        tuple of integers
+    '''
+    return tuple(name.get_oid() if hasattr(name, 'get_oid') else name)
 
 
 def process_output(error_indication, error_status, error_index, var_binds,
@@ -174,12 +360,36 @@ def process_output(error_indication, error_status, error_index, var_binds,
         return None, None
     else:
         full_oid = str(var_binds[0][0])
-        value = var_binds[0][1].prettyPrint()
-        if value.startswith("b'"):
-            value = value[2:].strip("'")
+        value = pretty_value(var_binds[0][1])
         return full_oid, value
 
 
+def pretty_value(value):
+    '''Convert SNMP value into string
+    Args:
+        value - value from SNMP response
+    Return:
+        value - string representation of value
+    '''
+    value = value.prettyPrint()
+    if value.startswith("b'"):
+        value = value[2:].strip("'")
+    return value
+
+
+def count_request(oids, started, error_indication):
+    '''Pass round trip of SNMP request to profile of current update run
+    Args:
+        oids - list of requested OIDs
+        started - time.perf_counter value before request
+        error_indication - error indication of response
+    No return value
+    '''
+    profiler.active.request(
+        oids, time.perf_counter() - started,
+        isinstance(error_indication, errind.RequestTimedOut))
+
+
 def get_with_send(oid, address, snmp_gen, mib=None, index=None):
     '''Send new query into SNMP GET command generator
     Args:
@@ -194,29 +404,283 @@ def get_with_send(oid, address, snmp_gen, mib=None, index=None):
     object_identity = (mib, oid) if mib else (oid, )
     if index:
         object_identity += (index, )
+    started = time.perf_counter()
     error_indication, error_status, error_index, var_binds = snmp_gen.send(
         [ObjectType(ObjectIdentity(*object_identity))])
+    count_request(['::'.join(str(x) for x in object_identity)], started,
+                  error_indication)
     return process_output(error_indication, error_status, error_index,
                           var_binds, address)
 
 
-def tree_walk(engine, community, ip, oid, mib=None):
-    '''Simulate SNMP WALK behaviour by creating GETNEXT generator with snmp_run
-    function & process it output with process_output function
+class AdaptiveWalk:
+    '''State of SNMP walk done with GETBULK requests. Number of
+    max-repetitions start small & grow up to number of rows already received,
+    so walk of small subtree doesn't fetch a lot past its boundary. On tooBig
+    error max-repetitions halved, and walk fall back to GETNEXT requests if
+    host can't answer on GETBULK at all
+    instance attrs:
+        object_type - ObjectType of subtree root
+        max_repetitions - upper limit of rows in one response
+        repetitions - rows requested in next request, 0 for GETNEXT
+        base - numerical OID of subtree root (tuple)
+        last - numerical OID of last received row (tuple)
+        total - rows received
+        done - flag that walk is finished
+    methods:
+        overloaded __init__
+        next_request
+        retry_on_error
+        accept
+    '''
+    start_repetitions = 8
+
+    def __init__(self, object_type, max_repetitions=50, bulk=True):
+        '''Initialize walk state
+        Args:
+            object_type - ObjectType of subtree root
+            max_repetitions - upper limit of rows in one response
+                (DEFAULT - 50)
+            bulk - use GETBULK requests (DEFAULT - True)
+        Overloaded
+        '''
+        self.object_type = object_type
+        self.max_repetitions = max(max_repetitions, 1)
+        self.repetitions = min(self.start_repetitions,
+                               self.max_repetitions) if bulk else 0
+        self.base = None
+        self.last = None
+        self.total = 0
+        self.done = False
+
+    def next_request(self):
+        '''Build ObjectType for next request
+        No args
+        Return:
+            ObjectType of subtree root or of last received row
+        '''
+        if self.last is None:
+            return self.object_type
+        return ObjectType(ObjectIdentity('.'.join(str(x) for x in self.last)))
+
+    def retry_on_error(self, error_indication, error_status):
+        '''Change request parameters after error if there is a way to
+        continue walk. Walk is retried only on errors reported by agent:
+        tooBig or GETBULK refused with genErr/noSuchName; timeouts & other
+        errors of request are final
+        Args:
+            error_indication
+            error_status
+        Return:
+            True if walk can be retried
+            False if error is final
+        '''
+        if error_indication or not self.repetitions or not error_status:
+            return False
+        status = int(error_status)
+        if status == TOO_BIG and self.repetitions > 1:
+            self.repetitions //= 2
+        elif status in (TOO_BIG, ) + BULK_REFUSED:
+            m_logger.debug('GETBULK failed, fall back to GETNEXT')
+            self.repetitions = 0
+        else:
+            return False
+        return True
+
+    def accept(self, var_binds):
+        '''Filter received rows: stop on subtree boundary, end of MIB or not
+        increasing OID, and adjust number of rows for next request
+        Args:
+            var_binds - list of (name, value) pairs from response
+        Return:
+            rows - list of (name, value) pairs that are inside subtree
+        '''
+        if self.base is None:
+            # ObjectType resolved against MIB by first request
+            self.base = oid_tuple(self.object_type[0])
+        rows = []
+        if not var_binds:
+            self.done = True
+        for name, value in var_binds:
+            oid = oid_tuple(name)
+            if (isinstance(value, (EndOfMibView, NoSuchObject,
+                                   NoSuchInstance)) or
+                    oid[:len(self.base)] != self.base):
+                self.done = True
+                break
+            if self.last is not None and oid <= self.last:
+                m_logger.warning('OID not increasing at {}'.format(name))
+                self.done = True
+                break
+            self.last = oid
+            rows.append((name, value))
+        self.total += len(rows)
+        if self.repetitions:
+            self.repetitions = min(max(self.total, self.repetitions),
+                                   self.max_repetitions)
+        return rows
+
+
+def get_many(oids, address, snmp_gen):
+    '''Send query for several OIDs in one PDU into SNMP GET command
+    generator. If host can't answer (tooBig or other error), request is split
+    in halves until failed OID found
     Args:
-        engine - instance of pysnmp.hlapi.SnmpEngine class
+        oids - list of numerical OIDs to query for
+        address - IPv4 address of device
+        snmp_gen - generator function snmp_run
+    Return:
+        list of values in order of OIDs, None for failed ones
+    '''
+    if not oids:
+        return []
+    started = time.perf_counter()
+    error_indication, error_status, error_index, var_binds = snmp_gen.send(
+        [ObjectType(ObjectIdentity(oid)) for oid in oids])
+    count_request(oids, started, error_indication)
+    if error_status and len(oids) > 1:
+        m_logger.debug('{} for {} OIDs at {}, split request'.format(
+            error_status.prettyPrint(), len(oids), address))
+        half = len(oids) // 2
+        return (get_many(oids[:half], address, snmp_gen) +
+                get_many(oids[half:], address, snmp_gen))
+    if error_indication or error_status:
+        process_output(error_indication, error_status, error_index,
+                       var_binds, address)
+        return [None] * len(oids)
+    return [pretty_value(value) for name, value in var_binds]
+
+
+def tree_walk(engine, community, ip, oid, mib=None, bulk=True,
+              max_repetitions=50, port=161):
+    '''Simulate SNMP WALK behaviour by sending GETBULK (or GETNEXT) requests
+    with AdaptiveWalk state & process output with process_output function
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
         community - SNMP community for reading
         ip - IPv4 address of host
         oid - OID to query for
         mib - MIB to query for (DEFAULT - None)
+        bulk - use GETBULK requests, host must support SNMPv2c
+            (DEFAULT - True)
+        max_repetitions - upper limit of rows in one GETBULK response
+            (DEFAULT - 50)
+        port - UDP port (DEFAULT - 161)
     Yield:
-        result of snmp_run -> process_output ->
+        result of process_output -> for every row; (None, None) on error,
+        after which walk stops
+    '''
+    walk = AdaptiveWalk(ObjectType(ObjectIdentity(mib, oid) if mib else
+                                   ObjectIdentity(oid)),
+                        max_repetitions=max_repetitions, bulk=bulk)
+    transport = make_transport(ip, port)
+    request_oid = '{}::{}'.format(mib, oid) if mib else oid
+    while not walk.done:
+        started = time.perf_counter()
+        if walk.repetitions:
+            error_indication, error_status, error_index, var_binds = run_sync(
+                bulk_cmd(engine, CommunityData(community), transport,
+                         ContextData(), 0, walk.repetitions,
+                         walk.next_request()))
+        else:
+            error_indication, error_status, error_index, var_binds = run_sync(
+                next_cmd(engine, CommunityData(community), transport,
+                         ContextData(), walk.next_request()))
+        count_request([request_oid], started, error_indication)
+        if error_indication or error_status:
+            if walk.retry_on_error(error_indication, error_status):
+                continue
+            yield process_output(error_indication, error_status, error_index,
+                                 var_binds, ip)
+            return
+        for row in walk.accept(var_binds):
+            yield process_output(None, None, None, [row], ip)
+
+
+def table_fetch(engine, community, ip, columns, mib=None, max_repetitions=25,
+                port=161):
+    '''Fetch several columns of SNMP table with GETBULK requests, every
+    request carry all columns, so one round trip bring max_repetitions rows.
+    Values are joined by row index locally
+    Args:
+        engine - instance of pysnmp.hlapi.v3arch.asyncio.SnmpEngine class
+        community - SNMP community for reading
+        ip - IPv4 address of host
+        columns - list of column names or numerical OIDs
+        mib - MIB to query for (DEFAULT - None)
+        max_repetitions - rows requested in one GETBULK (DEFAULT - 25)
+        port - UDP port (DEFAULT - 161)
+    Return:
+        table - dictionary with row index (string, like '10101') as key and
+            dictionary of column: value as value; rows ordered as host return
+            them; empty or partial if request failed
+    '''
+    table = {}
+    transport = make_transport(ip, port)
+    var_binds = [ObjectType(ObjectIdentity(mib, column) if mib else
+                            ObjectIdentity(column)) for column in columns]
+    request_oids = ['{}::{}'.format(mib, x) if mib else x for x in columns]
+    active = list(range(len(columns)))
+    bases = None
+    last = {}
+    while active:
+        started = time.perf_counter()
+        error_indication, error_status, error_index, var_bind_table = (
+            run_sync(bulk_cmd(engine, CommunityData(community), transport,
+                              ContextData(), 0, max_repetitions,
+                              *var_binds)))
+        count_request(request_oids, started, error_indication)
+        if error_indication or error_status:
+            process_output(error_indication, error_status, error_index,
+                           var_bind_table, ip)
+            break
+        if bases is None:
+            # ObjectTypes are resolved against MIB by first request
+            bases = [oid_tuple(x[0]) for x in var_binds]
+        active, var_binds = join_columns(table, columns, bases, active,
+                                         var_bind_table, last)
+    return table
+
+
+def join_columns(table, columns, bases, active, var_bind_table, last):
+    '''Put values of GETBULK response for several columns into table &
+    find columns which are not finished yet. Column is finished on subtree
+    boundary, end of MIB or not increasing OID, so broken agent which
+    repeats rows can't loop fetch forever
+    Args:
+        table - dictionary with row index as key and dictionary of
+            column: value as value, it's updated
+        columns - list of all column names or numerical OIDs
+        bases - list of numerical OIDs of all columns (tuples)
+        active - list of numbers of columns which were requested
+        var_bind_table - flat list of (name, value) pairs from response,
+            row by row
+        last - dictionary with column number as key and last numerical OID
+            received for it as value, it's updated
+    Return:
+        active - list of numbers of columns to request further
+        var_binds - list of ObjectTypes for next request
     '''
-    kw_args = {'action': 'next'}
-    if mib:
-        kw_args['mib'] = mib
-    snmp_next = snmp_run(engine, community, ip, oid, **kw_args)
-    for error_indication, error_status, error_index, var_binds in snmp_next:
-        r_oid, value = process_output(error_indication, error_status,
-                                      error_index, var_binds, ip)
-        yield r_oid, value
+    received = set()
+    finished = set()
+    for num, (name, value) in enumerate(var_bind_table):
+        col_num = active[num % len(active)]
+        if col_num in finished:
+            continue
+        oid = oid_tuple(name)
+        base = bases[col_num]
+        if isinstance(value, EndOfMibView) or oid[:len(base)] != base:
+            finished.add(col_num)
+            continue
+        if col_num in last and oid <= last[col_num]:
+            m_logger.warning('OID not increasing at {}'.format(name))
+            finished.add(col_num)
+            continue
+        index = '.'.join(str(x) for x in oid[len(base):])
+        table.setdefault(index, {})[columns[col_num]] = pretty_value(value)
+        last[col_num] = oid
+        received.add(col_num)
+    active = [x for x in active if x not in finished and x in received]
+    var_binds = [ObjectType(ObjectIdentity(
+        '.'.join(str(x) for x in last[col_num]))) for col_num in active]
+    return active, var_binds
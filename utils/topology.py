@@ -0,0 +1,353 @@
+import logging
+import ipaddress
+import re
+import transaction
+from persistent import Persistent
+from BTrees.OOBTree import OOBTree, OOTreeSet
+from utils.indexes import indexes_key
+from utils.exports import changed_hosts
+
+m_logger = logging.getLogger('wwmode_app.utils.topology')
+
+
+class Topology(Persistent):
+    '''Graph of uplink connections between devices, built from c_uplinks of
+    device records once per update run
+    instance attrs:
+        up - OOBTree with IP address as key and tuple of uplink devices IP
+            addresses as value
+        down - OOBTree with IP address as key and OOTreeSet of IP addresses
+            of devices connected to it as value
+        unresolved - OOBTree with IP address as key and tuple of uplink
+            names not found in DB (or IP addresses of deleted devices) as
+            value
+        tid - last DB transaction which changes of records are parsed
+            (None if graph was never built)
+    methods:
+        overloaded __init__
+        set_uplinks
+        remove
+        chain
+        downstream
+    '''
+    tid = None
+
+    def __init__(self):
+        '''Initialize empty graph
+        No args
+        Overloaded
+        '''
+        self.up = OOBTree()
+        self.down = OOBTree()
+        self.unresolved = OOBTree()
+
+    def set_uplinks(self, ip, uplinks, unresolved=()):
+        '''Store uplinks of device, nothing is written if they didn't change
+        Args:
+            ip - IPv4 address of device
+            uplinks - tuple of uplink devices IPv4 addresses
+            unresolved - tuple of uplink names not found in DB (DEFAULT - ())
+        No return value
+        '''
+        old = self.up.get(ip, ())
+        if old != uplinks:
+            for up in set(old) - set(uplinks):
+                self.down[up].remove(ip)
+                if not self.down[up]:
+                    del self.down[up]
+            for up in set(uplinks) - set(old):
+                if up not in self.down:
+                    self.down[up] = OOTreeSet()
+                self.down[up].insert(ip)
+            if uplinks:
+                self.up[ip] = uplinks
+            else:
+                del self.up[ip]
+        if self.unresolved.get(ip, ()) != unresolved:
+            if unresolved:
+                self.unresolved[ip] = unresolved
+            else:
+                del self.unresolved[ip]
+
+    def remove(self, ip):
+        '''Remove device from graph. Uplinks of other devices which led to it
+        become unresolved, till they are parsed again on update run
+        Args:
+            ip - IPv4 address of device
+        No return value
+        '''
+        self.set_uplinks(ip, ())
+        for down in list(self.down.get(ip, ())):
+            self.set_uplinks(
+                down, tuple(up for up in self.up[down] if up != ip),
+                self.unresolved.get(down, ()) + (ip, ))
+
+    def chain(self, ip):
+        '''Walk uplinks from device to upper level devices. Walk stops on
+        device which uplink leads to device already passed on same path, and
+        uplinks of device reached by several paths are walked only once
+        Args:
+            ip - IPv4 address of device
+        Return:
+            list of tuples (depth, IP address or uplink name, state), where
+            state is 'ok', 'unresolved', 'cycle' or 'seen' (device with
+            uplinks listed above); devices are listed in depth-first order
+        '''
+        chain = []
+        visited = set()
+        stack = [(ip, 0, ())]
+        while stack:
+            node, depth, path = stack.pop()
+            if node in path:
+                chain.append((depth, node, 'cycle'))
+                continue
+            if node in visited:
+                chain.append((depth, node, 'seen'))
+                continue
+            visited.add(node)
+            chain.append((depth, node, 'ok'))
+            path += (node, )
+            branches = [(up, depth + 1, path)
+                        for up in self.up.get(node, ())]
+            chain.extend((depth + 1, name, 'unresolved')
+                         for name in self.unresolved.get(node, ()))
+            stack.extend(reversed(branches))
+        return chain
+
+    def downstream(self, ip):
+        '''Find all devices which connected to device directly or through
+        other devices
+        Args:
+            ip - IPv4 address of device
+        Return:
+            list of tuples (depth, IP address) in breadth-first order
+        '''
+        found = []
+        seen = {ip}
+        level = [ip]
+        depth = 0
+        while level:
+            depth += 1
+            next_level = []
+            for node in level:
+                for down in self.down.get(node, ()):
+                    if down not in seen:
+                        seen.add(down)
+                        found.append((depth, down))
+                        next_level.append(down)
+            level = next_level
+        return found
+
+
+def topology_key(db_tree):
+    '''Get name of topology storage in DB root
+    Args:
+        db_tree - name of tree with device records
+    Return:
+        key of Topology instance in DB root
+    '''
+    return db_tree + '_topology'
+
+
+def full_dname(name, domain_prefix, default_zone):
+    '''Add default prefix & zone to short device name, like it written in
+    uplink descriptions
+    Args:
+        name - main part of domain name, with or without prefix
+        domain_prefix - default domain prefix
+        default_zone - default domain zone
+    Return:
+        FQDN or empty string if name can't be completed
+    '''
+    parts = len(name.split('.'))
+    if parts == 1:
+        return domain_prefix + '.' + name + '.' + default_zone
+    elif parts == 2:
+        return name + '.' + default_zone
+    elif default_zone and parts == len(default_zone.split('.')) + 1:
+        return domain_prefix + '.' + name
+    return ''
+
+
+def resolve_device(name, devdb, indexes, domain_prefix, default_zone):
+    '''Find device in DB by IP address or domain name
+    Args:
+        name - IP address, FQDN or main part of domain name
+        devdb - database tree with device records
+        indexes - utils.indexes.DeviceIndexes instance
+        domain_prefix - default domain prefix
+        default_zone - default domain zone
+    Return:
+        IPv4 address of device or None if it's not found
+    '''
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        pass
+    else:
+        return name if name in devdb else None
+    for dname in (name, full_dname(name, domain_prefix, default_zone)):
+        found = indexes.lookup('dname', dname)
+        if found:
+            return found[0]
+    return None
+
+
+def uplink_names(device, pattern):
+    '''Get names of uplink devices from uplink descriptions of device
+    Args:
+        device - Device instance
+        pattern - compiled uplink_pattern, name taken from 'device' group
+    Return:
+        list of names
+    '''
+    names = []
+    for descr, speed in getattr(device, 'c_uplinks', None) or ():
+        match = pattern.match(descr)
+        if not match:
+            continue
+        try:
+            names.append(match.group('device'))
+        except IndexError:
+            names.append(descr)
+    return names
+
+
+def parse_uplinks(device, pattern, devdb, indexes, settings):
+    '''Resolve names from uplink descriptions of device to devices in DB
+    Args:
+        device - Device instance
+        pattern - compiled uplink_pattern
+        devdb - database tree with device records
+        indexes - utils.indexes.DeviceIndexes instance
+        settings - instance of utils.load_settings.AppSettings
+    Return:
+        uplinks - tuple of uplink devices IPv4 addresses
+        unresolved - tuple of uplink names not found in DB
+    '''
+    uplinks = []
+    unresolved = []
+    for name in uplink_names(device, pattern):
+        up = resolve_device(name, devdb, indexes, settings.domain_prefix,
+                            settings.default_zone)
+        if up is None:
+            unresolved.append(name)
+        elif up not in uplinks:
+            uplinks.append(up)
+    return tuple(uplinks), tuple(unresolved)
+
+
+def update_topology(db, db_tree, settings, batch=1000):
+    '''Parse uplinks of devices & store graph in separate transaction. Only
+    devices which records were written after previous topology update are
+    parsed, with devices connected to them & devices with unresolved
+    uplinks; all devices are parsed when graph is built first time. Only
+    links which changed are written
+    Args:
+        db - instance of ZODB.DB class
+        db_tree - name of tree with device records
+        settings - instance of utils.load_settings.AppSettings
+        batch - number of records read between cache minimizations
+            (DEFAULT - 1000)
+    No return value
+    '''
+    pattern = re.compile(settings.uplink_pattern)
+    connection = db.open()
+    try:
+        dbroot = connection.root()
+        devdb = dbroot[db_tree]
+        indexes = dbroot[indexes_key(db_tree)]
+        if topology_key(db_tree) not in dbroot:
+            dbroot[topology_key(db_tree)] = Topology()
+        topology = dbroot[topology_key(db_tree)]
+        last_tid = db.storage.lastTransaction()
+        if topology.tid is None:
+            hosts = (set(devdb.keys()) | set(topology.up.keys()) |
+                     set(topology.unresolved.keys()))
+        else:
+            hosts = changed_hosts(connection, topology.tid)
+            # renamed device can be uplink of devices which didn't change
+            for ip in list(hosts):
+                hosts.update(topology.down.get(ip, ()))
+            # uplink names can match devices found since
+            hosts.update(topology.unresolved.keys())
+        for num, ip in enumerate(sorted(hosts), 1):
+            device = devdb.get(ip)
+            if device is None:
+                topology.remove(ip)
+                continue
+            topology.set_uplinks(ip, *parse_uplinks(
+                device, pattern, devdb, indexes, settings))
+            if num % batch == 0:
+                connection.cacheMinimize()
+        topology.tid = last_tid
+        transaction.commit()
+    finally:
+        connection.close()
+    m_logger.debug('Topology updated for {} hosts'.format(len(hosts)))
+
+
+def vlan_key(vlan):
+    '''Sorting key for VLANs, numbers are compared as integers
+    Args:
+        vlan - VLAN string
+    Return:
+        tuple for comparison
+    '''
+    return (0, int(vlan), '') if vlan.isdigit() else (1, 0, vlan)
+
+
+def vlan_chain(topology, indexes, vlan):
+    '''Build connected chains of devices with VLAN configured. Every chain
+    start from device which uplinks don't have that VLAN & go down through
+    devices which have it
+    Args:
+        topology - Topology instance
+        indexes - utils.indexes.DeviceIndexes instance
+        vlan - VLAN to look for
+    Return:
+        list of tuples (depth, IP address, tuple of uplinks IP addresses
+        without VLAN) in depth-first order
+    '''
+    members = set(indexes.lookup('vlan', vlan))
+    roots = [ip for ip in sorted(members)
+             if not any(up in members for up in topology.up.get(ip, ()))]
+    # devices connected only in cycle have no root, start from any of them
+    roots.extend(sorted(members))
+    chain = []
+    visited = set()
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            missing = () if depth else tuple(
+                up for up in topology.up.get(node, ()) if up not in members)
+            chain.append((depth, node, missing))
+            branches = []
+            for down in topology.down.get(node, ()):
+                if down in members and down not in visited:
+                    visited.add(down)
+                    branches.append((down, depth + 1))
+            stack.extend(reversed(branches))
+    return chain
+
+
+def vlan_gaps(topology, indexes, ip):
+    '''Find VLANs configured on device but not on any of its uplinks
+    Args:
+        topology - Topology instance
+        indexes - utils.indexes.DeviceIndexes instance
+        ip - IPv4 address of device
+    Return:
+        sorted list of VLANs (empty if device has no known uplinks)
+    '''
+    uplinks = topology.up.get(ip, ())
+    if not uplinks:
+        return []
+    upper = set()
+    for up in uplinks:
+        upper.update(indexes.device_vlans(up))
+    return sorted(set(indexes.device_vlans(ip)) - upper, key=vlan_key)
@@ -1,21 +1,43 @@
 import re
+import sys
 import socket
 import logging
 import datetime
-from pysnmp.hlapi import SnmpEngine
+import time
+from array import array
 import transaction
 from persistent import Persistent
-from utils.snmpget import SnmpGetter
-from utils.load_cards import retrive
+from utils.snmpget import SnmpGetter, make_engine, close_engine
+from utils.load_cards import retrive, CardMatcher
 from lexicon.translate import convert
 from utils.wwmode_exception import WWModeException
+from utils.liveness import liveness_key
+from utils.indexes import INDEXED_ATTRS
+from utils import profiler
 
 
+# Marker for absent attribute in Device.__setattr__
+_MISSING = object()
+
 # Retrive all cards once when module imported
 device_cards = retrive()
+card_matcher = CardMatcher(device_cards)
 
 m_logger = logging.getLogger('wwmode_app.utils.update_db')
 
+LOCATION_OID = '1.3.6.1.2.1.1.6.0'
+CONTACT_OID = '1.3.6.1.2.1.1.4.0'
+
+# Version of Device pickled state, legacy records are stored as plain dict
+STATE_VERSION = 1
+# Attributes stored in fixed positions of Device state
+STATE_FIELDS = ('ip', 'first_seen', 'dname', 'liveness', 'vtree',
+                'rancid_type', 'c_model', 'c_firmware', 'c_location',
+                'c_contact')
+# String attributes repeated across many records, interned when loaded
+INTERNED_FIELDS = ('rancid_type', 'c_model', 'c_firmware', 'c_contact')
+UPLINK_SPEED_RE = re.compile(r'^(\d+) Mb/s$')
+
 
 class SupplyZoneNameError(WWModeException):
     '''Exception to be raised if there are errors in default_zone setting'''
@@ -33,19 +55,31 @@ class Device(Persistent):
         num_instances - all created instances (represent new hosts)
         new_hosts - list of new hosts finded in last run
         founded_hosts - all hosts that found on the run
+        seen_hosts - list of hosts found on the run
+        changed_hosts - set of hosts which indexed attributes changed on the
+            run
         ip - IPv4 address of device
         first_seen - datetime when instance created
+        liveness - utils.liveness.Liveness instance shared by all devices
+        last_seen (property) - time of last run where device was found
     methods:
         overloaded __init__
         overloaded __str__
+        overloaded __setattr__
+        overloaded __delattr__
         test_domain_name
+        set_domain_name
         translit_location
         check_supply_zone
+        overloaded __getstate__
+        overloaded __setstate__
         _p_resolveConflict (can be not working at all)
     '''
     num_instances = 0
     founded_hosts = 0
     new_hosts = []
+    seen_hosts = []
+    changed_hosts = set()
 
     def __init__(self, ip):
         '''Initialize instance, add 1 to class num_instances counters
@@ -82,6 +116,140 @@ class Device(Persistent):
                                               getattr(self, attr))
         return prstr + dnamestr + addstr[:-1]  # remove last linefeed
 
+    def __setattr__(self, name, value):
+        '''Set attribute only if its value differs from stored one, so
+        unchanged record is not rewritten into database on every run.
+        Original values of changed attributes are kept till the end of
+        transaction; if all of them get original values back (like location
+        before and after transliteration) & record has no other changes
+        (deleted attributes, changes marked by _p_changed), record is
+        unchanged again
+        Args:
+            name - attribute name
+            value - new value
+        No return value
+        Overloaded
+        '''
+        if name.startswith(('_p_', '_v_')):
+            if name == '_p_changed' and value and self._p_jar is not None:
+                # change made in place, it can't be undone by attributes
+                self._v_untracked = self._p_serial
+            Persistent.__setattr__(self, name, value)
+            return
+        if self._p_jar is None:
+            if name in INDEXED_ATTRS:
+                Device.changed_hosts.add(self.ip)
+            Persistent.__setattr__(self, name, value)
+            return
+        current = getattr(self, name, _MISSING)
+        if type(current) is type(value) and current == value:
+            return
+        if name in INDEXED_ATTRS:
+            Device.changed_hosts.add(self.ip)
+        serial, original = getattr(self, '_v_original', (None, {}))
+        if serial != self._p_serial:
+            # values from previous transaction are stale
+            original = {}
+            self._v_original = (self._p_serial, original)
+        if not original and self._p_changed:
+            # record was changed before, not through tracked attributes
+            self._v_untracked = self._p_serial
+        if name not in original:
+            original[name] = current
+        Persistent.__setattr__(self, name, value)
+        if (type(original[name]) is type(value) and
+                original[name] == value):
+            del original[name]
+            if (not original and
+                    getattr(self, '_v_untracked', None) != self._p_serial):
+                self._p_changed = False
+
+    def __delattr__(self, name):
+        '''Delete attribute & remember that record has change which can't be
+        undone by restoring other attributes
+        Args:
+            name - attribute name
+        No return value
+        Overloaded
+        '''
+        Persistent.__delattr__(self, name)
+        if name.startswith(('_p_', '_v_')):
+            return
+        if name in INDEXED_ATTRS:
+            Device.changed_hosts.add(self.ip)
+        if self._p_jar is not None:
+            self._v_untracked = self._p_serial
+
+    @property
+    def last_seen(self):
+        '''Time of last update run where device was found. Records created
+        before Liveness storage keep that time in own attribute
+        No args
+        Return:
+            time string or 'never'
+        '''
+        liveness = getattr(self, 'liveness', None)
+        if liveness is None:
+            return self.__dict__.get('last_seen', 'never')
+        return liveness.last_seen(self.ip) or 'never'
+
+    def __getstate__(self):
+        '''Pack record into compact versioned state instead of attributes
+        dictionary: known attributes are kept in fixed positions, so their
+        names are not pickled with every record, VLANs are packed into
+        array of unsigned shorts & uplinks into flat tuple. Values which
+        can't be packed are kept in dictionary of other attributes
+        No args
+        Return:
+            tuple (version, presence mask, fixed values, VLANs, uplinks,
+                dictionary of other attributes)
+        Overloaded
+        '''
+        other = Persistent.__getstate__(self)
+        mask = 0
+        fixed = []
+        for num, name in enumerate(STATE_FIELDS):
+            if name in other:
+                mask |= 1 << num
+                fixed.append(other.pop(name))
+            else:
+                fixed.append(None)
+        vlans = pack_vlans(other.get('c_vlans'))
+        if vlans is not None:
+            del other['c_vlans']
+        uplinks = pack_uplinks(other.get('c_uplinks'))
+        if uplinks is not None:
+            del other['c_uplinks']
+        return STATE_VERSION, mask, tuple(fixed), vlans, uplinks, other
+
+    def __setstate__(self, state):
+        '''Restore record from state made by __getstate__ or from legacy
+        attributes dictionary. Repeated strings are interned, so records of
+        same model share them in memory
+        Args:
+            state - pickled state
+        No return value
+        Overloaded
+        '''
+        if isinstance(state, tuple) and state and isinstance(state[0], int):
+            version, mask, fixed, vlans, uplinks, other = state
+            attrs = dict(other)
+            for num, name in enumerate(STATE_FIELDS):
+                if mask & 1 << num:
+                    attrs[name] = fixed[num]
+            if vlans is not None:
+                attrs['c_vlans'] = unpack_vlans(vlans)
+            if uplinks is not None:
+                attrs['c_uplinks'] = unpack_uplinks(uplinks)
+        else:
+            version = 0
+            attrs = dict(state)
+        for name in INTERNED_FIELDS:
+            if isinstance(attrs.get(name), str):
+                attrs[name] = sys.intern(attrs[name])
+        Persistent.__setstate__(self, attrs)
+        self._v_state_version = version
+
     def _p_resolveConflict(self, old_state, saved_state, new_state):
         '''Method for DB conflicts to be resolved. As we do not trying to
         write devices by many threads it just save new_state, resolving
@@ -103,31 +271,28 @@ class Device(Persistent):
         to same IP address, log error if not
         No args & return value
         '''
-        try:
-            got_dname, alias, addresslist = socket.gethostbyaddr(self.ip)
+        self.set_domain_name(resolve_domain_name(self.ip))
+
+    def set_domain_name(self, got_dname):
+        '''Set device FQDN received from DNS. Device with changed domain name
+        considered new
+        Args:
+            got_dname - domain name from PTR record or empty string if none
+        No return value
+        '''
+        if got_dname:
             has_dname = hasattr(self, 'dname')
             if (has_dname and self.dname != got_dname) or not has_dname:
                 Device.new_hosts.append(self.ip)
                 Device.num_instances += 1
-                self.dname = got_dname
-            try:
-                return_ip = socket.gethostbyname(self.dname)
-                if self.ip != return_ip:
-                    m_logger.warning(
-                        '{}: DNS: A record not same as PTR'.format(self.ip))
-            except socket.gaierror:
-                m_logger.warning('{}: DNS: No A record on received PTR'.format(
-                    self.ip))
-        except socket.herror:
-            m_logger.warning('{}: DNS: No PTR record for that host'.format(
-                self.ip))
-            self.dname = ''
-
-    def check_supply_zone(self, zone, splitdots):
+        self.dname = got_dname
+
+    def check_supply_zone(self, zone, splitdots, resolver=socket):
         '''Check for presence of domain name same as device name in supply_zone
         Args:
             zone - supply zone name, e.g. 'mon.local'
             splitdots - how many domain levels to split from device domain name
+            resolver - object with gethostbyname function (DEFAULT - socket)
         Return:
             False if there is no domain name for device
             True if domain name presented in supply zone
@@ -140,7 +305,7 @@ class Device(Persistent):
         except IndexError:
             return SupplyZoneNameError
         try:
-            socket.gethostbyname(name + '.' + zone)
+            resolver.gethostbyname(name + '.' + zone)
         except:
             raise NoNameInSupplyZone
         else:
@@ -161,7 +326,292 @@ class Device(Persistent):
             pass
 
 
-def worker(queue, settings, db):
+def pack_vlans(vlans):
+    '''Pack list of VLAN numbers into bytes of unsigned shorts array
+    Args:
+        vlans - list of VLAN numbers as decimal strings
+    Return:
+        bytes or None if list can't be packed
+    '''
+    if not isinstance(vlans, list):
+        return None
+    numbers = array('H')
+    for vlan in vlans:
+        if not (isinstance(vlan, str) and vlan.isdigit() and
+                str(int(vlan)) == vlan and int(vlan) <= 0xffff):
+            return None
+        numbers.append(int(vlan))
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def unpack_vlans(packed):
+    '''Unpack VLAN list packed by pack_vlans
+    Args:
+        packed - bytes of unsigned shorts array
+    Return:
+        list of VLAN numbers as decimal strings
+    '''
+    numbers = array('H')
+    numbers.frombytes(packed)
+    if sys.byteorder == 'big':
+        numbers.byteswap()
+    return [str(vlan) for vlan in numbers]
+
+
+def pack_uplinks(uplinks):
+    '''Pack list of uplinks into flat tuple of descriptions & speeds
+    Args:
+        uplinks - list of tuples (description, speed in 'N Mb/s' form)
+    Return:
+        tuple (description, speed as int, ...) or None if list can't be
+        packed
+    '''
+    if not isinstance(uplinks, list):
+        return None
+    packed = []
+    for uplink in uplinks:
+        if not (isinstance(uplink, tuple) and len(uplink) == 2 and
+                isinstance(uplink[0], str) and isinstance(uplink[1], str)):
+            return None
+        speed = UPLINK_SPEED_RE.match(uplink[1])
+        if not speed or str(int(speed.group(1))) != speed.group(1):
+            return None
+        packed.extend((uplink[0], int(speed.group(1))))
+    return tuple(packed)
+
+
+def unpack_uplinks(packed):
+    '''Unpack uplink list packed by pack_uplinks
+    Args:
+        packed - tuple (description, speed as int, ...)
+    Return:
+        list of tuples (description, speed in 'N Mb/s' form)
+    '''
+    return [(packed[num], sys.intern('{} Mb/s'.format(packed[num + 1])))
+            for num in range(0, len(packed), 2)]
+
+
+def resolve_domain_name(ip, resolver=socket):
+    '''Get FQDN from PTR record of IP address & test that A record of PTR
+    value point to same IP address, log error if not. Function doesn't touch
+    database, so it safe to run it outside of thread which own connection
+    Args:
+        ip - string representation of device IPv4 address
+        resolver - object with gethostbyaddr & gethostbyname functions, like
+            socket module or utils.resolver.CachingResolver (DEFAULT - socket)
+    Return:
+        got_dname - domain name or empty string if there is no PTR record
+    '''
+    try:
+        got_dname, alias, addresslist = resolver.gethostbyaddr(ip)
+    except socket.herror:
+        m_logger.warning('{}: DNS: No PTR record for that host'.format(ip))
+        return ''
+    try:
+        return_ip = resolver.gethostbyname(got_dname)
+        if ip != return_ip:
+            m_logger.warning('{}: DNS: A record not same as PTR'.format(ip))
+    except socket.gaierror:
+        m_logger.warning('{}: DNS: No A record on received PTR'.format(ip))
+    return got_dname
+
+
+def register_device(devdb, ip, liveness):
+    '''Get device record from database or create new one if host was not
+    seen before & mark it as seen on that run. Run itself stored in Liveness
+    storage by utils.liveness.record_sweep after all hosts polled
+    Args:
+        devdb - database tree with device records
+        ip - string representation of device IPv4 address
+        liveness - utils.liveness.Liveness instance from same connection
+    Return:
+        device - Device instance
+    '''
+    if ip not in devdb:
+        devdb[ip] = Device(ip)
+    device = devdb[ip]
+    Device.founded_hosts += 1
+    Device.seen_hosts.append(ip)
+    device.liveness = liveness
+    device._p_activate()
+    if 'last_seen' in device.__dict__:
+        # drop time kept in record before Liveness storage was introduced
+        del device.__dict__['last_seen']
+        device._p_changed = True
+    return device
+
+
+def check_dns(device, settings):
+    '''Run domain name checks on device & log problems found
+    Args:
+        device - Device instance
+        settings - instance of utils.load_settings.FakeSettings
+    No return value
+    '''
+    with profiler.active.timer('dns'):
+        device.test_domain_name()
+        check_supply(device, settings)
+
+
+def check_supply(device, settings, resolver=socket):
+    '''Check device presence in supply zone if it set & log problems found
+    Args:
+        device - Device instance
+        settings - instance of utils.load_settings.FakeSettings
+        resolver - object with gethostbyname function (DEFAULT - socket)
+    No return value
+    '''
+    if settings.supply_zone:
+        try:
+            device.check_supply_zone(settings.supply_zone,
+                                     len(settings.default_zone.split('.')),
+                                     resolver)
+        except SupplyZoneNameError:
+            m_logger.error(
+                'DNS: Incorrect parameters for supply zone check')
+        except NoNameInSupplyZone:
+            m_logger.warning('{}: DNS: no domain name in {} zone'.format(
+                device.ip, settings.supply_zone))
+
+
+class DomainCheck:
+    '''Domain name of host checked outside of thread which own DB
+    connection, so record is not touched
+    instance attrs:
+        ip - string representation of device IPv4 address
+        dname - domain name or empty string
+    methods:
+        overloaded __init__
+        check_supply_zone
+    '''
+    check_supply_zone = Device.check_supply_zone
+
+    def __init__(self, ip, dname):
+        '''Initialize instance
+        Args:
+            ip - string representation of device IPv4 address
+            dname - domain name or empty string
+        Overloaded
+        '''
+        self.ip = ip
+        self.dname = dname
+
+
+def check_domain(ip, settings, resolver=socket):
+    '''Run domain name checks on host & log problems found, same as
+    check_dns does, but without device record
+    Args:
+        ip - string representation of device IPv4 address
+        settings - instance of utils.load_settings.FakeSettings
+        resolver - object with gethostbyaddr & gethostbyname functions
+            (DEFAULT - socket)
+    Return:
+        domain name or empty string if there is no PTR record
+    '''
+    with profiler.active.timer('dns'):
+        checked = DomainCheck(ip, resolve_domain_name(ip, resolver))
+        check_supply(checked, settings, resolver)
+    return checked.dname
+
+
+def apply_domains(pending, wait=False):
+    '''Set domain names checked by resolver on device records
+    Args:
+        pending - list of tuples (Device instance, future of check_domain)
+        wait - wait for all checks to finish (DEFAULT - False)
+    Return:
+        list of tuples for checks still running
+    '''
+    running = []
+    for device, future in pending:
+        if wait or future.done():
+            device.set_domain_name(future.result())
+        else:
+            running.append((device, future))
+    return running
+
+
+def choose_card(ip, sys_descr, settings, sys_object_id=None):
+    '''Find device card for host using static bindings, sysObjectID or
+    sysDescr value
+    Args:
+        ip - string representation of device IPv4 address
+        sys_descr - sysDescr value received from host
+        settings - instance of utils.load_settings.FakeSettings
+        sys_object_id - sysObjectID value received from host (DEFAULT - None)
+    Return:
+        card - device card or None if host not recognized
+    '''
+    return card_matcher.choose(ip, sys_descr, settings.bind_dict,
+                               sys_object_id)
+
+
+def apply_card(device, dev_card):
+    '''Set attributes that come from device card on device record
+    Args:
+        device - Device instance
+        dev_card - device card
+    No return value
+    '''
+    device.vtree = True if 'vlan_tree_by_oid' in dev_card else False
+    device.rancid_type = dev_card[
+        'rancid_type'] if 'rancid_type' in dev_card else 'cisco'
+    if 'version_pattern' in dev_card:
+        device.version_pattern = dev_card['version_pattern']
+    elif hasattr(device, 'version_pattern'):
+        del device.version_pattern
+        Device.changed_hosts.add(device.ip)
+
+
+def wanted_requests(dev_card, settings):
+    '''Build list of parameters to retrive from host with device card
+    Args:
+        dev_card - device card
+        settings - instance of utils.load_settings.FakeSettings
+    Return:
+        requests - list of tuples (parameter name, name of SnmpGetter sget_*
+            method, OID)
+    '''
+    requests = []
+    wanted_params = dict(settings.group_wanted)
+    wanted_params.update(settings.wanted_params)
+    for param in wanted_params.keys():
+        if param == 'uplinks':
+            oid = 'well-known'  # IF-MIB:ifAlias is well-known :)
+        elif param + '_oid' not in dev_card.keys():
+            m_logger.warning('No OID for {}'.format(param))
+            continue
+        else:
+            oid = dev_card[param + '_oid']
+        requests.append((param, 'sget_' + wanted_params[param], oid))
+    return requests
+
+
+def split_requests(dev_card, settings):
+    '''Split parameters to retrive from host into scalars, which are fetched
+    all together by one SNMP GET, and others. Location & contact are scalars
+    for every host
+    Args:
+        dev_card - device card or None if host not recognized
+        settings - instance of utils.load_settings.FakeSettings
+    Return:
+        scalars - list of tuples (parameter name, OID)
+        requests - list of other requests in wanted_requests format
+    '''
+    scalars = [('location', LOCATION_OID), ('contact', CONTACT_OID)]
+    requests = []
+    if dev_card:
+        for param, method, oid in wanted_requests(dev_card, settings):
+            if method == 'sget_equal':
+                scalars.append((param, oid))
+            else:
+                requests.append((param, method, oid))
+    return scalars, requests
+
+
+def worker(queue, settings, db, resolver=None):
     '''Update database by send request on all suplied hosts. Function designed
     for multithreaded use, so it get hosts from Queue. If host answer on
     sysDescr query, function try to recognize model and update or create new
@@ -171,76 +621,66 @@ def worker(queue, settings, db):
             from settings
         settings - instance of utils.load_settings.Settings
         db - instance of ZODB.DB class
+        resolver - utils.resolver.CachingResolver instance to run DNS checks
+            alongside SNMP requests, without it checks run in worker
+            (DEFAULT - None)
     No return value
     Note: PySNMP compile SNMPv2-MIB::sysLocation & sysContact into OID
     without last 0. Second strange thing index=0 doesn't work at all. So I
     use numerical OID to retrive location and contact.
     '''
-    location_oid = '1.3.6.1.2.1.1.6.0'
-    contact_oid = '1.3.6.1.2.1.1.4.0'
-    engine = SnmpEngine()
+    engine = make_engine()
     connection = db.open()
     dbroot = connection.root()
-    devdb = dbroot['devicedb']
+    devdb = dbroot[settings.db_tree]
+    liveness = dbroot[liveness_key(settings.db_tree)]
+    profile = profiler.active
+    pending = []
     while True:
-        dev_card = None
-        host = queue.get()
+        with profile.timer('queue_wait'):
+            host = queue.get()
         if host is None:
-            transaction.commit()
+            with profile.timer('dns_wait'):
+                apply_domains(pending, wait=True)
+            with profile.timer('commit'):
+                transaction.commit()
             connection.close()
+            close_engine(engine)
             break
+        started = time.perf_counter()
         snmp_getter = SnmpGetter(engine, settings)
-        sys_descr = snmp_getter.sget_sys_description(host.exploded)
+        with profile.timer('sysdescr'):
+            sys_descr, sys_object_id = snmp_getter.sget_sys_ids(
+                host.exploded, bool(card_matcher.object_ids))
         if not sys_descr:
+            profile.host('no answer', time.perf_counter() - started)
             queue.task_done()
             continue
-        if host.exploded not in devdb:
-            devdb[host.exploded] = Device(host.exploded)
-        device = devdb[host.exploded]
-        Device.founded_hosts += 1
-        device.last_seen = datetime.datetime.now().strftime('%d-%m-%Y %H:%M')
-        snmp_getter.sget_equal(device, 'location', location_oid)
-        snmp_getter.sget_equal(device, 'contact', contact_oid)
+        device = register_device(devdb, host.exploded, liveness)
+        if resolver:
+            pending.append((device, resolver.submit(
+                check_domain, device.ip, settings, resolver)))
+        with profile.timer('card'):
+            dev_card = choose_card(device.ip, sys_descr, settings,
+                                   sys_object_id)
+        scalars, requests = split_requests(dev_card, settings)
+        with profile.timer('scalars'):
+            snmp_getter.sget_scalars(device, scalars)
         if settings.location_transliteration != 'straight':
-            device.translit_location(settings.location_transliteration)
-        device.test_domain_name()
-        if settings.supply_zone:
-            try:
-                device.check_supply_zone(settings.supply_zone,
-                                         len(settings.default_zone.split('.')))
-            except SupplyZoneNameError:
-                m_logger.error(
-                    'DNS: Incorrect parameters for supply zone check')
-            except NoNameInSupplyZone:
-                m_logger.warning('{}: DNS: no domain name in {} zone'.format(
-                    device.ip, settings.supply_zone))
-        for card in device_cards:
-            if device.ip in settings.bind_dict.keys():
-                if settings.bind_dict[device.ip] == card[
-                        'vendor'] + ' ' + card['series']:
-                    dev_card = card
-                    break
-            elif re.search(card['info_pattern'], sys_descr):
-                dev_card = card
-                break
+            with profile.timer('translit'):
+                device.translit_location(settings.location_transliteration)
+        if not resolver:
+            check_dns(device, settings)
         if dev_card:
-            device.vtree = True if 'vlan_tree_by_oid' in dev_card else False
-            device.rancid_type = dev_card[
-                'rancid_type'] if 'rancid_type' in dev_card else 'cisco'
-            wanted_params = settings.group_wanted
-            wanted_params.update(settings.wanted_params)
-            for param in wanted_params.keys():
-                if param == 'uplinks':
-                    oid = 'well-known'  # IF-MIB:ifAlias is well-known :)
-                elif param + '_oid' not in dev_card.keys():
-                    m_logger.warning('No OID for {}'.format(param))
-                    continue
-                else:
-                    oid = dev_card[param + '_oid']
-                getattr(snmp_getter, 'sget_' + wanted_params[param])(
-                    device, param, oid)
+            apply_card(device, dev_card)
+            for param, method, oid in requests:
+                with profile.timer(method):
+                    getattr(snmp_getter, method)(device, param, oid)
             m_logger.info('{} ----> {}'.format(host, device.c_model))
         else:
             device.c_model = 'unrecognized'
             m_logger.info('{} unrecognized...'.format(host))
+        pending = apply_domains(pending)
+        profile.host(device.c_model or 'unknown',
+                     time.perf_counter() - started)
         queue.task_done()
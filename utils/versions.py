@@ -0,0 +1,38 @@
+import re
+
+# Token put on place of absent pattern group, sorts before any value
+ABSENT = (-1, 0, '')
+
+
+def natural_key(text):
+    '''Split text into runs of digits & other characters, so numbers are
+    compared as integers: '12.2(9)' sorts before '12.2(55)'
+    Args:
+        text - string to split
+    Return:
+        tuple of tokens comparable with each other
+    '''
+    return tuple((0, int(token), '') if token.isdigit() else (1, 0, token)
+                 for token in re.findall(r'\d+|\D+', text))
+
+
+def version_key(version, pattern=None):
+    '''Build sorting key for firmware version. With pattern (version_pattern
+    from device card) only values of pattern groups are compared in groups
+    order, absent group sorts before any value; otherwise whole version is
+    compared in natural order
+    Args:
+        version - firmware version string
+        pattern - regular expression with groups (DEFAULT - None)
+    Return:
+        tuple of tokens comparable with keys of other versions
+    '''
+    if pattern:
+        match = re.match(pattern, version)
+        if match and match.groups():
+            key = ()
+            for part in match.groups():
+                key += (ABSENT, ) if part is None else natural_key(part)
+                key += (ABSENT, )
+            return key
+    return natural_key(version)
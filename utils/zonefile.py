@@ -0,0 +1,272 @@
+import os.path
+import re
+import socket
+import logging
+import ipaddress
+from utils.wwmode_exception import WWModeException
+
+m_logger = logging.getLogger('wwmode_app.utils.zonefile')
+
+CLASSES = ('IN', 'CH', 'HS', 'CS')
+TTL_RE = re.compile(r'^(\d+[smhdw]?)+$', re.IGNORECASE)
+# Length of CNAME chain followed to find address, like resolver does
+MAX_ALIASES = 8
+
+
+class ZoneParseError(WWModeException):
+    '''Exception for zone file which can't be parsed'''
+    pass
+
+
+def tokenize(zone_file):
+    '''Split zone file into records, records continued with parentheses are
+    joined in one
+    Args:
+        zone_file - opened zone file
+    Yield:
+        tuple of flag that record starts with owner name & list of tokens
+    '''
+    tokens = []
+    with_owner = False
+    depth = 0
+    for line in zone_file:
+        if not depth:
+            with_owner = bool(line) and not line[0].isspace()
+        for quoted, comment, token in re.findall(
+                r'"((?:[^"\\]|\\.)*)"|(;.*)|([^\s()";]+|[()])', line):
+            if comment:
+                break
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif token:
+                tokens.append(token)
+            else:
+                tokens.append(quoted)
+        if depth <= 0 and tokens:
+            yield with_owner, tokens
+            tokens = []
+            depth = 0
+    if tokens:
+        yield with_owner, tokens
+
+
+def absolute_name(name, origin):
+    '''Make domain name from zone file absolute, without trailing dot
+    Args:
+        name - name as written in zone file
+        origin - current origin without trailing dot
+    Return:
+        lowercase domain name
+    '''
+    if name == '@':
+        return origin.lower()
+    if name.endswith('.'):
+        return name[:-1].lower()
+    return (name + '.' + origin if origin else name).lower()
+
+
+def parse_zone(path, origin=''):
+    '''Read records from zone file or zone transfer dump (dig AXFR output).
+    $ORIGIN, $TTL & $INCLUDE directives are supported
+    Args:
+        path - zone file name
+        origin - origin of zone if file doesn't set it (DEFAULT - '')
+    Yield:
+        tuples (owner name, record type, list of record data tokens)
+    '''
+    origin = origin.rstrip('.')
+    owner = origin
+    try:
+        zone_file = open(path, 'r', encoding='utf-8')
+    except OSError as exc:
+        m_logger.error('Zone file {} can not be read'.format(path))
+        raise ZoneParseError('Zone file {} can not be read: {}'.format(
+            path, exc))
+    with zone_file:
+        for with_owner, tokens in tokenize(zone_file):
+            if tokens[0].upper() == '$ORIGIN':
+                origin = absolute_name(tokens[1], origin)
+                continue
+            if tokens[0].upper() == '$TTL':
+                continue
+            if tokens[0].upper() == '$INCLUDE':
+                include = os.path.join(os.path.dirname(path), tokens[1])
+                yield from parse_zone(include, absolute_name(
+                    tokens[2], origin) if len(tokens) > 2 else origin)
+                continue
+            if with_owner:
+                owner = absolute_name(tokens.pop(0), origin)
+            while tokens and (tokens[0].upper() in CLASSES or
+                              TTL_RE.match(tokens[0])):
+                tokens.pop(0)
+            if not tokens:
+                m_logger.error('Record without type for {} in {}'.format(
+                    owner, path))
+                raise ZoneParseError('Record without type for {} in {}'.format(
+                    owner, path))
+            rtype = tokens[0].upper()
+            data = tokens[1:]
+            if rtype in ('PTR', 'CNAME', 'NS') and data:
+                data = [absolute_name(data[0], origin)]
+            yield owner, rtype, data
+
+
+def reverse_name(ip):
+    '''Get name of PTR record for IPv4 address
+    Args:
+        ip - string representation of IPv4 address
+    Return:
+        name in in-addr.arpa zone
+    '''
+    return '.'.join(reversed(ip.split('.'))) + '.in-addr.arpa'
+
+
+class ZoneData:
+    '''Records of domain zones loaded from zone files. Names inside of loaded
+    zones are answered from memory (including absent ones), other names
+    should be resolved by live lookup
+    instance attrs:
+        zones - set of zone names (SOA owners)
+        delegations - set of NS record owners of all loaded files
+        cuts - set of names delegated to other servers from loaded zones,
+            except zones loaded themselves
+        addresses - dictionary with domain name as key & list of IPv4
+            addresses as value
+        pointers - dictionary with name in in-addr.arpa zone as key & domain
+            name as value
+        aliases - dictionary with domain name as key & CNAME target as value
+    methods:
+        overloaded __init__
+        load
+        covers
+        follow_aliases
+        gethostbyaddr
+        gethostbyname
+    '''
+    def __init__(self):
+        '''Initialize empty storage
+        No args
+        Overloaded
+        '''
+        self.zones = set()
+        self.delegations = set()
+        self.cuts = set()
+        self.addresses = {}
+        self.pointers = {}
+        self.aliases = {}
+
+    def load(self, path, origin=''):
+        '''Add records from zone file. Zone name is taken from SOA record or
+        from origin if there is no SOA. Delegation cuts are computed again
+        with every file, so child zone can be loaded before or after parent
+        Args:
+            path - zone file name
+            origin - origin of zone if file doesn't set it (DEFAULT - '')
+        No return value
+        '''
+        zones = set()
+        delegations = set()
+        records = 0
+        for owner, rtype, data in parse_zone(path, origin):
+            records += 1
+            if rtype == 'SOA':
+                zones.add(owner)
+            elif rtype == 'NS':
+                delegations.add(owner)
+            elif rtype == 'A' and data:
+                try:
+                    ipaddress.IPv4Address(data[0])
+                except ValueError:
+                    m_logger.warning('Bad A record for {} in {}'.format(
+                        owner, path))
+                    continue
+                self.addresses.setdefault(owner, []).append(data[0])
+            elif rtype == 'PTR' and data:
+                self.pointers.setdefault(owner, data[0])
+            elif rtype == 'CNAME' and data:
+                self.aliases[owner] = data[0]
+        if not zones and origin:
+            zones.add(origin.rstrip('.').lower())
+        if not zones:
+            m_logger.error('No SOA record or origin for {}'.format(path))
+            raise ZoneParseError('No SOA record or origin for {}'.format(
+                path))
+        self.zones |= zones
+        self.delegations |= delegations
+        self.cuts = self.delegations - self.zones
+        m_logger.debug('{} records of {} loaded from {}'.format(
+            records, ', '.join(sorted(zones)), path))
+
+    def covers(self, name):
+        '''Check that answer for name can be found in loaded zones
+        Args:
+            name - domain name
+        Return:
+            True if name belongs to loaded zone & not delegated from it
+        '''
+        labels = name.rstrip('.').lower().split('.')
+        for num in range(len(labels)):
+            parent = '.'.join(labels[num:])
+            if parent in self.cuts:
+                return False
+            if parent in self.zones:
+                return True
+        return False
+
+    def follow_aliases(self, name):
+        '''Follow CNAME chain while it stays in loaded zones
+        Args:
+            name - domain name
+        Return:
+            lowercase name without trailing dot, where chain ends or leaves
+            loaded zones
+        '''
+        name = name.rstrip('.').lower()
+        for _ in range(MAX_ALIASES):
+            if name not in self.aliases or not self.covers(name):
+                break
+            name = self.aliases[name]
+        return name
+
+    def gethostbyaddr(self, ip):
+        '''Analog of socket.gethostbyaddr for covered addresses
+        Args:
+            ip - string representation of IPv4 address
+        Return:
+            tuple of host name, aliases & addresses
+        '''
+        name = self.pointers.get(reverse_name(ip))
+        if name is None:
+            raise socket.herror(1, 'Unknown host')
+        return name, [], [ip]
+
+    def gethostbyname(self, name):
+        '''Analog of socket.gethostbyname for covered names, CNAME chains are
+        followed inside of loaded zones
+        Args:
+            name - domain name
+        Return:
+            string representation of IPv4 address
+        '''
+        name = self.follow_aliases(name)
+        if name in self.addresses:
+            return self.addresses[name][0]
+        raise socket.gaierror(socket.EAI_NONAME,
+                              'Name or service not known')
+
+
+def load_zones(paths):
+    '''Load several zone files into one storage
+    Args:
+        paths - list of zone file names, name can be followed by origin after
+            colon, e.g. 'r1.local.zone:r1.local'
+    Return:
+        ZoneData instance
+    '''
+    zones = ZoneData()
+    for path in paths:
+        path, _, origin = path.partition(':')
+        zones.load(path, origin)
+    return zones